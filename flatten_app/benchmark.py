@@ -0,0 +1,257 @@
+# ベンチマーク（合成ツリーでスキャン・フラット名変換・フラット化コピー・ZIP化・復元の各段階を計測）
+#
+# 例:
+#   python -m flatten_app.benchmark --depth 3 --fanout 5 --files 20 --output bench.json
+#   python -m flatten_app.benchmark --output new.json --compare old.json
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+_here = os.path.dirname(os.path.abspath(__file__))
+if os.path.dirname(_here) not in sys.path:
+    sys.path.insert(0, os.path.dirname(_here))
+
+from flatten_app.flattener.logic import DirectoryScanner
+from flatten_app.flattener.namecodec import NameCodec
+from flatten_app.flattener.engine import FlattenEngine, RestoreEngine, DEFAULT_JOBS
+
+STAGES = ('scan', 'encode', 'decode', 'flatten', 'zip', 'restore')
+
+# ファイルサイズの分布: (重み, 最小バイト数, 最大バイト数) の列
+SIZE_DISTRIBUTIONS = {
+    'tiny': [(1, 0, 1024)],
+    'small': [(9, 0, 16 * 1024), (1, 16 * 1024, 256 * 1024)],
+    'mixed': [(80, 0, 16 * 1024), (18, 16 * 1024, 1024 * 1024), (2, 1024 * 1024, 8 * 1024 * 1024)],
+    'large': [(1, 4 * 1024 * 1024, 32 * 1024 * 1024)],
+}
+
+_JP_WORDS = ['資料', '報告書', '議事録', '設計', '見積', '契約', '写真', '図面', 'データ', '解析',
+             '実験', '測定', '試料', '結果', 'まとめ', '予算', '申請', '原稿', '発表', '会議']
+# フラット化の区切り（__）・エスケープ（___）と衝突する名前
+_COLLISION_NAMES = ['a__b', 'x___y', '__init__', 'end_', '_start', 'tri___', '___UNDERSCORE___']
+
+
+def _version() -> str:
+    path = os.path.join(os.path.dirname(_here), 'VERSION.txt')
+    try:
+        with open(path, encoding='utf-8') as f:
+            return f.readline().strip().lstrip('#').strip() or 'unknown'
+    except OSError:
+        return 'unknown'
+
+
+def _pick_size(rng: random.Random, dist) -> int:
+    weights = [w for w, _lo, _hi in dist]
+    _w, lo, hi = rng.choices(dist, weights=weights)[0]
+    return rng.randint(lo, hi)
+
+
+def _name(rng: random.Random, i: int, japanese: bool, collisions: bool) -> str:
+    if collisions and rng.random() < 0.15:
+        return f"{rng.choice(_COLLISION_NAMES)}{i}"
+    if japanese and rng.random() < 0.6:
+        return f"{rng.choice(_JP_WORDS)}_{i}"
+    return f"item{i}"
+
+
+def make_tree(root: str, *, depth: int = 3, fanout: int = 4, files: int = 8,
+              size_dist: str = 'small', japanese: bool = True, collisions: bool = True,
+              seed: int = 0) -> Dict:
+    """
+    合成ツリーを root に作り、{'files', 'dirs', 'bytes'} を返す
+    - depth: フォルダの深さ、fanout: 各フォルダのサブフォルダ数、files: 各フォルダのファイル数
+    - size_dist: ファイルサイズの分布（SIZE_DISTRIBUTIONS のキー）
+    - japanese: 日本語名を混ぜる、collisions: '__' / '___' を含む名前を混ぜる
+    同じ引数・seed なら同じツリーになる
+    """
+    rng = random.Random(seed)
+    dist = SIZE_DISTRIBUTIONS[size_dist]
+    exts = ['.txt', '.pdf', '.jpg', '.csv', '.dat', '.xlsx']
+    stats = {'files': 0, 'dirs': 0, 'bytes': 0}
+    block = bytes(range(256)) * 4096  # 1MB の書き込み用データ（圧縮が効きすぎないよう単純な0埋めにしない）
+    stack = [(root, 0)]
+    while stack:
+        folder, level = stack.pop()
+        os.makedirs(folder, exist_ok=True)
+        for i in range(files):
+            size = _pick_size(rng, dist)
+            path = os.path.join(folder, _name(rng, i, japanese, collisions) + rng.choice(exts))
+            with open(path, 'wb') as f:
+                remaining = size
+                while remaining > 0:
+                    n = min(remaining, len(block))
+                    f.write(block[:n])
+                    remaining -= n
+            stats['files'] += 1
+            stats['bytes'] += size
+        if level < depth:
+            for i in range(fanout):
+                stack.append((os.path.join(folder, _name(rng, i, japanese, collisions) + '_d'), level + 1))
+                stats['dirs'] += 1
+    return stats
+
+
+def _timed(fn: Callable[[], Dict], repeat: int, before: Optional[Callable[[], None]] = None) -> Dict:
+    """
+    fn を repeat 回実行し、最短時間の回の結果を返す（before は毎回の計測前の後片付け。計測に含めない）
+    """
+    best = None
+    for _ in range(max(1, repeat)):
+        if before:
+            before()
+        start = time.perf_counter()
+        info = fn() or {}
+        seconds = time.perf_counter() - start
+        if best is None or seconds < best['seconds']:
+            best = dict(info, seconds=seconds)
+    items, size = best.get('items'), best.get('bytes')
+    if items:
+        best['items_per_sec'] = items / best['seconds'] if best['seconds'] else None
+    if size:
+        best['mb_per_sec'] = size / (1024 * 1024) / best['seconds'] if best['seconds'] else None
+    return best
+
+
+def _reset(path: str):
+    shutil.rmtree(path, ignore_errors=True)
+
+
+def run_benchmark(workdir: str, *, stages=STAGES, repeat: int = 1, jobs: int = DEFAULT_JOBS,
+                  transfer: str = 'auto', log: Callable[[str], None] = lambda msg: None, **tree_options) -> Dict:
+    """
+    workdir に合成ツリーを作って各段階を計測し、結果（JSONにできるdict）を返す
+    """
+    src = os.path.join(workdir, 'src')
+    flat = os.path.join(workdir, 'flat')
+    zipped = os.path.join(workdir, 'zipped')
+    restored = os.path.join(workdir, 'restored')
+    _reset(src)
+    log(f"ツリー作成: {src}")
+    tree = make_tree(src, **tree_options)
+    log(f"  {tree['files']} ファイル / {tree['dirs']} フォルダ / {tree['bytes']:,} バイト")
+    results = {}
+    items = DirectoryScanner(src).scan()
+    relpaths = [r['relpath'] for r in items if not r['is_dir']]
+    codec = NameCodec(cache_size=0)
+    flat_names = codec.encode_many(relpaths)
+    top_dirs = sorted(r['relpath'] for r in items if r['is_dir'] and os.sep not in r['relpath'])
+
+    def scan():
+        result = DirectoryScanner(src).scan()
+        return {'items': len(result)}
+
+    def encode():
+        codec.encode_many(relpaths)
+        return {'items': len(relpaths)}
+
+    def decode():
+        codec.decode_many(flat_names)
+        return {'items': len(flat_names)}
+
+    def flatten():
+        FlattenEngine(src, flat, jobs=jobs, transfer=transfer).run()
+        return {'items': tree['files'], 'bytes': tree['bytes']}
+
+    def zip_stage():
+        result = FlattenEngine(src, zipped, zip_targets=top_dirs, jobs=jobs, transfer=transfer).run()
+        return {'items': result['zip_count'], 'bytes': tree['bytes']}
+
+    def restore():
+        count = RestoreEngine(flat, restored, jobs=jobs, transfer=transfer).run()
+        return {'items': count, 'bytes': tree['bytes']}
+
+    plan = [('scan', scan, None), ('encode', encode, None), ('decode', decode, None),
+            ('flatten', flatten, lambda: _reset(flat)), ('zip', zip_stage, lambda: _reset(zipped)),
+            ('restore', restore, lambda: _reset(restored))]
+    for name, fn, before in plan:
+        if name not in stages:
+            continue
+        if name == 'restore' and not os.path.isdir(flat):
+            flatten()  # 復元だけを計測する場合もフラット化先が必要
+        results[name] = _timed(fn, repeat, before)
+        log(f"{name:8s} {results[name]['seconds']:.3f} 秒")
+    failures = codec.verify_roundtrip(relpaths)
+    return {
+        'version': _version(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'params': dict(tree_options, repeat=repeat, jobs=jobs, transfer=transfer),
+        'tree': tree,
+        'roundtrip_failures': len(failures),
+        'stages': results,
+    }
+
+
+def compare(current: Dict, baseline: Dict) -> List[str]:
+    """
+    2つの結果の段階ごとの時間を比べた行のリストを返す（比 = 今回 / 比較元。1より大きければ遅くなった）
+    """
+    lines = []
+    for name, stage in current.get('stages', {}).items():
+        old = baseline.get('stages', {}).get(name)
+        if not old or not old.get('seconds'):
+            continue
+        ratio = stage['seconds'] / old['seconds']
+        lines.append(f"{name:8s} {old['seconds']:.3f} → {stage['seconds']:.3f} 秒（×{ratio:.2f}）")
+    return lines
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="flatten_app.benchmark", description="BJB-PathFlattener ベンチマーク")
+    parser.add_argument("--workdir", help="作業フォルダ（省略時は一時フォルダを作り、終了時に削除）")
+    parser.add_argument("--depth", type=int, default=3, help="フォルダの深さ（デフォルト: 3）")
+    parser.add_argument("--fanout", type=int, default=4, help="各フォルダのサブフォルダ数（デフォルト: 4）")
+    parser.add_argument("--files", type=int, default=8, help="各フォルダのファイル数（デフォルト: 8）")
+    parser.add_argument("--size-dist", choices=sorted(SIZE_DISTRIBUTIONS), default="small",
+                        help="ファイルサイズの分布（デフォルト: small）")
+    parser.add_argument("--no-japanese", dest="japanese", action="store_false", help="日本語名を使わない")
+    parser.add_argument("--no-collisions", dest="collisions", action="store_false",
+                        help="'__' / '___' を含む名前を使わない")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--stages", default=",".join(STAGES),
+                        help=f"計測する段階（カンマ区切り。デフォルト: {','.join(STAGES)}）")
+    parser.add_argument("--repeat", type=int, default=1, help="各段階を繰り返して最短時間を採る回数")
+    parser.add_argument("-j", "--jobs", type=int, default=DEFAULT_JOBS, metavar="N")
+    parser.add_argument("--transfer", default="auto", help="ファイル転送方式（transfer.py 参照）")
+    parser.add_argument("--output", metavar="JSON", help="結果をJSONで保存するパス")
+    parser.add_argument("--compare", metavar="JSON", help="以前の結果と比べて表示する")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    stages = [s.strip() for s in args.stages.split(',') if s.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        build_parser().error(f"未知の段階: {', '.join(sorted(unknown))}")
+    workdir = args.workdir or tempfile.mkdtemp(prefix="flatten_bench_")
+    try:
+        result = run_benchmark(workdir, stages=stages, repeat=args.repeat, jobs=args.jobs,
+                               transfer=args.transfer, log=print,
+                               depth=args.depth, fanout=args.fanout, files=args.files,
+                               size_dist=args.size_dist, japanese=args.japanese,
+                               collisions=args.collisions, seed=args.seed)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"結果を保存: {args.output}")
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            for line in compare(result, json.load(f)):
+                print(line)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
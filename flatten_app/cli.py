@@ -0,0 +1,252 @@
+# コマンドラインインターフェース（GUI/Tkinterに依存しない）
+#
+# 例:
+#   python -m flatten_app.main --cli flatten 入力フォルダ 出力フォルダ --zip-ext .pdf
+#   python -m flatten_app.main --cli restore フラット化フォルダ 復元先フォルダ --method filemap
+#   python -m flatten_app.main --cli verify 復元先フォルダ --filemap フラット化フォルダ/filemap.csv
+#   python -m flatten_app.main --cli convert-filemap フラット化フォルダ/filemap.db filemap.csv
+import argparse
+import os
+import sys
+from typing import List, Optional
+
+_here = os.path.dirname(os.path.abspath(__file__))
+if os.path.dirname(_here) not in sys.path:
+    sys.path.insert(0, os.path.dirname(_here))
+
+from flatten_app.flattener.engine import (FlattenEngine, RestoreEngine, VerifyEngine, auto_zip_targets,
+                                          check_separate_dirs, DEFAULT_JOBS)
+from flatten_app.flattener.zipper import DEFAULT_ZIP_JOBS, DEFAULT_COMPRESSLEVEL, STORE_EXTS
+from flatten_app.flattener.transfer import TRANSFER_METHODS
+from flatten_app.flattener.dedup import DEDUP_MODES
+from flatten_app.flattener.filemap import FileMap, FILEMAP_FORMATS
+from flatten_app.flattener.instrument import Instrument
+from flatten_app.flattener.scheduler import IO_MODES, DEFAULT_META_JOBS
+
+
+def _make_logger(quiet: bool):
+    def log(msg: str):
+        if quiet:
+            return
+        print(msg, flush=True)
+    return log
+
+
+def _add_transfer_option(p: argparse.ArgumentParser):
+    p.add_argument("--transfer", choices=TRANSFER_METHODS, default="auto",
+                   help="ファイル転送方式（auto: reflink/カーネル内コピーを自動選択、hardlink: 同一ボリュームでハードリンク）")
+
+
+def _add_io_options(p: argparse.ArgumentParser):
+    p.add_argument("--io-mode", choices=IO_MODES, default="threads",
+                   help="並列実行の方式（asyncio: 小さなファイル・フォルダ作成と大きなファイルを別々の上限で並列化。"
+                        "SMB/NFSなど待ち時間の長いネットワーク共有向け）")
+    p.add_argument("--meta-jobs", type=int, default=DEFAULT_META_JOBS, metavar="N",
+                   help=f"--io-mode asyncio 時の小さなファイル・フォルダ作成の同時実行数（デフォルト: {DEFAULT_META_JOBS}。"
+                        "大きなファイルは -j の数）")
+
+
+def _add_instrument_options(p: argparse.ArgumentParser):
+    p.add_argument("--report", metavar="JSON",
+                   help="段階ごとの時間・ファイルごとの処理時間の分布・スループット・操作/エラー件数をJSONで保存する")
+    p.add_argument("--profile", metavar="PATH",
+                   help="実行中の処理（ワーカースレッドを含む）を cProfile で計測し、pstats 形式で保存する")
+
+
+def _make_instrument(args) -> Instrument:
+    return Instrument(profile=bool(args.profile))
+
+
+def _save_instrument(args, instrument: Instrument, extra: dict):
+    if args.report:
+        instrument.write_report(args.report, dict(extra, command=args.command))
+        print(f"計測レポート: {args.report}")
+    if args.profile and instrument.dump_profile(args.profile):
+        print(f"プロファイル: {args.profile}（python -m pstats {args.profile} で確認）")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="flatten_app --cli",
+        description="ファイルフラット化・復元ツール（CLIモード）"
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_flat = sub.add_parser("flatten", help="フォルダ階層をフラット化してコピー")
+    p_flat.add_argument("src", help="入力フォルダ")
+    p_flat.add_argument("dst", help="出力フォルダ")
+    p_flat.add_argument("--zip", dest="zip_targets", action="append", default=[], metavar="RELPATH",
+                        help="ZIP化するフォルダ（入力フォルダからの相対パス、複数指定可）")
+    p_flat.add_argument("--zip-ext", dest="zip_exts", action="append", default=[], metavar="EXT",
+                        help="この拡張子のファイルを含むフォルダを自動でZIP化（複数指定可）")
+    p_flat.add_argument("--exclude", dest="exclude_targets", action="append", default=[], metavar="RELPATH",
+                        help="除外するファイル・フォルダ（相対パス、複数指定可）")
+    p_flat.add_argument("--exclude-ext", dest="exclude_exts", action="append", default=[], metavar="EXT",
+                        help="除外する拡張子（複数指定可）。'*.bak' のようなglobはファイル名、'cache/' のように / で終わる指定はフォルダ名で除外")
+    p_flat.add_argument("-j", "--jobs", type=int, default=DEFAULT_JOBS, metavar="N",
+                        help=f"並列コピー数（デフォルト: {DEFAULT_JOBS}、1で逐次コピー）")
+    p_flat.add_argument("--zip-jobs", type=int, default=DEFAULT_ZIP_JOBS, metavar="N",
+                        help=f"並列に作成するZIPの数（デフォルト: {DEFAULT_ZIP_JOBS}）")
+    p_flat.add_argument("--zip-level", type=int, default=DEFAULT_COMPRESSLEVEL, choices=range(0, 10), metavar="0-9",
+                        help=f"ZIPの圧縮レベル（0で無圧縮、デフォルト: {DEFAULT_COMPRESSLEVEL}）")
+    p_flat.add_argument("--zip-store-ext", dest="zip_store_exts", action="append", default=[], metavar="EXT",
+                        help="無圧縮で格納する拡張子を追加（.jpg/.tif など圧縮済み形式は既定で無圧縮）")
+    p_flat.add_argument("--zip-threads", action="store_true",
+                        help="ZIP化をプロセスではなくスレッドで並列化する")
+    p_flat.add_argument("--incremental", action="store_true",
+                        help="出力先の既存filemap.csvと比較し、新規・変更ファイルだけコピーする")
+    p_flat.add_argument("--checksum", action="store_true",
+                        help="差分判定でサイズ・更新時刻に加えて内容のハッシュも比較する（--incremental 時）")
+    p_flat.add_argument("--prune", action="store_true",
+                        help="入力に存在しなくなったフラット化ファイルを出力先から削除する（--incremental 時）")
+    _add_transfer_option(p_flat)
+    _add_io_options(p_flat)
+    p_flat.add_argument("--dedup", choices=DEDUP_MODES, default="off",
+                        help="内容が同じファイルを1つだけ出力する（link: 2つ目以降は実体へのハードリンク、"
+                             "record: 2つ目以降は出力せずfilemapに実体を記録。復元時に複製）")
+    p_flat.add_argument("--verify", action="store_true",
+                        help="コピーと同じ読み込みで内容のsha256を計算し、filemapに記録する（verify コマンドで検証）")
+    p_flat.add_argument("--filemap-format", choices=FILEMAP_FORMATS, default="csv",
+                        help="filemapの形式（csv: filemap.csv / sqlite: 索引付きの filemap.db。"
+                             "数百万ファイル規模の差分フラット化・復元向け）")
+    _add_instrument_options(p_flat)
+    p_flat.add_argument("-q", "--quiet", action="store_true", help="ファイルごとのログを出力しない")
+
+    p_rest = sub.add_parser("restore", help="フラット化済みフォルダから元の階層を復元")
+    p_rest.add_argument("src", help="フラット化済みフォルダ（filemap.csvを含む）")
+    p_rest.add_argument("dst", help="復元先フォルダ")
+    p_rest.add_argument("--method", choices=["filemap", "filename"], default="filemap",
+                        help="復元方式（filemap優先 / ファイル名推測）")
+    p_rest.add_argument("--no-unzip", dest="unzip", action="store_false",
+                        help="ZIPファイルを展開せずにコピーする")
+    p_rest.add_argument("-j", "--jobs", type=int, default=DEFAULT_JOBS, metavar="N",
+                        help=f"並列に実行するコピー・ZIP展開の数（デフォルト: {DEFAULT_JOBS}）")
+    _add_transfer_option(p_rest)
+    _add_io_options(p_rest)
+    _add_instrument_options(p_rest)
+    p_rest.add_argument("-q", "--quiet", action="store_true", help="ファイルごとのログを出力しない")
+
+    p_ver = sub.add_parser("verify", help="filemapのサイズ・ハッシュでフラット化先/復元先を検証")
+    p_ver.add_argument("root", help="検証するフォルダ（フラット化先または復元先）")
+    p_ver.add_argument("--filemap", metavar="PATH",
+                       help="filemap のパス（省略時は 検証するフォルダ/filemap.db または filemap.csv。"
+                            "復元先の検証では必須）")
+    p_ver.add_argument("--restored", action="store_true",
+                       help="復元先フォルダとして検証する（元パスのファイルを確認）")
+    p_ver.add_argument("-j", "--jobs", type=int, default=DEFAULT_JOBS, metavar="N",
+                       help=f"並列に検証するファイル数（デフォルト: {DEFAULT_JOBS}）")
+    _add_instrument_options(p_ver)
+    p_ver.add_argument("-q", "--quiet", action="store_true", help="問題のあったファイル以外のログを出力しない")
+
+    p_conv = sub.add_parser("convert-filemap", help="filemapの形式を変換（.csv / .json / .db）")
+    p_conv.add_argument("src", help="変換元のfilemap")
+    p_conv.add_argument("dst", help="変換先のfilemap（拡張子で形式を決める）")
+    return parser
+
+
+def _check_dirs(parser: argparse.ArgumentParser, src: str, dst: str, create_dst: bool = True):
+    if not os.path.isdir(src):
+        parser.error(f"入力フォルダが存在しません: {src}")
+    try:
+        check_separate_dirs(src, dst)
+    except ValueError as e:
+        parser.error(str(e))
+    if create_dst:
+        os.makedirs(dst, exist_ok=True)
+    if not os.path.isdir(dst):
+        parser.error(f"出力フォルダが存在しません: {dst}")
+
+
+def run_flatten(args) -> int:
+    log = _make_logger(args.quiet)
+    instrument = _make_instrument(args)
+    engine = FlattenEngine(
+        args.src, args.dst,
+        zip_targets=[os.path.normpath(z) for z in args.zip_targets],
+        exclude_targets=[os.path.normpath(e) for e in args.exclude_targets],
+        exclude_exts=args.exclude_exts,
+        jobs=args.jobs,
+        incremental=args.incremental,
+        checksum=args.checksum,
+        prune=args.prune,
+        zip_jobs=args.zip_jobs,
+        zip_options={
+            'executor': 'thread' if args.zip_threads else 'process',
+            'compresslevel': args.zip_level,
+            'store_exts': STORE_EXTS | {'.' + e.lstrip('.').lower() for e in args.zip_store_exts},
+        },
+        transfer=args.transfer,
+        dedup=args.dedup,
+        verify=args.verify,
+        filemap_format=args.filemap_format,
+        io_mode=args.io_mode,
+        meta_jobs=args.meta_jobs,
+        instrument=instrument,
+        log=log,
+    )
+    items = instrument.profile_call(engine.scan, True)
+    engine.zip_targets |= auto_zip_targets(items, args.zip_exts)
+    result = instrument.profile_call(engine.run, items)
+    _save_instrument(args, instrument, {'result': result, 'jobs': args.jobs, 'transfer': args.transfer,
+                                        'io_mode': args.io_mode})
+    print(f"完了: {result['count']} ファイル / ZIP {result['zip_count']} 件"
+          f"（変更なし {result['unchanged']} 件・重複 {result['deduped']} 件） → {result['filemap_path']}")
+    return 0
+
+
+def run_restore(args) -> int:
+    log = _make_logger(args.quiet)
+    instrument = _make_instrument(args)
+    engine = RestoreEngine(args.src, args.dst, method=args.method, unzip=args.unzip, jobs=args.jobs,
+                           transfer=args.transfer, io_mode=args.io_mode, meta_jobs=args.meta_jobs,
+                           instrument=instrument, log=log)
+    count = instrument.profile_call(engine.run)
+    _save_instrument(args, instrument, {'result': {'count': count}, 'jobs': args.jobs, 'transfer': args.transfer,
+                                        'io_mode': args.io_mode})
+    print(f"復元完了: {count} ファイル/ZIP → {args.dst}")
+    return 0
+
+
+def run_verify(args) -> int:
+    log = _make_logger(args.quiet)
+    instrument = _make_instrument(args)
+    engine = VerifyEngine(args.root, args.filemap, target='restored' if args.restored else 'flat',
+                          jobs=args.jobs, instrument=instrument, log=log)
+    result = instrument.profile_call(engine.run)
+    _save_instrument(args, instrument, {'result': {k: v for k, v in result.items() if k != 'problems'},
+                                        'jobs': args.jobs})
+    if args.quiet:
+        for status, detail in result['problems']:
+            print(f"{'欠落' if status == 'missing' else '不一致'}: {detail}")
+    print(f"検証: {result['checked']} 件（一致 {result['ok']}・ハッシュ未記録 {result['unverified']}・"
+          f"欠落 {result['missing']}・不一致 {result['mismatch']}）")
+    return 1 if result['problems'] else 0
+
+
+def run_convert_filemap(args) -> int:
+    count = FileMap.convert(args.src, args.dst)
+    print(f"変換完了: {count} 行 → {args.dst}")
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == "convert-filemap":
+        if not os.path.isfile(args.src):
+            parser.error(f"filemapが存在しません: {args.src}")
+        return run_convert_filemap(args)
+    if args.command == "verify":
+        if not os.path.isdir(args.root):
+            parser.error(f"検証するフォルダが存在しません: {args.root}")
+        if args.restored and not args.filemap:
+            parser.error("復元先の検証には --filemap でフラット化先の filemap.csv を指定してください")
+        return run_verify(args)
+    _check_dirs(parser, args.src, args.dst)
+    if args.command == "flatten":
+        return run_flatten(args)
+    return run_restore(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+# フォルダごとの合計サイズ・ファイル数・最新更新時刻の集計
+import os
+from array import array
+from typing import Dict, Iterable, List, Optional
+
+from .scanresult import ScanResult
+
+_NO_MTIME = float('-inf')
+
+
+class DirectoryAggregate:
+    """
+    スキャン結果のフォルダに整数IDを振り、サブツリーの合計を配列で集計する
+    - ID 0 はルート（相対パス ""）。親フォルダのIDは必ず子フォルダより小さい
+    - ファイルは直属のフォルダにだけ加算し、最後にIDの大きい順（子→親）に1回ずつ親へ足し込む
+      （ファイルごとに祖先をたどる処理が不要で、集計は ファイル数 + フォルダ数 に比例する）
+    - 配列は array モジュール（NumPyに依存しない）
+    """
+    def __init__(self, items: Optional[Iterable[Dict]] = None):
+        self.ids: Dict[str, int] = {"": 0}
+        self.paths: List[str] = [""]
+        self.parent = array('q', [-1])
+        self.file_count = array('q', [0])     # 直下のファイル数
+        self.total_count = array('q', [0])    # サブツリー内のファイル数
+        self.total_size = array('q', [0])     # サブツリー内の合計サイズ
+        self.latest_mtime = array('d', [_NO_MTIME])
+        self._aggregated = False
+        if items is not None:
+            self.add_all(items)
+            self.aggregate()
+
+    def dir_id(self, relpath: str) -> int:
+        """
+        フォルダのIDを返す（未登録なら祖先から順に登録する）
+        """
+        i = self.ids.get(relpath)
+        if i is None:
+            parent = self.dir_id(os.path.dirname(relpath))
+            i = len(self.paths)
+            self.ids[relpath] = i
+            self.paths.append(relpath)
+            self.parent.append(parent)
+            self.file_count.append(0)
+            self.total_count.append(0)
+            self.total_size.append(0)
+            self.latest_mtime.append(_NO_MTIME)
+        return i
+
+    def add(self, item: Dict) -> int:
+        """
+        スキャン結果の1要素を追加し、ファイルなら直属フォルダのIDを返す（フォルダならそのID）
+        aggregate() の後には追加できない
+        """
+        if self._aggregated:
+            raise RuntimeError("集計済みのDirectoryAggregateには追加できません")
+        if item.get('is_dir'):
+            return self.dir_id(item['relpath'])
+        d = self.dir_id(os.path.dirname(item['relpath']))
+        self.file_count[d] += 1
+        self.total_count[d] += 1
+        size = item.get('size')
+        if isinstance(size, int) and size >= 0:
+            self.total_size[d] += size
+        mtime = item.get('mtime')
+        if mtime is not None and mtime > self.latest_mtime[d]:
+            self.latest_mtime[d] = mtime
+        return d
+
+    def add_all(self, items: Iterable[Dict]):
+        """
+        スキャン結果をまとめて追加する（add() と同じ結果になる高速版）
+        スキャン結果は同じフォルダのファイルが連続するので、フォルダが変わるまでローカル変数で集計する
+        """
+        if self._aggregated:
+            raise RuntimeError("集計済みのDirectoryAggregateには追加できません")
+        if isinstance(items, ScanResult) and len(self.paths) == 1:
+            self._add_scan_result(items)
+            return
+        dir_id = self.dir_id
+        sep = os.sep
+        last_dir, d = None, 0
+        count, size_sum, mtime_max = 0, 0, _NO_MTIME
+        for item in items:
+            relpath = item['relpath']
+            if item['is_dir']:
+                dir_id(relpath)
+                continue
+            parent = relpath.rpartition(sep)[0]
+            if parent != last_dir:
+                # フォルダが変わったところで、直前のフォルダの分をまとめて配列へ書き込む
+                self._add_to(d, count, size_sum, mtime_max)
+                count, size_sum, mtime_max = 0, 0, _NO_MTIME
+                d = dir_id(parent)
+                last_dir = parent
+            count += 1
+            size = item.get('size')
+            if size is not None and size > 0:
+                size_sum += size
+            mtime = item.get('mtime')
+            if mtime is not None and mtime > mtime_max:
+                mtime_max = mtime
+        self._add_to(d, count, size_sum, mtime_max)
+
+    def _add_scan_result(self, result: ScanResult):
+        """
+        ScanResult の列から直接集計する（フォルダIDは ScanResult のフォルダ表と同じになる）
+        """
+        self.paths = list(result.dirs)
+        self.ids = dict(result.dir_ids)
+        self.parent = array('q', result.dir_parent)
+        n = len(self.paths)
+        self.file_count = array('q', [0]) * n
+        self.total_count = array('q', [0]) * n
+        self.total_size = array('q', [0]) * n
+        self.latest_mtime = array('d', [_NO_MTIME]) * n
+        last, count, size_sum, mtime_max = 0, 0, 0, _NO_MTIME
+        for d, size, mtime, is_dir in zip(result.parent, result.sizes, result.mtimes, result.is_dir):
+            if is_dir:
+                continue
+            if d != last:
+                self._add_to(last, count, size_sum, mtime_max)
+                last, count, size_sum, mtime_max = d, 0, 0, _NO_MTIME
+            count += 1
+            if size > 0:
+                size_sum += size
+            # 更新時刻が取れなかった要素は NaN なので比較で除外される
+            if mtime > mtime_max:
+                mtime_max = mtime
+        self._add_to(last, count, size_sum, mtime_max)
+
+    def _add_to(self, d: int, count: int, size: int, mtime: float):
+        if count:
+            self.file_count[d] += count
+            self.total_count[d] += count
+            self.total_size[d] += size
+            if mtime > self.latest_mtime[d]:
+                self.latest_mtime[d] = mtime
+
+    def aggregate(self):
+        """
+        直下の値をサブツリーの合計にする（子→親の順に1回だけ足し込む）
+        """
+        if self._aggregated:
+            return
+        parent = self.parent
+        count, size, mtime = self.total_count, self.total_size, self.latest_mtime
+        for d in range(len(self.paths) - 1, 0, -1):
+            p = parent[d]
+            count[p] += count[d]
+            size[p] += size[d]
+            if mtime[d] > mtime[p]:
+                mtime[p] = mtime[d]
+        self._aggregated = True
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def __contains__(self, relpath: str) -> bool:
+        return relpath in self.ids
+
+    def size_of(self, relpath: str) -> int:
+        i = self.ids.get(relpath)
+        return self.total_size[i] if i is not None else 0
+
+    def count_of(self, relpath: str) -> int:
+        i = self.ids.get(relpath)
+        return self.total_count[i] if i is not None else 0
+
+    def files_in(self, relpath: str) -> int:
+        i = self.ids.get(relpath)
+        return self.file_count[i] if i is not None else 0
+
+    def mtime_of(self, relpath: str) -> Optional[float]:
+        i = self.ids.get(relpath)
+        if i is None or self.latest_mtime[i] == _NO_MTIME:
+            return None
+        return self.latest_mtime[i]
@@ -0,0 +1,156 @@
+# チャンク単位のファイルコピー・ハッシュ計算（再利用するバッファ・適応的なチャンクサイズ・ファイル内の進捗）
+import hashlib
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+# チャンクサイズ（1回の readinto / write のバイト数）の範囲と初期値
+MIN_CHUNK_SIZE = 256 * 1024
+MAX_CHUNK_SIZE = 16 * 1024 * 1024
+INITIAL_CHUNK_SIZE = 1024 * 1024
+# 1チャンクの読み書きに掛ける時間の目安（短すぎればチャンクを倍に、長すぎれば半分にする。
+# 長すぎるとファイル内の進捗の更新間隔が開き、短すぎるとシステムコールの回数が増える）
+CHUNK_TARGET_SECONDS = 0.05
+# この大きさ以上のファイルは範囲に分け、複数スレッドで並列に読み書きする
+PARALLEL_COPY_MIN_SIZE = 1024 * 1024 * 1024
+DEFAULT_RANGE_JOBS = 4
+# 分割する範囲の境界（チャンク境界に揃える）
+RANGE_ALIGN = 1024 * 1024
+
+_local = threading.local()
+
+
+def get_buffer(size: int) -> memoryview:
+    """
+    このスレッドで再利用するバッファ（size バイト以上）の memoryview を返す
+    ファイルごとに bytearray を確保しない。大きなチャンクが必要になったときだけ作り直す
+    （大きくしたバッファはファイルの読み書きが終わったら release_large_buffer() で手放す）
+    """
+    view = getattr(_local, 'view', None)
+    if view is None or len(view) < size:
+        view = _local.view = memoryview(bytearray(max(size, MIN_CHUNK_SIZE)))
+    return view
+
+
+def release_large_buffer():
+    """
+    このスレッドのバッファが INITIAL_CHUNK_SIZE より大きければ手放す
+    （大きなファイルで最大 MAX_CHUNK_SIZE まで広げたバッファを、ワーカースレッドごとに持ち続けないため）
+    """
+    view = getattr(_local, 'view', None)
+    if view is not None and len(view) > INITIAL_CHUNK_SIZE:
+        del _local.view
+
+
+class AdaptiveChunk:
+    """
+    読み書きに掛かった時間からチャンクサイズを調整する
+    （速いストレージでは大きなチャンクでシステムコールを減らし、遅いストレージでは小さくして進捗を細かく出す）
+    """
+    def __init__(self, initial: int = INITIAL_CHUNK_SIZE, minimum: int = MIN_CHUNK_SIZE,
+                 maximum: int = MAX_CHUNK_SIZE, target: float = CHUNK_TARGET_SECONDS):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target = target
+        self.size = min(max(initial, minimum), maximum)
+
+    def update(self, nbytes: int, seconds: float):
+        if nbytes < self.size:
+            return  # ファイル末尾の短い読み込みは判断に使わない
+        if seconds < self.target / 2 and self.size < self.maximum:
+            self.size = min(self.size * 2, self.maximum)
+        elif seconds > self.target * 2 and self.size > self.minimum:
+            self.size = max(self.size // 2, self.minimum)
+
+
+def _write_all(f, view: memoryview):
+    # バッファなしのファイルへの write は一部だけ書いて返ることがある
+    while view:
+        n = f.write(view)
+        view = view[n:]
+
+
+def _copy_stream(fsrc, fdst, limit: Optional[int], hasher, progress: Optional[Callable[[int], None]]) -> int:
+    """
+    fsrc の現在位置から limit バイト（None なら末尾まで）を fdst へ書き出し、コピーしたバイト数を返す
+    """
+    chunk = AdaptiveChunk()
+    total = 0
+    try:
+        while limit is None or total < limit:
+            want = chunk.size if limit is None else min(chunk.size, limit - total)
+            view = get_buffer(want)[:want]
+            start = time.perf_counter()
+            n = fsrc.readinto(view)
+            if not n:
+                break
+            data = view[:n]
+            if hasher is not None:
+                hasher.update(data)
+            if fdst is not None:
+                _write_all(fdst, data)
+            chunk.update(n, time.perf_counter() - start)
+            total += n
+            if progress is not None:
+                progress(n)
+    finally:
+        release_large_buffer()
+    return total
+
+
+def _copy_range(src: str, dst: str, start: int, end: int, progress):
+    # 範囲ごとに入出力を開き直す（ファイル位置を共有しないので、並列に seek・書き込みできる）
+    with open(src, 'rb', buffering=0) as fsrc, open(dst, 'r+b', buffering=0) as fdst:
+        fsrc.seek(start)
+        fdst.seek(start)
+        return _copy_stream(fsrc, fdst, end - start, None, progress)
+
+
+def chunked_copy(src: str, dst: str, *,
+                 progress: Optional[Callable[[int], None]] = None,
+                 hasher=None,
+                 range_jobs: int = DEFAULT_RANGE_JOBS,
+                 parallel_min_size: int = PARALLEL_COPY_MIN_SIZE) -> int:
+    """
+    src を dst へチャンク単位でコピーし（更新時刻などは shutil.copystat で引き継ぐ）、コピーしたバイト数を返す
+    - progress(n): チャンクを書き出すたびに、そのバイト数で呼ばれる（ファイル内の進捗。並列時も1スレッドずつ）
+    - hasher: hashlib のハッシュオブジェクト。渡すと同じ読み込みで内容のハッシュを計算する（並列化しない）
+    - parallel_min_size 以上のファイルは range_jobs 個の範囲に分けて並列にコピーする
+      （出力ファイルを先に全体の大きさにしておき、各範囲を別々のハンドルで書き込む）
+    """
+    size = os.stat(src).st_size
+    if hasher is not None or range_jobs <= 1 or size < parallel_min_size:
+        with open(src, 'rb', buffering=0) as fsrc, open(dst, 'wb', buffering=0) as fdst:
+            total = _copy_stream(fsrc, fdst, None, hasher, progress)
+    else:
+        with open(dst, 'wb') as fdst:
+            fdst.truncate(size)
+        step = -(-size // range_jobs)
+        step = -(-step // RANGE_ALIGN) * RANGE_ALIGN
+        ranges = [(start, min(start + step, size)) for start in range(0, size, step)]
+        if progress is not None:
+            lock = threading.Lock()
+            report = progress
+
+            def progress(n):
+                with lock:
+                    report(n)
+        with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+            futures = [executor.submit(_copy_range, src, dst, start, end, progress) for start, end in ranges]
+            total = sum(f.result() for f in futures)
+    shutil.copystat(src, dst)
+    return total
+
+
+def read_digest(path: str, algorithm: str = 'sha256', limit: Optional[int] = None,
+                progress: Optional[Callable[[int], None]] = None) -> str:
+    """
+    ファイル内容（limit を指定すると先頭 limit バイト）のハッシュ値（16進文字列）を計算する
+    """
+    h = hashlib.new(algorithm)
+    with open(path, 'rb', buffering=0) as f:
+        _copy_stream(f, None, limit, h, progress)
+    return h.hexdigest()
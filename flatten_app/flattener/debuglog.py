@@ -0,0 +1,73 @@
+# デバッグ出力と起動時間の記録（明示的に有効にしたときだけ、ユーザーのホーム配下へ書き出す）
+import os
+import threading
+import time
+from typing import Optional
+
+# 設定・ログの保存先（実行ファイルの隣には何も書かない。PyInstallerバイナリは読み取り専用の場所に置かれることがある）
+APP_DIR = os.path.join(os.path.expanduser("~"), ".bjb_pathflattener")
+LOG_DIR = os.path.join(APP_DIR, "logs")
+DEBUG_LOG_PATH = os.path.join(LOG_DIR, "debug.log")
+# この環境変数が空でなければ --debug と同じ扱い
+DEBUG_ENV = "BJB_PATHFLATTENER_DEBUG"
+# 起動（プロセス開始〜ウィンドウ表示）の目標時間。超えたらデバッグログに警告を残す
+STARTUP_BUDGET_MS = 1000
+
+_lock = threading.Lock()
+_path: Optional[str] = None
+
+
+def env_enabled() -> bool:
+    return bool(os.environ.get(DEBUG_ENV, "").strip())
+
+
+def enable(path: Optional[str] = None) -> str:
+    """
+    デバッグ出力を有効にして、書き出し先のパスを返す（省略時は DEBUG_LOG_PATH）
+    """
+    global _path
+    path = path or DEBUG_LOG_PATH
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with _lock:
+        _path = path
+    return path
+
+
+def disable():
+    global _path
+    with _lock:
+        _path = None
+
+
+def is_enabled() -> bool:
+    return _path is not None
+
+
+def debug(msg: str):
+    """
+    有効なときだけ1行追記する（無効なら何もしない。書き込みに失敗しても処理は止めない）
+    GUIのバイナリでは stdout が無いことがあるので print は使わない
+    """
+    if _path is None:
+        return
+    line = f"{time.strftime('%Y-%m-%d %H:%M:%S')} {msg}\n"
+    with _lock:
+        if _path is None:
+            return
+        try:
+            with open(_path, 'a', encoding='utf-8') as f:
+                f.write(line)
+        except OSError:
+            pass
+
+
+def record_startup(started: float, label: str = "起動", budget_ms: int = STARTUP_BUDGET_MS) -> float:
+    """
+    started（time.perf_counter() の値）からの経過ミリ秒を返し、デバッグログに記録する（目標超過なら警告）
+    """
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    if elapsed_ms > budget_ms:
+        debug(f"[警告] {label}: {elapsed_ms:.0f} ms（目標 {budget_ms} ms を超過）")
+    else:
+        debug(f"{label}: {elapsed_ms:.0f} ms（目標 {budget_ms} ms）")
+    return elapsed_ms
@@ -0,0 +1,83 @@
+# 内容が同じファイルの検出（重複排除フラット化用）
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from .chunkcopy import read_digest
+
+# 先頭だけのハッシュで候補を絞り込むときに読むバイト数
+PARTIAL_HASH_SIZE = 64 * 1024
+
+# 重複排除モード
+# - off:    重複排除しない
+# - link:   2つ目以降の同一内容ファイルを1つ目の出力へのハードリンクにする（リンクできなければ記録のみ）
+# - record: 2つ目以降は出力せず、filemap の content_of 列に実体のフラット名を記録する（復元時に複製）
+DEDUP_MODES = ('off', 'link', 'record')
+
+
+def file_digest(path: str, algorithm: str = 'sha256', limit: Optional[int] = None) -> str:
+    """
+    ファイル内容のハッシュ値（16進文字列）をチャンク単位で計算する
+    limit を指定すると先頭 limit バイトだけを対象にする
+    （バッファはスレッドごとに再利用し、チャンクサイズは読み込み速度に合わせて調整する。chunkcopy.py参照）
+    """
+    return read_digest(path, algorithm, limit)
+
+
+def _regroup(groups: List[List[Tuple[int, str, int]]], key_of: Callable, jobs: int,
+             log: Callable[[str], None]) -> List[List[Tuple[int, str, int]]]:
+    """
+    各グループのファイルを key_of(path, size) の値で並列に分け直し、2件以上のグループだけを返す
+    読めなかったファイルは重複排除の対象から外す
+    """
+    files = [f for g in groups for f in g]
+    if not files:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        keys = list(executor.map(lambda f: _safe_key(key_of, f, log), files))
+    regrouped = defaultdict(list)
+    for f, key in zip(files, keys):
+        if key is not None:
+            regrouped[(f[2], key)].append(f)
+    return [g for g in regrouped.values() if len(g) > 1]
+
+
+def _safe_key(key_of: Callable, f: Tuple[int, str, int], log: Callable[[str], None]):
+    try:
+        return key_of(f[1], f[2])
+    except OSError as e:
+        log(f"重複確認エラー（通常どおりコピーします）: {f[1]}: {e}")
+        return None
+
+
+def find_duplicates(files: Iterable[Tuple[int, str, int]], *,
+                    jobs: int = 8,
+                    algorithm: str = 'sha256',
+                    partial_size: int = PARTIAL_HASH_SIZE,
+                    min_size: int = 1,
+                    log: Optional[Callable[[str], None]] = None) -> Dict[int, int]:
+    """
+    内容が同じファイルを探し、{重複ファイルのキー: 同じ内容の最初のファイルのキー} を返す
+    files: (キー, パス, サイズ) の列。キーの小さいものを「最初のファイル」とする
+    1. サイズでグループ化（サイズが1つしかないファイルは読まない）
+    2. 先頭 partial_size バイトのハッシュで絞り込み
+    3. 残った候補だけ全体のハッシュを計算（partial_size 以下のファイルは2で確定）
+    ハッシュ計算は jobs 並列で行う
+    """
+    log = log or (lambda msg: None)
+    by_size = defaultdict(list)
+    for key, path, size in files:
+        if isinstance(size, int) and size >= min_size:
+            by_size[size].append((key, path, size))
+    groups = [g for g in by_size.values() if len(g) > 1]
+    groups = _regroup(groups, lambda p, s: file_digest(p, algorithm, partial_size), jobs, log)
+    small = [g for g in groups if g[0][2] <= partial_size]
+    large = [g for g in groups if g[0][2] > partial_size]
+    groups = small + _regroup(large, lambda p, s: file_digest(p, algorithm), jobs, log)
+    duplicates = {}
+    for g in groups:
+        g.sort()
+        first = g[0][0]
+        for key, _path, _size in g[1:]:
+            duplicates[key] = first
+    return duplicates
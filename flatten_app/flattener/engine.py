@@ -0,0 +1,1067 @@
+# フラット化・復元エンジン（GUI/CLI共通。Tkinterに依存しない）
+import hashlib
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from .logic import DirectoryScanner, ExcludeFilter, EXCLUDE_PATTERNS, restore_flattened_filename
+from .namecodec import NameCodec
+from .pathindex import PathPrefixIndex
+from .aggregate import DirectoryAggregate
+from .filemap import FileMap, FileMapIndex, FileMapWriter, FILEMAP_FIELDS, FILEMAP_FORMATS
+from .zipper import ZipBuilder, DEFAULT_ZIP_JOBS
+from .transfer import FileTransfer
+from .instrument import Instrument
+from .scheduler import IO_MODES, DEFAULT_META_JOBS, lane_for_size, open_scheduler
+from .dedup import DEDUP_MODES, file_digest, find_duplicates
+
+FILEMAP_NAME = "filemap.csv"
+# filemap_format='sqlite' のときのfilemap（索引付きで、数百万行でも全件を読み込まずに引ける）
+FILEMAP_DB_NAME = "filemap.db"
+FILEMAP_NAMES = {'csv': FILEMAP_NAME, 'sqlite': FILEMAP_DB_NAME}
+# 並列コピー数のデフォルト（I/O待ちが主なのでCPU数より多めに取る。ThreadPoolExecutorの既定値と同じ）
+DEFAULT_JOBS = min(32, (os.cpu_count() or 1) + 4)
+# フラット化時のfilemapの列（差分フラット化の比較用にサイズ・更新時刻も記録する）
+FLATTEN_FIELDS = FILEMAP_FIELDS + ["size", "mtime"]
+# ZIP化するときの列: フォルダ内のファイル数と、相対パス一覧（ソート済み）のハッシュ
+# （合計サイズ・最新更新時刻だけでは、フォルダ内の名前の変更・移動を検出できないため）
+ZIP_SIGNATURE_FIELDS = ["file_count", "paths_hash"]
+# 重複排除時の列: 内容が同じで実体を共有するファイルのフラット名（実体そのものの行は空）
+CONTENT_OF_FIELD = "content_of"
+# 検証用のハッシュ列（verify=True のとき、コピーと同じ読み込みで計算して記録する）
+HASH_ALGORITHM = "sha256"
+HASH_FIELD = HASH_ALGORITHM
+# この大きさ以上のファイルはコピー中にもバイト単位の進捗を通知する（progress の copying_size）
+BYTE_PROGRESS_MIN_SIZE = 16 * 1024 * 1024
+# コピー中の進捗通知の最短間隔（秒）
+BYTE_PROGRESS_INTERVAL = 0.2
+
+
+def _noop(*args, **kwargs):
+    pass
+
+
+def find_filemap(folder: str) -> str:
+    """
+    フラット化先フォルダの filemap のパスを返す（filemap.db があれば優先。どちらもなければ filemap.csv）
+    """
+    db_path = os.path.join(folder, FILEMAP_DB_NAME)
+    if os.path.exists(db_path):
+        return db_path
+    return os.path.join(folder, FILEMAP_NAME)
+
+
+def is_filemap_file(name: str) -> bool:
+    """
+    フラット化先にある filemap 自身（とSQLiteの作業ファイル）か
+    """
+    return name == FILEMAP_NAME or name == FILEMAP_DB_NAME or (
+        name.startswith(FILEMAP_DB_NAME) and name[len(FILEMAP_DB_NAME):] in ('.part', '-journal', '-wal', '-shm'))
+
+
+def check_separate_dirs(src: str, dst: str):
+    """
+    出力先が入力フォルダと同じ、または入力フォルダの中なら ValueError
+    （直下のファイルはフラット名が元の名前と同じなので、同じフォルダへの出力は元ファイルの上書き・削除になる）
+    """
+    src_real = os.path.normcase(os.path.realpath(src))
+    dst_real = os.path.normcase(os.path.realpath(dst))
+    if dst_real == src_real or dst_real.startswith(src_real.rstrip(os.sep) + os.sep):
+        raise ValueError(f"出力フォルダに入力フォルダ自身またはその中のフォルダは指定できません: {dst}")
+
+
+def normalize_exts(exts: Optional[Iterable[str]]) -> set:
+    """
+    除外拡張子リスト（'.tmp' / 'tmp' / 'Thumbs.db' など）を '.xxx' 形式の小文字集合にする
+    """
+    return {'.' + e.strip().lstrip('.').lower() for e in (exts or []) if e.strip()}
+
+
+def make_exclude_filter(exclude) -> ExcludeFilter:
+    """
+    除外指定（ExcludeFilter または GUI/CLIの指定行のリスト）を ExcludeFilter にそろえる
+    """
+    if isinstance(exclude, ExcludeFilter):
+        return exclude
+    return ExcludeFilter.from_lines(exclude or (), EXCLUDE_PATTERNS)
+
+
+def count_targets(items: List[Dict], exclude=None) -> Tuple[int, int]:
+    """
+    スキャン結果から対象ファイル数・合計サイズを返す（除外拡張子・除外パターンのファイルは数えない）
+    exclude: ExcludeFilter または除外指定行のリスト
+    """
+    exclude = make_exclude_filter(exclude)
+    total_count = 0
+    total_size = 0
+    for item in items:
+        if item.get('is_dir'):
+            continue
+        if exclude.excludes_ext(item.get('ext', '')) or exclude.excludes_name(item['name']):
+            continue
+        total_count += 1
+        size = item.get('size', 0)
+        if isinstance(size, int) and size >= 0:
+            total_size += size
+    return total_count, total_size
+
+
+def auto_zip_targets(items: List[Dict], target_exts: Optional[Iterable[str]]) -> set:
+    """
+    ZIP推奨拡張子のファイルを直下に含むフォルダの相対パス集合を返す
+    """
+    targets = normalize_exts(target_exts)
+    result = set()
+    if not targets:
+        return result
+    for item in items:
+        if item.get('is_dir'):
+            continue
+        if item.get('ext', '').lower() in targets:
+            parent = os.path.dirname(item['relpath'])
+            if parent and parent != '.':
+                result.add(parent)
+    return result
+
+
+def _stat_fields(size, mtime) -> Dict:
+    return {"size": "" if size is None or size < 0 else str(size),
+            "mtime": "" if mtime is None else repr(mtime)}
+
+
+def _record_peaks(instrument: Instrument, pool):
+    # asyncio スケジューラのレーンごとの同時実行数の最大値を計測結果に残す
+    for lane, n in getattr(pool, 'peak', {}).items():
+        instrument.count('inflight_peak:' + lane, n)
+
+
+def guess_original_path(flatname: str) -> str:
+    """
+    フラット名から元の相対パスを推測（filemapがない場合の復元用）
+    """
+    return restore_flattened_filename(flatname)
+
+
+class FlattenEngine:
+    """
+    入力フォルダ配下をフラット化して出力フォルダへコピーし、filemap.csv を出力する
+    - log(msg): ログ通知コールバック
+    - progress(progress, note): 進捗通知コールバック（progressは件数・サイズのdict）
+      大きなファイルのコピー中はワーカースレッドからも呼ばれる（copying_size: コピー途中のファイルの
+      コピー済みバイト数の合計。done_size はファイルのコピー完了時に加算する）
+    - jobs: 並列コピー数（1なら逐次コピー）。filemapの行順は並列数に関係なくスキャン順
+    - incremental: 出力先の既存filemap.csvとサイズ・更新時刻を比較し、新規・変更ファイルだけコピー
+      （checksum=True ならサイズ・更新時刻が同じでも内容のハッシュを比較する）
+    - prune: 差分フラット化時、今回の入力に存在しない古いフラット化ファイルを出力先から削除
+    - zip_jobs: 並列ZIP化数、zip_options: ZipBuilder への追加引数（圧縮レベル・無圧縮拡張子など）
+    - transfer: ファイル転送方式（'auto' / 'copy' / 'hardlink' / 'reflink' / 'kernel'、transfer.py参照）
+    - dedup: 重複排除（'off' / 'link' / 'record'、dedup.py参照）。同じ内容のファイルは1つだけ出力する
+    - verify: コピー時に内容のハッシュを計算し、filemapの sha256 列に記録する（VerifyEngine で検証できる）
+    - filemap_format: filemap の形式（'csv' → filemap.csv / 'sqlite' → filemap.db）
+    - io_mode: 並列実行の方式（'threads' / 'asyncio'、scheduler.py参照）。asyncio なら小さなファイルは
+      meta_jobs 並列、大きなファイルは jobs 並列でコピーする（ネットワーク共有の往復待ちを隠す）
+    - instrument: 計測（instrument.py の Instrument。省略時は実行ごとに作る。report() で段階ごとの時間などを取得）
+    """
+    def __init__(self, src: str, dst: str, *,
+                 zip_targets: Optional[Iterable[str]] = None,
+                 exclude_targets: Optional[Iterable[str]] = None,
+                 exclude_exts=None,
+                 jobs: int = DEFAULT_JOBS,
+                 incremental: bool = False,
+                 checksum: bool = False,
+                 prune: bool = False,
+                 zip_jobs: int = DEFAULT_ZIP_JOBS,
+                 zip_options: Optional[Dict] = None,
+                 transfer: str = 'auto',
+                 dedup: str = 'off',
+                 verify: bool = False,
+                 filemap_format: str = 'csv',
+                 io_mode: str = 'threads',
+                 meta_jobs: int = DEFAULT_META_JOBS,
+                 instrument: Optional[Instrument] = None,
+                 log: Optional[Callable[[str], None]] = None,
+                 progress: Optional[Callable[[Dict, str], None]] = None):
+        if dedup not in DEDUP_MODES:
+            raise ValueError(f"未知の重複排除モード: {dedup}（{', '.join(DEDUP_MODES)}）")
+        if filemap_format not in FILEMAP_FORMATS:
+            raise ValueError(f"未知のfilemap形式: {filemap_format}（{', '.join(FILEMAP_FORMATS)}）")
+        if io_mode not in IO_MODES:
+            raise ValueError(f"未知の並列実行方式: {io_mode}（{', '.join(IO_MODES)}）")
+        self.filemap_format = filemap_format
+        self.io_mode = io_mode
+        self.meta_jobs = meta_jobs
+        self.src = src
+        self.dst = dst
+        self.jobs = max(1, int(jobs or 1))
+        self.dedup = dedup
+        self.verify = verify
+        self.incremental = incremental
+        self.checksum = checksum
+        self.prune = prune
+        self.zip_jobs = zip_jobs
+        self.zip_options = dict(zip_options or {})
+        self.transfer = FileTransfer(transfer)
+        # フラット名の変換（1回の実行中だけ使う。フラット名は実行ごとにほぼ一意なのでキャッシュしない）
+        self.codec = NameCodec(cache_size=0)
+        self.previous = FileMapIndex([])
+        self.zip_targets = set(zip_targets or ())
+        self.exclude_targets = set(exclude_targets or ())
+        # scan(prune=True) でZIP化対象フォルダの中を走査しなかったか（ZIPの差分判定用の集計は別に走査する）
+        self.zip_pruned = False
+        # 除外拡張子・ファイル名glob・フォルダglob（ExcludeFilter または指定行のリスト）
+        self.exclude_filter = make_exclude_filter(exclude_exts)
+        self.instrument = instrument or Instrument()
+        # ログ・進捗通知（GUIの更新など）に掛かった時間も計測する
+        self.log = self.instrument.callback('log', log or _noop)
+        self.progress_cb = self.instrument.callback('progress', progress or _noop)
+        self.progress = {'total_count': 0, 'total_size': 0, 'done_count': 0, 'done_size': 0, 'copying_size': 0}
+        self._copying: Dict[str, int] = {}  # コピー中のファイル → コピー済みバイト数
+        self._copying_lock = threading.Lock()
+        self._copying_notified = 0.0
+
+    def scan(self, prune: bool = False) -> List[Dict]:
+        """
+        入力フォルダをスキャンする
+        prune=True なら除外対象フォルダ（差分フラット化でなければZIP化対象フォルダも）の中は走査しない
+        （フォルダ自身の行は残る。中のファイルはどのみちコピーしないので統計・ZIP推奨の判定からも外れる）
+        """
+        prune_paths = None
+        if prune:
+            prune_paths = PathPrefixIndex(self.exclude_targets)
+            if not self.incremental:
+                # 差分判定ではZIP化対象フォルダ内のサイズ・更新時刻を使うので、その場合は走査する
+                for z in self.zip_targets:
+                    prune_paths.add(z)
+                self.zip_pruned = bool(self.zip_targets)
+        with self.instrument.stage('scan'):
+            items = DirectoryScanner(self.src, exclude_filter=self.exclude_filter, prune_paths=prune_paths).scan()
+        dirs = sum(1 for item in items if item['is_dir'])
+        self.instrument.count('scandir', dirs + 1)
+        self.instrument.count('stat', len(items) - dirs)
+        return items
+
+    def run(self, items: Optional[List[Dict]] = None) -> Dict:
+        """
+        フラット化を実行し、結果（コピー件数・ZIP件数・filemapパス）を返す
+        items: 事前にスキャン済みの結果（省略時はここでスキャン）
+        """
+        check_separate_dirs(self.src, self.dst)
+        if items is None:
+            items = self.scan(prune=True)
+        # ZIP化・除外対象のサブツリー判定用（ファイルごとの判定が対象フォルダ数によらずパスの深さ分で済む）
+        self.zip_index = PathPrefixIndex(self.zip_targets)
+        self.exclude_index = PathPrefixIndex(self.exclude_targets)
+        total_count, total_size = count_targets(items, self.exclude_filter)
+        self.progress.update(total_count=total_count, total_size=total_size, done_count=0, done_size=0,
+                             copying_size=0)
+        self.progress_cb(self.progress, "")
+        os.makedirs(self.dst, exist_ok=True)
+        out_path = os.path.join(self.dst, FILEMAP_NAMES[self.filemap_format])
+        # 差分判定には前回のfilemapを使う（形式を変えた場合は前回の形式のファイルを読む）
+        with self.instrument.stage('load_filemap'):
+            self.previous = self._load_previous(find_filemap(self.dst))
+        self.unchanged = 0
+        self.written = set()
+        self.deduped = 0
+        self.stored = {}
+        with self.instrument.stage('dedup'):
+            self.duplicates = self._find_duplicates(items) if self.dedup != 'off' else {}
+        fields = list(FLATTEN_FIELDS)
+        if self.zip_targets:
+            fields.extend(ZIP_SIGNATURE_FIELDS)
+        if self.verify:
+            fields.append(HASH_FIELD)
+        if self.dedup != 'off':
+            fields.append(CONTENT_OF_FIELD)
+        # filemapは行ごとに追記する（全行をメモリに持たず、中断時も途中までの対応表が残る）
+        # （SQLiteは一時ファイルに書き込み、閉じたときに置き換えるので、書き込み中も前回の行を引ける）
+        with FileMap.open_writer(out_path, fields) as filemap:
+            with self.instrument.stage('zip'):
+                zip_count = self._run_zip(filemap, items)
+            with self.instrument.stage('copy'):
+                count = self._run_copy(items, filemap)
+            with self.instrument.stage('prune'):
+                stale = self._drop_stale()
+            self.previous.close()
+            filemap_close = time.perf_counter()
+        self.instrument.add_stage('filemap', time.perf_counter() - filemap_close)
+        self._remove_other_filemaps(out_path)
+        for method, n in self.transfer.stats.items():
+            self.instrument.count('transfer:' + method, n)
+        self.log(f"{os.path.basename(out_path)} を出力: {out_path}")
+        if self.incremental:
+            self.log(f"差分フラット化: 変更なし {self.unchanged} 件・削除 {stale} 件")
+        if self.dedup != 'off':
+            self.log(f"重複排除: {self.deduped} 件を実体の共有で出力")
+        if self.transfer.stats:
+            self.log(f"転送方式: {self.transfer.stats}")
+        self.log(f"\n完了: {count} ファイルをフラット化・{zip_count}フォルダをZIP化しました")
+        return {'count': count, 'zip_count': zip_count, 'unchanged': self.unchanged,
+                'stale': stale, 'deduped': self.deduped, 'filemap_path': out_path}
+
+    def _load_previous(self, path: str):
+        if not self.incremental or not os.path.exists(path):
+            return FileMapIndex([])
+        try:
+            return FileMap.load_index(path)
+        except Exception as e:
+            self.log(f"既存{os.path.basename(path)}読込エラー（全ファイルをコピーします）: {e}")
+            return FileMapIndex([])
+
+    def _remove_other_filemaps(self, out_path: str):
+        # 別形式の古いfilemapが残っていると復元・検証時にそちらが使われるので削除する
+        for name in FILEMAP_NAMES.values():
+            path = os.path.join(self.dst, name)
+            if path != out_path and os.path.exists(path):
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    self.log(f"旧filemap削除エラー: {path}: {e}")
+
+    def _is_unchanged(self, relpath: str, flat_name: str, size, mtime, check_size: bool = True,
+                      extra: Optional[Dict] = None) -> bool:
+        """
+        既存filemapの行と出力先ファイルが今回の入力と一致するか（サイズ・更新時刻で判定）
+        check_size: 出力先ファイルのサイズも比較する（ZIPは内容の合計サイズと一致しないので比較しない）
+        extra: 一致が必要なその他の列（ZIPのファイル数・パス一覧のハッシュ。列のない古いfilemapは不一致）
+        """
+        row = self.previous.find_flat(flat_name)
+        if not row or row.get('original_path') != relpath:
+            return False
+        fields = _stat_fields(size, mtime)
+        if extra:
+            fields.update(extra)
+        if any((row.get(k) or '') != v for k, v in fields.items()):
+            return False
+        try:
+            dst_size = os.path.getsize(os.path.join(self.dst, flat_name))
+        except OSError:
+            return False
+        return dst_size == size or not check_size
+
+    def _drop_stale(self) -> int:
+        """
+        既存filemapにあって今回出力しなかったエントリを数え、prune指定時は出力先から削除する
+        """
+        stale = 0
+        for row in self.previous:
+            name = row.get('flattened_name')
+            if not name or name in self.written:
+                continue
+            stale += 1
+            if self.prune:
+                try:
+                    os.remove(os.path.join(self.dst, name))
+                    self.instrument.count('unlink')
+                    self.log(f"削除（入力に存在しない）: {name}")
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    self.instrument.error('unlink')
+                    self.log(f"削除エラー: {name}: {e}")
+        return stale
+
+    def _scan_zip_subtrees(self) -> List[Dict]:
+        """
+        ZIP化対象フォルダの中だけを走査する（scan(prune=True) で走査しなかった場合の差分判定用）
+        入れ子の対象は外側のフォルダの走査に含まれる。除外対象フォルダの中は scan() と同じく走査しない
+        """
+        outer = PathPrefixIndex(self.zip_targets)
+        items = []
+        for z in sorted(self.zip_targets):
+            if outer.find(z) != z:
+                continue
+            prefix = z + os.sep
+            prune_paths = [e[len(prefix):] for e in self.exclude_targets if e.startswith(prefix)]
+            scanner = DirectoryScanner(os.path.join(self.src, z), exclude_filter=self.exclude_filter,
+                                       prune_paths=prune_paths)
+            items.extend(dict(item, relpath=os.path.join(z, item['relpath'])) for item in scanner.scan())
+        return items
+
+    def _zip_signatures(self, items: List[Dict]) -> Dict[str, tuple]:
+        """
+        ZIP化対象フォルダごとに (合計サイズ, 最新の更新時刻, ファイル数, 相対パス一覧のハッシュ) を集計する（差分判定用）
+        パス一覧はフォルダからの相対パス（区切りは '/'、フォルダは末尾に '/'）をソートしてハッシュする
+        """
+        if self.zip_pruned:
+            # 全体の走査結果には対象フォルダの中がないので、次回の差分判定と同じ集計になるよう中だけ走査する
+            items = self._scan_zip_subtrees()
+        agg = DirectoryAggregate(items)
+        paths = {z: [] for z in self.zip_targets}
+        for item in items:
+            relpath = item['relpath']
+            # 入れ子のZIP化対象もあるので、祖先をすべてたどる
+            parent = os.path.dirname(relpath)
+            while parent:
+                names = paths.get(parent)
+                if names is not None:
+                    name = relpath[len(parent) + 1:].replace(os.sep, '/')
+                    names.append(name + '/' if item['is_dir'] else name)
+                parent = os.path.dirname(parent)
+        signatures = {}
+        for z, names in paths.items():
+            h = hashlib.new(HASH_ALGORITHM)
+            for name in sorted(names):
+                h.update(name.encode('utf-8', 'surrogateescape') + b'\n')
+            signatures[z] = (agg.size_of(z), agg.mtime_of(z), agg.count_of(z), h.hexdigest())
+        return signatures
+
+    def _run_zip(self, filemap: FileMapWriter, items: List[Dict]) -> int:
+        # --- ZIP化対象のディレクトリを先にZIP化（複数フォルダを並列にZIP化） ---
+        zip_count = 0
+        zip_total = len(self.zip_targets)
+        signatures = self._zip_signatures(items) if zip_total else {}
+        entries = []
+        tasks = []
+        for relpath in sorted(self.zip_targets):
+            if relpath in self.exclude_index:
+                self.log(f"スキップ（除外指定）: {relpath}")
+                continue
+            zip_name = self.codec.encode(relpath) + ".zip"
+            size, mtime, file_count, paths_hash = signatures.get(relpath, (None, None, None, None))
+            extra = {"file_count": "" if file_count is None else str(file_count), "paths_hash": paths_hash or ""}
+            row = {"original_path": relpath, "flattened_name": zip_name, **_stat_fields(size, mtime), **extra}
+            keep = self.incremental and self._is_unchanged(relpath, zip_name, size, mtime, check_size=False,
+                                                           extra=extra)
+            entries.append((row, keep))
+            if not keep:
+                tasks.append((os.path.join(self.src, relpath), os.path.join(self.dst, zip_name)))
+        if tasks:
+            self.progress_cb(self.progress, f"ZIP圧縮中 0/{len(tasks)}")
+        results = ZipBuilder(self.zip_jobs, log=self.log, **self.zip_options).build_all(tasks)
+        done = 0
+        for row, keep in entries:
+            if keep:
+                self._write_row(filemap, row)
+                self.written.add(row['flattened_name'])
+                self.unchanged += 1
+                continue
+            i, stats, error = next(results)
+            abs_dir, zip_path = tasks[i]
+            done += 1
+            self.progress_cb(self.progress, f"ZIP圧縮中 {done}/{len(tasks)}")
+            if error is not None:
+                self.instrument.error('zip')
+                self.log(f"ZIP化エラー: {abs_dir} : {error}")
+                continue
+            self.instrument.count('zip')
+            if stats:
+                self.instrument.count('zip_files', stats[0])
+                self.instrument.add_bytes('zip', stats[1])
+            self.log(f"ZIP化: {abs_dir} → {zip_path}")
+            self._write_row(filemap, row)
+            self.written.add(row['flattened_name'])
+            zip_count += 1
+        if zip_total:
+            self.progress_cb(self.progress, "")
+        return zip_count
+
+    def _skip_reason(self, item: Dict) -> Optional[str]:
+        """
+        コピーしない理由を返す（コピー対象なら None、ZIP化対象フォルダ内なら空文字）
+        """
+        relpath = item['relpath']
+        if relpath in self.zip_index:
+            return ""
+        if relpath in self.exclude_index:
+            return "除外指定"
+        if self.exclude_filter.excludes_ext(item.get('ext') or os.path.splitext(item['name'])[1]):
+            return "除外拡張子"
+        if self.exclude_filter.excludes_name(item['name']):
+            return "除外パターン"
+        return None
+
+    def _is_skipped(self, item: Dict) -> bool:
+        reason = self._skip_reason(item)
+        if reason:
+            self.log(f"スキップ（{reason}）: {item['relpath']}")
+        return reason is not None
+
+    def _find_duplicates(self, items: List[Dict]) -> Dict[int, int]:
+        """
+        コピー対象のファイルから内容が同じものを探す（{重複のインデックス: 実体のインデックス}）
+        """
+        files = [(i, os.path.join(self.src, item['relpath']), item.get('size'))
+                 for i, item in enumerate(items)
+                 if not item['is_dir'] and self._skip_reason(item) is None]
+        self.progress_cb(self.progress, "重複確認中")
+        duplicates = find_duplicates(files, jobs=self.jobs, log=self.log)
+        self.progress_cb(self.progress, "")
+        return duplicates
+
+    def _iter_copy_jobs(self, items: List[Dict]):
+        """
+        コピージョブ (item, src_path, flat_name, dst_path, action, content_of) を順に返す
+        action: 'copy'（コピー）/ 'check'（ハッシュ比較して異なればコピー）/ 'keep'（変更なし）
+                / 'dedup'（内容が同じファイルの実体 content_of を共有する）
+        """
+        firsts = set(self.duplicates.values())
+        flat_names = {}
+        for i, item in enumerate(items):
+            if item['is_dir'] or self._is_skipped(item):
+                continue
+            flat_name = self.codec.encode(item['relpath'])
+            action = 'copy'
+            content_of = None
+            first = self.duplicates.get(i)
+            if first is not None:
+                action = 'dedup'
+                content_of = flat_names[first]
+            elif i in firsts:
+                flat_names[i] = flat_name
+            if action == 'copy' and self.incremental and self._is_unchanged(item['relpath'], flat_name, item.get('size'), item.get('mtime')):
+                action = 'check' if self.checksum else 'keep'
+                if action == 'keep' and self.verify and not self.previous.find_flat(flat_name).get(HASH_FIELD):
+                    # 前回ハッシュを記録していなければ、内容を比較しつつハッシュを計算する
+                    action = 'check'
+            yield (item, os.path.join(self.src, item['relpath']), flat_name, os.path.join(self.dst, flat_name),
+                   action, content_of)
+
+    def _byte_progress(self, dst_path: str) -> Callable[[int], None]:
+        """
+        1ファイルのコピー中の進捗通知（ワーカースレッドから転送したバイト数で呼ばれる。通知は一定間隔に間引く）
+        """
+        name = os.path.basename(dst_path)
+
+        def report(n: int):
+            now = time.perf_counter()
+            with self._copying_lock:
+                self._copying[dst_path] = self._copying.get(dst_path, 0) + n
+                self.progress['copying_size'] += n
+                if now - self._copying_notified < BYTE_PROGRESS_INTERVAL:
+                    return
+                self._copying_notified = now
+                snapshot = dict(self.progress)
+            self.progress_cb(snapshot, f"コピー中 {name}")
+        return report
+
+    def _copy_one(self, src_path: str, dst_path: str, action: str = 'copy', size=None):
+        """
+        ワーカースレッドで実行される。(例外 or None, コピーしたか, ハッシュ値 or None) を返す
+        例外は呼び出し側（スキャン順の集約処理）で扱う
+        size が BYTE_PROGRESS_MIN_SIZE 以上ならコピー中の進捗も通知する
+        """
+        digest = None
+        if action in ('keep', 'dedup'):
+            return None, False, None
+        progress = None
+        if isinstance(size, int) and size >= BYTE_PROGRESS_MIN_SIZE:
+            progress = self._byte_progress(dst_path)
+        start = time.perf_counter()
+        try:
+            if action == 'check':
+                self.instrument.count('hash', 2)
+                digest = file_digest(src_path, HASH_ALGORITHM)
+                if digest == file_digest(dst_path, HASH_ALGORITHM):
+                    self.instrument.observe('check', time.perf_counter() - start)
+                    return None, False, digest
+            if self.verify:
+                digest = self.transfer.transfer_with_digest(src_path, dst_path, HASH_ALGORITHM, progress)
+            else:
+                self.transfer.transfer(src_path, dst_path, progress)
+        except Exception as e:
+            self.instrument.error('copy')
+            return e, False, None
+        self.instrument.observe('copy', time.perf_counter() - start)
+        return None, True, digest
+
+    def _write_row(self, filemap: FileMapWriter, row: Dict):
+        start = time.perf_counter()
+        filemap.write(row)
+        self.instrument.add_stage('filemap', time.perf_counter() - start)
+
+    def _share_content(self, dst_path: str, content_of: str) -> str:
+        """
+        重複ファイルを実体 content_of と共有して出力する（メインスレッドで実行）。使った方法を返す
+        link: 実体へのハードリンク（失敗時は記録のみ）/ record: 出力しない（前回の出力は削除）
+        """
+        try:
+            os.unlink(dst_path)
+        except FileNotFoundError:
+            pass
+        if self.dedup == 'link':
+            try:
+                os.link(os.path.join(self.dst, content_of), dst_path)
+                return 'リンク'
+            except OSError:
+                pass
+        return '記録のみ'
+
+    def _finish_copy(self, job, outcome, filemap: FileMapWriter) -> bool:
+        item, src_path, flat_name, dst_path, action, content_of = job
+        if action == 'dedup':
+            if content_of in self.stored:
+                outcome = (None, self._share_content(dst_path, content_of), self.stored[content_of])
+            else:
+                # 実体のコピーに失敗していたら、このファイルを通常どおりコピーする
+                content_of = None
+                outcome = self._copy_one(src_path, dst_path, 'copy', item.get('size'))
+        error, copied, digest = outcome
+        if self._copying:
+            with self._copying_lock:
+                self.progress['copying_size'] -= self._copying.pop(dst_path, 0)
+        if error is not None:
+            self.log(f"エラー: {src_path} → {dst_path} : {error}")
+            return False
+        if action == 'keep' and self.verify:
+            digest = self.previous.find_flat(flat_name).get(HASH_FIELD)
+        row = {
+            "original_path": item['relpath'],
+            "flattened_name": flat_name,
+            **_stat_fields(item.get('size'), item.get('mtime'))
+        }
+        if self.verify:
+            row[HASH_FIELD] = digest or ''
+        if content_of:
+            row[CONTENT_OF_FIELD] = content_of
+        self._write_row(filemap, row)
+        self.written.add(flat_name)
+        if content_of:
+            self.log(f"重複（{copied}）: {src_path} → {dst_path} = {content_of}")
+            self.deduped += 1
+            copied = False
+        else:
+            if self.duplicates:
+                # 重複ファイルが共有できる実体として記録
+                self.stored[flat_name] = digest
+            if copied:
+                self.log(f"コピー: {src_path} → {dst_path}")
+            else:
+                self.unchanged += 1
+        self.progress['done_count'] += 1
+        size = item.get('size', 0)
+        if isinstance(size, int) and size >= 0:
+            self.progress['done_size'] += size
+            if copied:
+                self.instrument.add_bytes('copy', size)
+        self.progress_cb(self.progress, "")
+        return copied
+
+    def _run_copy(self, items: List[Dict], filemap: FileMapWriter) -> int:
+        # --- 通常ファイルのフラット化 ---
+        # フラット名はパス区切りを含まないので、出力先フォルダの作成は run() での1回だけでよい
+        count = 0
+        if self.jobs == 1 and self.io_mode == 'threads':
+            for job in self._iter_copy_jobs(items):
+                outcome = self.instrument.call(self._copy_one, job[1], job[3], job[4], job[0].get('size'))
+                count += self._finish_copy(job, outcome, filemap)
+            return count
+        # copy2をスレッドプール（asyncio ならサイズ別のレーン）に分散し、結果は投入順（スキャン順）に回収する。
+        # 投入済み・未回収のジョブ数をスケジューラの窓（同時実行数の数倍）に制限してメモリを一定に保つ
+        pending = deque()
+        with open_scheduler(self.io_mode, self.jobs, self.meta_jobs) as pool:
+            window = pool.window
+            for job in self._iter_copy_jobs(items):
+                if job[4] in ('keep', 'dedup'):
+                    # 重複ファイルは実体のコピー完了後に回収側で処理する
+                    pending.append((job, None))
+                else:
+                    pending.append((job, pool.submit(lane_for_size(job[0].get('size')), self.instrument.call,
+                                                     self._copy_one, job[1], job[3], job[4], job[0].get('size'))))
+                if len(pending) >= window:
+                    done_job, future = pending.popleft()
+                    count += self._finish_copy(done_job, future.result() if future else (None, False, None), filemap)
+            while pending:
+                done_job, future = pending.popleft()
+                count += self._finish_copy(done_job, future.result() if future else (None, False, None), filemap)
+        _record_peaks(self.instrument, pool)
+        return count
+
+
+class RestoreEngine:
+    """
+    フラット化済みフォルダから元のディレクトリ構造を復元する
+    - method: 'filemap'（filemap.csv優先）/ 'filename'（ファイル名から推測）
+    - unzip: ZIPファイルを展開するか（Falseならそのままコピー）
+    - jobs: 並列に実行するコピー・ZIP展開の数
+    - transfer: ファイル転送方式（FlattenEngine と同じ）
+    - io_mode / meta_jobs: 並列実行の方式（FlattenEngine と同じ）。asyncio ならフォルダ作成と
+      小さなファイル（filemap の size 列で判定）は meta_jobs 並列、ZIP展開・大きなファイルは jobs 並列
+    - instrument: 計測（FlattenEngine と同じ）
+    """
+    def __init__(self, src: str, dst: str, *,
+                 method: str = 'filemap',
+                 unzip: bool = True,
+                 jobs: int = DEFAULT_JOBS,
+                 transfer: str = 'auto',
+                 io_mode: str = 'threads',
+                 meta_jobs: int = DEFAULT_META_JOBS,
+                 instrument: Optional[Instrument] = None,
+                 log: Optional[Callable[[str], None]] = None,
+                 progress: Optional[Callable[[Dict, str], None]] = None):
+        self.src = src
+        self.dst = dst
+        self.method = method
+        self.unzip = unzip
+        self.jobs = max(1, int(jobs or 1))
+        if io_mode not in IO_MODES:
+            raise ValueError(f"未知の並列実行方式: {io_mode}（{', '.join(IO_MODES)}）")
+        self.io_mode = io_mode
+        self.meta_jobs = meta_jobs
+        self.transfer = FileTransfer(transfer)
+        self.instrument = instrument or Instrument()
+        self.log = self.instrument.callback('log', log or _noop)
+        self.progress_cb = self.instrument.callback('progress', progress or _noop)
+        self.progress = {'total_count': 0, 'done_count': 0}
+        self.sizes: Dict[str, str] = {}  # 復元元ファイル → filemap の size 列（asyncio のレーン分け用）
+
+    def load_filemap(self):
+        """
+        filemap を開く（filemap.csv はメモリマップして行位置の索引をバックグラウンドで作るので、
+        索引の完成を待たずにフラット化フォルダの一覧取得を進められる）
+        """
+        filemap_path = find_filemap(self.src)
+        if not os.path.exists(filemap_path):
+            return FileMapIndex([])
+        try:
+            return FileMap.load_index(filemap_path, lazy=True)
+        except Exception as e:
+            self.log(f"{os.path.basename(filemap_path)}読込エラー: {e}")
+            return FileMapIndex([])
+
+    def list_files(self) -> List[str]:
+        files = []
+        for root, dirs, fs in os.walk(self.src):
+            for f in fs:
+                if root == self.src and is_filemap_file(f):
+                    continue
+                files.append(os.path.relpath(os.path.join(root, f), self.src))
+        return files
+
+    def shared_rows(self, filemap: FileMapIndex, files: Iterable[str]) -> List[Dict]:
+        """
+        重複排除（record）で実体を出力しなかった行: フラット名のファイルがなく content_of に実体がある行
+        """
+        if CONTENT_OF_FIELD not in getattr(filemap, 'fieldnames', (CONTENT_OF_FIELD,)):
+            return []  # 重複排除なしのfilemapは全行を読む必要がない
+        present = set(files)
+        return [row for row in filemap
+                if row.get(CONTENT_OF_FIELD) and row.get('flattened_name') not in present]
+
+    def plan(self) -> List[Tuple[str, str, str]]:
+        """
+        復元プレビュー用: (フラット名, filemap復元パス, 推測復元パス) のリストを返す
+        """
+        filemap = self.load_filemap()
+        rows = []
+        files = self.list_files()
+        for f in files:
+            filemap_path = filemap.get_original(f) or ""
+            try:
+                guess_path = guess_original_path(f)
+            except Exception:
+                guess_path = ""
+            rows.append((f, filemap_path, guess_path))
+        for row in self.shared_rows(filemap, files):
+            rows.append((row['flattened_name'], row['original_path'], f"= {row[CONTENT_OF_FIELD]}"))
+        filemap.close()
+        return rows
+
+    def _resolve(self, filemap: Optional[FileMapIndex], f: str) -> Optional[str]:
+        # 復元パス決定（filemap: filemap優先で復元するときの索引。None ならファイル名から推測）
+        if filemap is not None:
+            row = filemap.find_flat(f)
+            if row is None:
+                self.log(f"filemap未登録: {f}")
+                return None
+            self.sizes[os.path.join(self.src, f)] = row.get('size')
+            return row['original_path']
+        try:
+            return guess_original_path(f)
+        except Exception as e:
+            self.log(f"復元名変換エラー: {f}: {e}")
+            return None
+
+    def _make_job(self, src_path: str, out_path: str) -> Tuple[str, str, str]:
+        """
+        復元ジョブ (種別, 元ファイル, 出力先) を作る
+        種別: 'unzip'（ZIP展開、出力先は展開フォルダ）/ 'zipcopy'（ZIPのままコピー）/ 'copy'
+        """
+        if src_path.lower().endswith('.zip'):
+            if self.unzip:
+                # ZIP展開: ZIPファイル名(拡張子なし)のフォルダ内に展開
+                zip_folder = os.path.splitext(os.path.basename(out_path))[0]
+                return 'unzip', src_path, os.path.join(os.path.dirname(out_path), zip_folder)
+            # ZIPコピー: ファイル名に.zip拡張子を必ず付与してコピー
+            if not out_path.lower().endswith('.zip'):
+                out_path += '.zip'
+            return 'zipcopy', src_path, out_path
+        return 'copy', src_path, out_path
+
+    @staticmethod
+    def leaf_dirs(dirs: Iterable[str]) -> List[str]:
+        """
+        作成が必要なフォルダのうち、他のフォルダの祖先でないもの（末端）だけを返す
+        末端を os.makedirs すれば祖先もまとめて作られるので、フォルダ作成は1フォルダ1回で済む
+        """
+        dirs = set(dirs)
+        ancestors = set()
+        for d in dirs:
+            parent = os.path.dirname(d)
+            while parent and parent not in ancestors:
+                ancestors.add(parent)
+                grandparent = os.path.dirname(parent)
+                parent = grandparent if grandparent != parent else ''
+        return sorted(dirs - ancestors)
+
+    def run(self) -> int:
+        """
+        復元を実行し、復元できたファイル/ZIP数を返す
+        1. 全ファイルの復元先を先に決め、必要なフォルダをまとめて作成
+        2. コピー・ZIP展開をスレッドプールで並列実行（結果はファイル一覧の順に回収）
+        """
+        check_separate_dirs(self.src, self.dst)
+        self.log(f"復元実行: {self.method} (ZIP展開: {'ON' if self.unzip else 'OFF'})")
+        inst = self.instrument
+        with inst.stage('load_filemap'):
+            filemap = self.load_filemap()
+        tasks = []
+        with inst.stage('list'):
+            files = self.list_files()
+        inst.count('stat', len(files))
+        with inst.stage('plan'):
+            # filemap が空かどうかはループの前に1回だけ調べる（SQLite の件数取得・CSV索引の完成待ちを避ける）
+            use_filemap = filemap if self.method == 'filemap' and filemap else None
+            for f in files:
+                original = self._resolve(use_filemap, f)
+                if original is not None:
+                    tasks.append(self._make_job(os.path.join(self.src, f), os.path.join(self.dst, original)))
+            if self.method == 'filemap':
+                # 重複排除で出力を省いたファイルは、同じ内容の実体から復元する
+                for row in self.shared_rows(filemap, files):
+                    src_path = os.path.join(self.src, row[CONTENT_OF_FIELD])
+                    self.sizes[src_path] = row.get('size')
+                    tasks.append(self._make_job(src_path, os.path.join(self.dst, row['original_path'])))
+            filemap.close()
+        self.progress.update(total_count=len(tasks), done_count=0)
+        self.progress_cb(self.progress, "")
+        dirs = [target if kind == 'unzip' else os.path.dirname(target) for kind, _src, target in tasks]
+        with inst.stage('mkdir'):
+            self._make_dirs(self.leaf_dirs(dirs))
+        with inst.stage('restore'):
+            count = self._run_tasks(tasks)
+        for method, n in self.transfer.stats.items():
+            inst.count('transfer:' + method, n)
+        self.log(f"\n復元完了: {count} ファイル/ZIP")
+        return count
+
+    def _make_dir(self, d: str) -> Optional[Exception]:
+        try:
+            os.makedirs(d, exist_ok=True)
+        except OSError as e:
+            return e
+        return None
+
+    def _make_dirs(self, dirs: List[str]):
+        """
+        末端フォルダを作成する（asyncio ならメタデータ操作として並列に。祖先の同時作成は exist_ok で吸収される）
+        """
+        def finish(d, error):
+            if error is None:
+                self.instrument.count('mkdir')
+            else:
+                self.instrument.error('mkdir')
+                self.log(f"フォルダ作成エラー: {d}: {error}")
+        if self.io_mode != 'asyncio':
+            for d in dirs:
+                finish(d, self._make_dir(d))
+            return
+        pending = deque()
+        with open_scheduler(self.io_mode, self.jobs, self.meta_jobs) as pool:
+            for d in dirs:
+                pending.append((d, pool.submit('meta', self._make_dir, d)))
+                if len(pending) >= pool.window:
+                    done_dir, future = pending.popleft()
+                    finish(done_dir, future.result())
+            while pending:
+                done_dir, future = pending.popleft()
+                finish(done_dir, future.result())
+
+    def _lane(self, task: Tuple[str, str, str]) -> str:
+        kind, src_path, _target = task
+        return 'data' if kind == 'unzip' else lane_for_size(self.sizes.get(src_path))
+
+    def _run_tasks(self, tasks: List[Tuple[str, str, str]]) -> int:
+        count = 0
+        if self.jobs == 1 and self.io_mode == 'threads':
+            for task in tasks:
+                count += self._finish(task, self.instrument.call(self._execute, *task))
+            return count
+        pending = deque()
+        with open_scheduler(self.io_mode, self.jobs, self.meta_jobs) as pool:
+            for task in tasks:
+                pending.append((task, pool.submit(self._lane(task), self.instrument.call, self._execute, *task)))
+                if len(pending) >= pool.window:
+                    done_task, future = pending.popleft()
+                    count += self._finish(done_task, future.result())
+            while pending:
+                done_task, future = pending.popleft()
+                count += self._finish(done_task, future.result())
+        _record_peaks(self.instrument, pool)
+        return count
+
+    def _execute(self, kind: str, src_path: str, target: str) -> Optional[Exception]:
+        # ワーカースレッドで実行される。フォルダは run() で作成済み
+        start = time.perf_counter()
+        try:
+            size = os.path.getsize(src_path)
+            if kind == 'unzip':
+                import zipfile
+                with zipfile.ZipFile(src_path, 'r') as zf:
+                    zf.extractall(target)
+            else:
+                self.transfer.transfer(src_path, target)
+        except Exception as e:
+            self.instrument.error(kind)
+            return e
+        self.instrument.count(kind)
+        self.instrument.observe('restore', time.perf_counter() - start, size)
+        return None
+
+    def _finish(self, task: Tuple[str, str, str], error: Optional[Exception]) -> bool:
+        kind, src_path, target = task
+        self.progress['done_count'] += 1
+        self.progress_cb(self.progress, "")
+        if kind == 'unzip':
+            if error is not None:
+                self.log(f"ZIP展開エラー: {src_path}: {error}")
+                return False
+            self.log(f"展開: {src_path} → {target}")
+        elif kind == 'zipcopy':
+            if error is not None:
+                self.log(f"ZIPコピーエラー: {src_path} → {target}: {error}")
+                return False
+            self.log(f"ZIPコピー: {src_path} → {target}")
+        else:
+            if error is not None:
+                self.log(f"復元エラー: {src_path} → {target}: {error}")
+                return False
+            self.log(f"復元: {src_path} → {target}")
+        return True
+
+
+class VerifyEngine:
+    """
+    filemap の size / sha256 列を使って、フラット化先または復元先のファイルを並列に検証する
+    - target='flat': root 内のフラット名のファイルを検証（filemap は省略時 root/filemap.db または filemap.csv）
+    - target='restored': root 内の元パスのファイルを検証（フラット化先の filemap を指定する）
+    ZIP化フォルダの行は存在だけを確認する（filemapのサイズはZIPの中身の合計なので比較しない）
+    """
+    def __init__(self, root: str, filemap_path: Optional[str] = None, *,
+                 target: str = 'flat',
+                 jobs: int = DEFAULT_JOBS,
+                 instrument: Optional[Instrument] = None,
+                 log: Optional[Callable[[str], None]] = None,
+                 progress: Optional[Callable[[Dict, str], None]] = None):
+        if target not in ('flat', 'restored'):
+            raise ValueError(f"未知の検証対象: {target}（flat, restored）")
+        self.root = root
+        self.filemap_path = filemap_path or find_filemap(root)
+        self.target = target
+        self.jobs = max(1, int(jobs or 1))
+        self.instrument = instrument or Instrument()
+        self.log = self.instrument.callback('log', log or _noop)
+        self.progress_cb = self.instrument.callback('progress', progress or _noop)
+        self.progress = {'total_count': 0, 'done_count': 0}
+
+    @staticmethod
+    def _is_zip_row(row: Dict) -> bool:
+        return (row.get('flattened_name', '').lower().endswith('.zip')
+                and not row.get('original_path', '').lower().endswith('.zip'))
+
+    def _path_of(self, row: Dict) -> str:
+        if self.target == 'restored':
+            return os.path.join(self.root, row['original_path'])
+        path = os.path.join(self.root, row['flattened_name'])
+        if row.get(CONTENT_OF_FIELD) and not os.path.lexists(path):
+            # 重複排除（record）で出力を省いた行は実体のファイルを検証する
+            path = os.path.join(self.root, row[CONTENT_OF_FIELD])
+        return path
+
+    def _check(self, row: Dict) -> Tuple[str, str]:
+        """
+        ワーカースレッドで実行される。(結果, 詳細) を返す
+        結果: 'ok' / 'unverified'（ハッシュ未記録で存在・サイズのみ確認）/ 'missing' / 'mismatch'
+        """
+        path = self._path_of(row)
+        if self._is_zip_row(row):
+            if self.target == 'restored':
+                found = os.path.isdir(path) or os.path.isfile(path + '.zip')
+            else:
+                found = os.path.isfile(path)
+            return ('unverified', path) if found else ('missing', path)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return 'missing', path
+        expected_size = row.get('size', '')
+        if expected_size and expected_size.isdigit() and int(expected_size) != size:
+            return 'mismatch', f"{path}（サイズ {size} ≠ {expected_size}）"
+        expected_hash = row.get(HASH_FIELD, '')
+        if not expected_hash:
+            return 'unverified', path
+        try:
+            actual = file_digest(path, HASH_ALGORITHM)
+        except OSError as e:
+            return 'missing', f"{path}（{e}）"
+        if actual != expected_hash:
+            return 'mismatch', f"{path}（{HASH_ALGORITHM} 不一致）"
+        return 'ok', path
+
+    def _timed_check(self, row: Dict) -> Tuple[str, str]:
+        start = time.perf_counter()
+        outcome = self._check(row)
+        size = row.get('size') or ''
+        # ハッシュを計算したファイルだけ読み込んだバイト数に数える
+        nbytes = int(size) if outcome[0] in ('ok', 'mismatch') and size.isdigit() else 0
+        self.instrument.observe('verify', time.perf_counter() - start, nbytes)
+        return outcome
+
+    def _finish(self, result: Dict, outcome: Tuple[str, str]):
+        status, detail = outcome
+        result[status] += 1
+        if status == 'missing':
+            self.log(f"欠落: {detail}")
+            result['problems'].append((status, detail))
+        elif status == 'mismatch':
+            self.log(f"不一致: {detail}")
+            result['problems'].append((status, detail))
+        self.progress['done_count'] += 1
+        self.progress_cb(self.progress, "")
+
+    def run(self) -> Dict:
+        """
+        検証を実行し、件数（ok / unverified / missing / mismatch）と問題の一覧（problems）を返す
+        """
+        inst = self.instrument
+        with inst.stage('load_filemap'):
+            rows = FileMap.load_index(self.filemap_path, lazy=True)
+            total = len(rows)
+        result = {'checked': total, 'ok': 0, 'unverified': 0, 'missing': 0, 'mismatch': 0, 'problems': []}
+        self.progress.update(total_count=total, done_count=0)
+        self.progress_cb(self.progress, "")
+        self.log(f"検証開始: {self.root}（{total} 件）")
+        with inst.stage('verify'):
+            if self.jobs == 1:
+                for row in rows:
+                    self._finish(result, inst.call(self._timed_check, row))
+            else:
+                window = self.jobs * 4
+                pending = deque()
+                with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+                    for row in rows:
+                        pending.append(executor.submit(inst.call, self._timed_check, row))
+                        if len(pending) >= window:
+                            self._finish(result, pending.popleft().result())
+                    while pending:
+                        self._finish(result, pending.popleft().result())
+        rows.close()
+        for status in ('missing', 'mismatch'):
+            if result[status]:
+                inst.error(status, result[status])
+        self.log(f"\n検証完了: 一致 {result['ok']} 件・ハッシュ未記録 {result['unverified']} 件・"
+                 f"欠落 {result['missing']} 件・不一致 {result['mismatch']} 件")
+        return result
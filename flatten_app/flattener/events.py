@@ -0,0 +1,86 @@
+# ワーカースレッド → UI への通知（ログ・進捗）をまとめて受け渡すキュー
+import collections
+import threading
+from typing import Dict, List, Optional, Tuple
+
+# UIが取り出す前に溜めておくログ行数の上限（超えた分は画面表示を省略し、件数だけ通知する）
+MAX_PENDING_LOGS = 10000
+
+
+class LogFile:
+    """
+    全ログをファイルに追記する（スレッドセーフ。行単位でバッファリング）
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._f = open(path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def write(self, msg: str):
+        with self._lock:
+            if not self._f.closed:
+                self._f.write(msg + '\n')
+
+    def close(self):
+        with self._lock:
+            if not self._f.closed:
+                self._f.close()
+
+
+class EventQueue:
+    """
+    ワーカースレッドからのログ・進捗をUIスレッドへ渡すキュー（スレッドセーフ）
+    - ワーカーは log() / progress() / post() を呼ぶだけで、UIには直接触れない
+    - UIは drain() を一定間隔（フレームレート）で呼び、溜まったログをまとめて受け取る
+    - 進捗は最新の1件だけを保持する（ファイルごとの更新をまとめて1回の描画にする）
+    - log_path を指定すると、画面表示とは別に全ログをファイルへ書き出す
+    """
+    def __init__(self, log_path: Optional[str] = None, max_pending: int = MAX_PENDING_LOGS):
+        self._lock = threading.Lock()
+        self._logs = collections.deque()
+        self._max_pending = max_pending
+        self._dropped = 0
+        self._progress = None
+        self._events = []
+        self.log_file = LogFile(log_path) if log_path else None
+
+    def log(self, msg: str):
+        if self.log_file:
+            self.log_file.write(msg)
+        with self._lock:
+            if len(self._logs) >= self._max_pending:
+                self._logs.popleft()
+                self._dropped += 1
+            self._logs.append(msg)
+
+    def progress(self, progress: Dict, note: str = ""):
+        snapshot = dict(progress)
+        with self._lock:
+            self._progress = (snapshot, note)
+
+    def post(self, kind: str, payload=None):
+        """
+        完了通知などの一度きりのイベントを送る
+        """
+        with self._lock:
+            self._events.append((kind, payload))
+
+    def drain(self, max_logs: Optional[int] = None) -> Tuple[List[str], int, Optional[Tuple[Dict, str]], List[Tuple[str, object]]]:
+        """
+        溜まっている (ログ行, 省略した行数, 最新の進捗, イベント) を取り出す
+        max_logs を指定すると1回に取り出すログ行数を制限する（残りは次回）
+        """
+        with self._lock:
+            if max_logs is None or max_logs >= len(self._logs):
+                logs = list(self._logs)
+                self._logs.clear()
+            else:
+                logs = [self._logs.popleft() for _ in range(max_logs)]
+            dropped, self._dropped = self._dropped, 0
+            progress, self._progress = self._progress, None
+            events, self._events = self._events, []
+        return logs, dropped, progress, events
+
+    def close(self):
+        if self.log_file:
+            self.log_file.close()
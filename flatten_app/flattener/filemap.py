@@ -1,13 +1,525 @@
 # filemap管理ロジック（雛形）
 import csv
+import io
 import json
-from typing import List, Dict
+import mmap
+import os
+import threading
+import time
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional
+
+FILEMAP_FIELDS = ["original_path", "flattened_name"]
+# filemapの保存形式: csv（従来）/ sqlite（索引付き。数百万行でも全件を読み込まずに検索できる）
+FILEMAP_FORMATS = ('csv', 'sqlite')
+SQLITE_EXTS = ('.db', '.sqlite', '.sqlite3')
+
+
+def _complete_lines(f) -> Iterator[str]:
+    """
+    改行で終わる行だけを返す（書き込み途中で中断されたfilemapの末尾の不完全な行を無視する）
+    """
+    for line in f:
+        if line.endswith('\n'):
+            yield line
+
+
+class FileMapWriter:
+    """
+    filemap.csv を1行ずつ追記するストリーミングライタ
+    - 行は内部バッファに溜め、flush_rows 行ごと、または flush_interval 秒ごとにまとめてファイルへ書き出す
+      （1行ごとのwrite/flushによる遅延を抑えつつ、書き出しの遅れを一定時間以内に制限する）
+    - 書き出しは行単位なので、途中でプロセスが落ちてもそれまでの行は有効なCSVとして残る
+    - append=True なら既存ファイルの末尾に追記（不完全な末尾行は切り詰める）
+    - fsync=True なら書き出しのたびに os.fsync でディスクまで同期する
+    """
+    def __init__(self, path: str, fieldnames: Optional[List[str]] = None, *,
+                 append: bool = False,
+                 flush_rows: int = 1000,
+                 flush_interval: float = 1.0,
+                 fsync: bool = False):
+        self.path = path
+        self.fieldnames = list(fieldnames or FILEMAP_FIELDS)
+        self.flush_rows = max(1, flush_rows)
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.count = 0
+        write_header = True
+        if append and os.path.exists(path):
+            self._truncate_partial_line(path)
+            write_header = os.path.getsize(path) == 0
+        self._f = open(path, 'a' if append else 'w', newline='', encoding='utf-8')
+        self._buf = io.StringIO()
+        self._writer = csv.DictWriter(self._buf, fieldnames=self.fieldnames, extrasaction='ignore')
+        self._pending = 0
+        self._last_flush = time.monotonic()
+        if write_header:
+            self._writer.writeheader()
+            self.flush()
+
+    @staticmethod
+    def _truncate_partial_line(path: str):
+        with open(path, 'rb+') as f:
+            data = f.read()
+            if data and not data.endswith(b'\n'):
+                f.truncate(data.rfind(b'\n') + 1)
+
+    def write(self, row: Dict):
+        self._writer.writerow(row)
+        self.count += 1
+        self._pending += 1
+        if self._pending >= self.flush_rows or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        data = self._buf.getvalue()
+        if data:
+            self._f.write(data)
+            self._buf.seek(0)
+            self._buf.truncate()
+        self._f.flush()
+        if self.fsync:
+            os.fsync(self._f.fileno())
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        if self._f.closed:
+            return
+        self.flush()
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class FileMapIndex:
+    """
+    filemapの索引: フラット名・元パスのどちらからでも O(1) で行を引ける
+    - 読み込み時に1回だけ構築し、復元処理・復元プレビューで共用する
+    - 同じキーが複数ある場合は先頭の行を優先（従来の線形探索と同じ結果）
+    """
+    def __init__(self, rows: Iterable[Dict]):
+        self.rows = list(rows)
+        self.by_flat = {}
+        self.by_original = {}
+        for row in self.rows:
+            self.by_flat.setdefault(row.get('flattened_name'), row)
+            self.by_original.setdefault(row.get('original_path'), row)
+
+    def find_flat(self, flattened_name: str) -> Optional[Dict]:
+        return self.by_flat.get(flattened_name)
+
+    def find_original(self, original_path: str) -> Optional[Dict]:
+        return self.by_original.get(original_path)
+
+    def get_original(self, flattened_name: str) -> Optional[str]:
+        row = self.find_flat(flattened_name)
+        return row['original_path'] if row else None
+
+    def get_flattened(self, original_path: str) -> Optional[str]:
+        row = self.find_original(original_path)
+        return row['flattened_name'] if row else None
+
+    def iter_prefix(self, folder: str) -> Iterator[Dict]:
+        """
+        元パスが folder 配下の行を返す
+        """
+        prefix = folder.rstrip('/\\') + os.sep
+        return (row for row in self.rows if row.get('original_path', '').startswith(prefix))
+
+    def close(self):
+        pass
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __bool__(self) -> bool:
+        return bool(self.rows)
+
+    def __iter__(self) -> Iterator[Dict]:
+        return iter(self.rows)
+
+    def __contains__(self, flattened_name) -> bool:
+        return flattened_name in self.by_flat
+
+
+class LazyCSVFileMapIndex:
+    """
+    filemap.csv をメモリマップし、行の位置（バイトオフセット）の表だけを作る遅延読み込みの索引
+    - 行は参照されたときに初めてデコードする（全行のdictを作らない）
+    - 位置の表とフラット名 → 行番号の辞書はバックグラウンドスレッドで作る。作成中でも
+      登録済みの行は引け、反復は作成済みの行から順に返す（未登録の名前の検索・件数は完成を待つ）
+    - 読み込み中にファイルを書き換えてはいけない（フラット化先の差分判定には FileMapIndex を使う）
+    FileMapIndex と同じ使い方ができる（by_flat は フラット名 → 行番号）
+    """
+    CHUNK_SIZE = 4 * 1024 * 1024
+
+    def __init__(self, path: str, background: bool = True):
+        self.path = path
+        self.by_flat: Dict[str, int] = {}
+        self._by_original: Optional[Dict[str, int]] = None
+        self._bounds = array('q')   # 行 i は _bounds[i] から _bounds[i + 1] まで
+        self._cond = threading.Condition()
+        self._done = False
+        self._stop = False
+        self._error: Optional[BaseException] = None
+        self._file = open(path, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) \
+            if os.fstat(self._file.fileno()).st_size else None
+        header_end = self._mm.find(b'\n') + 1 if self._mm is not None else 0
+        if header_end:
+            self.fieldnames = next(csv.reader([self._mm[:header_end].decode('utf-8')]))
+        else:
+            self.fieldnames = []
+        self._flat_col = self.fieldnames.index('flattened_name') if 'flattened_name' in self.fieldnames else -1
+        self._bounds.append(header_end)
+        self._thread = None
+        if not header_end:
+            self._done = True
+        elif background:
+            self._thread = threading.Thread(target=self._build, daemon=True)
+            self._thread.start()
+        else:
+            self._build()
+
+    def _build(self):
+        try:
+            self._scan()
+        except BaseException as e:  # 呼び出し側のスレッドで送出し直す
+            self._error = e
+        with self._cond:
+            self._done = True
+            self._cond.notify_all()
+
+    def _scan(self):
+        mm, size = self._mm, len(self._mm)
+        pos = self._bounds[0]
+        chunk_size = self.CHUNK_SIZE
+        while pos < size and not self._stop:
+            data = mm[pos:pos + chunk_size]
+            cut = data.rfind(b'\n') + 1
+            if not cut:
+                if pos + chunk_size >= size:
+                    break  # 改行で終わらない末尾の行（書き込み途中で中断された行）は無視する
+                chunk_size *= 2
+                continue
+            bounds, keys = array('q'), []
+            start = 0
+            end = data.find(b'\n', 0, cut) + 1
+            while end:
+                record = data[start:end]
+                # 引用符で囲まれた値に改行を含む行は、引用符の数が偶数になるまで次の行とつなぐ
+                while record.count(b'"') % 2 and end < cut:
+                    end = data.find(b'\n', end, cut) + 1
+                    record = data[start:end]
+                if record.count(b'"') % 2:
+                    break  # 続きは次のチャンクで読む
+                # 空行は行として数えない（次の行の先頭に含め、デコード時に読み飛ばす）
+                if record.strip():
+                    bounds.append(pos + end)
+                    keys.append(self._key_of(record))
+                start = end
+                end = data.find(b'\n', start, cut) + 1
+            if not start:
+                if pos + chunk_size >= size:
+                    break
+                chunk_size *= 2
+                continue
+            first = len(self._bounds) - 1
+            with self._cond:
+                for i, key in enumerate(keys):
+                    self.by_flat.setdefault(key, first + i)
+                self._bounds.extend(bounds)
+                self._cond.notify_all()
+            pos += start
+            chunk_size = self.CHUNK_SIZE
+
+    def _key_of(self, record: bytes) -> Optional[str]:
+        if self._flat_col < 0:
+            return None
+        if b'"' not in record:
+            values = record.rstrip(b'\r\n').split(b',')
+            return values[self._flat_col].decode('utf-8') if self._flat_col < len(values) else None
+        values = next(csv.reader(io.StringIO(record.decode('utf-8'), newline='')))
+        return values[self._flat_col] if self._flat_col < len(values) else None
+
+    def _row(self, i: int) -> Dict:
+        text = self._mm[self._bounds[i]:self._bounds[i + 1]].decode('utf-8').lstrip('\r\n')
+        if '"' in text:
+            values = next(csv.reader(io.StringIO(text, newline='')))
+        else:
+            values = text.rstrip('\r\n').split(',')
+        row = dict(zip(self.fieldnames, values))
+        for name in self.fieldnames[len(values):]:
+            row[name] = None  # csv.DictReader と同じく、足りない列は None
+        return row
+
+    def wait(self):
+        """
+        索引が完成するまで待つ
+        """
+        with self._cond:
+            while not self._done:
+                self._cond.wait()
+        if self._error is not None:
+            raise self._error
+
+    @property
+    def ready(self) -> bool:
+        return self._done
+
+    def find_flat(self, flattened_name: str) -> Optional[Dict]:
+        i = self.by_flat.get(flattened_name)
+        if i is None and not self._done:
+            self.wait()
+            i = self.by_flat.get(flattened_name)
+        return self._row(i) if i is not None else None
+
+    def find_original(self, original_path: str) -> Optional[Dict]:
+        if self._by_original is None:
+            by_original = {}
+            for i, row in enumerate(self):
+                by_original.setdefault(row.get('original_path'), i)
+            self._by_original = by_original
+        i = self._by_original.get(original_path)
+        return self._row(i) if i is not None else None
+
+    def get_original(self, flattened_name: str) -> Optional[str]:
+        row = self.find_flat(flattened_name)
+        return row['original_path'] if row else None
+
+    def get_flattened(self, original_path: str) -> Optional[str]:
+        row = self.find_original(original_path)
+        return row['flattened_name'] if row else None
+
+    def iter_prefix(self, folder: str) -> Iterator[Dict]:
+        prefix = folder.rstrip('/\\') + os.sep
+        return (row for row in self if (row.get('original_path') or '').startswith(prefix))
+
+    def close(self):
+        self._stop = True
+        if self._thread is not None:
+            self._thread.join()
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        self._file.close()
+
+    def __len__(self) -> int:
+        self.wait()
+        return len(self._bounds) - 1
+
+    def __bool__(self) -> bool:
+        # 行が1つあるか分かれば十分なので、索引の完成（__len__）は待たない
+        with self._cond:
+            while len(self._bounds) <= 1 and not self._done:
+                self._cond.wait()
+            return len(self._bounds) > 1
+
+    def __iter__(self) -> Iterator[Dict]:
+        i = 0
+        while True:
+            with self._cond:
+                while len(self._bounds) - 1 <= i and not self._done:
+                    self._cond.wait()
+            if len(self._bounds) - 1 <= i:
+                if self._error is not None:
+                    raise self._error
+                return
+            yield self._row(i)
+            i += 1
+
+    def __contains__(self, flattened_name) -> bool:
+        return self.find_flat(flattened_name) is not None
+
+    @property
+    def rows(self) -> Iterator[Dict]:
+        return iter(self)
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+class SQLiteFileMapWriter:
+    """
+    filemap を SQLite に追記するストリーミングライタ（FileMapWriter と同じ使い方）
+    - 行は flush_rows 行ごと、または flush_interval 秒ごとに executemany でまとめて挿入してコミットする
+    - 新規作成時は一時ファイルに書き込み、close() で索引を作ってから置き換える
+      （書き込み中も前回のfilemapを読み続けられる。中断しても前回のfilemapは壊れない）
+    - append=True なら既存のファイルにそのまま追記する（足りない列は追加する）
+    """
+    def __init__(self, path: str, fieldnames: Optional[List[str]] = None, *,
+                 append: bool = False,
+                 flush_rows: int = 1000,
+                 flush_interval: float = 1.0):
+        self.path = path
+        self.fieldnames = list(fieldnames or FILEMAP_FIELDS)
+        self.flush_rows = max(1, flush_rows)
+        self.flush_interval = flush_interval
+        self.count = 0
+        self._append = append and os.path.exists(path)
+        self._tmp_path = path if self._append else path + '.part'
+        if not self._append and os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+        import sqlite3  # SQLite 形式を使うときだけ読み込む（起動を速くするため）
+        self._conn = sqlite3.connect(self._tmp_path)
+        self._conn.execute("PRAGMA synchronous=OFF" if not self._append else "PRAGMA synchronous=NORMAL")
+        columns = ', '.join(f"{_quote(f)} TEXT" for f in self.fieldnames)
+        self._conn.execute(f"CREATE TABLE IF NOT EXISTS filemap (id INTEGER PRIMARY KEY, {columns})")
+        existing = {r[1] for r in self._conn.execute("PRAGMA table_info(filemap)")}
+        for f in self.fieldnames:
+            if f not in existing:
+                self._conn.execute(f"ALTER TABLE filemap ADD COLUMN {_quote(f)} TEXT")
+        self._insert = (f"INSERT INTO filemap ({', '.join(_quote(f) for f in self.fieldnames)}) "
+                        f"VALUES ({', '.join('?' for _ in self.fieldnames)})")
+        self._pending = []
+        self._last_flush = time.monotonic()
+        self._closed = False
+
+    def write(self, row: Dict):
+        self._pending.append(tuple(row.get(f) or '' for f in self.fieldnames))
+        self.count += 1
+        if len(self._pending) >= self.flush_rows or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if self._pending:
+            self._conn.executemany(self._insert, self._pending)
+            self._pending = []
+        self._conn.commit()
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self.flush()
+        # 索引は挿入後にまとめて作る（行ごとの索引更新より速い）
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_filemap_flat ON filemap (flattened_name)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_filemap_original ON filemap (original_path)")
+        self._conn.commit()
+        self._conn.close()
+        if self._tmp_path != self.path:
+            os.replace(self._tmp_path, self.path)
+
+    def abort(self):
+        """
+        書き込みを中止する（新規作成時は一時ファイルを捨て、前回のfilemapをそのまま残す。追記時は書いた分まで残す）
+        """
+        if self._closed:
+            return
+        self._closed = True
+        if self._tmp_path == self.path:
+            self.flush()
+        self._conn.close()
+        if self._tmp_path != self.path:
+            try:
+                os.remove(self._tmp_path)
+            except FileNotFoundError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # 例外で抜けたときは途中までの一時ファイルで前回のfilemapを置き換えない
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+
+class SQLiteFileMapIndex:
+    """
+    SQLite の filemap を全件読み込まずに引く索引（FileMapIndex と同じ使い方）
+    - フラット名・元パスの検索は索引を使った1件検索（同じキーが複数ある場合は先頭の行）
+    - iter_prefix(folder) は元パスの範囲検索（folder配下の行を索引順に返す）
+    - 反復は挿入順に1行ずつ読み出す
+    """
+    def __init__(self, path: str):
+        self.path = path
+        import sqlite3
+        from pathlib import Path
+        # URI はパスを % エスケープして作る（'#'・'?'・'%' を含むフォルダ名でも別のファイルを開かない）
+        uri = Path(path).resolve().as_uri() + "?mode=ro"
+        self._conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        self.fieldnames = [r[1] for r in self._conn.execute("PRAGMA table_info(filemap)") if r[1] != 'id']
+        self._columns = ', '.join(_quote(f) for f in self.fieldnames)
+
+    def _one(self, column: str, value: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {self._columns} FROM filemap WHERE {column} = ? ORDER BY id LIMIT 1", (value,)).fetchone()
+        return dict(row) if row else None
+
+    def find_flat(self, flattened_name: str) -> Optional[Dict]:
+        return self._one('flattened_name', flattened_name)
+
+    def find_original(self, original_path: str) -> Optional[Dict]:
+        return self._one('original_path', original_path)
+
+    def get_original(self, flattened_name: str) -> Optional[str]:
+        row = self.find_flat(flattened_name)
+        return row['original_path'] if row else None
+
+    def get_flattened(self, original_path: str) -> Optional[str]:
+        row = self.find_original(original_path)
+        return row['flattened_name'] if row else None
+
+    def _iter(self, sql: str, params=()) -> Iterator[Dict]:
+        # 反復中も他の検索ができるよう、反復ごとに別カーソルで少しずつ読む
+        with self._lock:
+            cursor = self._conn.execute(sql, params)
+        while True:
+            with self._lock:
+                rows = cursor.fetchmany(1000)
+            if not rows:
+                return
+            for row in rows:
+                yield dict(row)
+
+    def iter_prefix(self, folder: str) -> Iterator[Dict]:
+        prefix = folder.rstrip('/\\') + os.sep
+        # prefix で始まる文字列は [prefix, prefixの最後の文字+1) の範囲に収まる
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        return self._iter(f"SELECT {self._columns} FROM filemap WHERE original_path >= ? AND original_path < ? "
+                          f"ORDER BY original_path", (prefix, upper))
+
+    def close(self):
+        self._conn.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM filemap").fetchone()[0]
+
+    def __bool__(self) -> bool:
+        # 件数（全行の走査）ではなく、1行あるかだけを調べる
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM filemap LIMIT 1").fetchone() is not None
+
+    def __iter__(self) -> Iterator[Dict]:
+        return self._iter(f"SELECT {self._columns} FROM filemap ORDER BY id")
+
+    def __contains__(self, flattened_name) -> bool:
+        return self.find_flat(flattened_name) is not None
+
+    @property
+    def rows(self) -> Iterator[Dict]:
+        return iter(self)
+
 
 class FileMap:
     @staticmethod
     def save_csv(filemap: List[Dict], path: str):
         with open(path, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=["original_path", "flattened_name"])
+            writer = csv.DictWriter(f, fieldnames=FILEMAP_FIELDS)
             writer.writeheader()
             for row in filemap:
                 writer.writerow(row)
@@ -19,11 +531,65 @@ class FileMap:
 
     @staticmethod
     def load_csv(path: str) -> List[Dict]:
-        with open(path, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
+        with open(path, 'r', newline='', encoding='utf-8') as f:
+            reader = csv.DictReader(_complete_lines(f))
             return [row for row in reader]
 
     @staticmethod
     def load_json(path: str) -> List[Dict]:
         with open(path, 'r', encoding='utf-8') as f:
             return json.load(f)
+
+    @staticmethod
+    def is_sqlite(path: str) -> bool:
+        return path.lower().endswith(SQLITE_EXTS)
+
+    @staticmethod
+    def load_index(path: str, lazy: bool = False):
+        """
+        filemap（.csv / .json / .db）を読み込み、索引付きで返す
+        .db（SQLite）は全件を読み込まず、検索のたびにファイルを引く
+        lazy=True なら .csv もメモリマップして行位置の索引だけを作る（LazyCSVFileMapIndex。
+        すぐに返り、索引はバックグラウンドで作る。使い終わったら close() する）
+        """
+        if FileMap.is_sqlite(path):
+            return SQLiteFileMapIndex(path)
+        if path.lower().endswith('.json'):
+            return FileMapIndex(FileMap.load_json(path))
+        if lazy:
+            return LazyCSVFileMapIndex(path)
+        return FileMapIndex(FileMap.load_csv(path))
+
+    @staticmethod
+    def open_writer(path: str, fieldnames: Optional[List[str]] = None, **kwargs):
+        """
+        拡張子に応じたストリーミングライタを返す（.db → SQLite、それ以外 → CSV）
+        """
+        if FileMap.is_sqlite(path):
+            kwargs.pop('fsync', None)
+            return SQLiteFileMapWriter(path, fieldnames, **kwargs)
+        return FileMapWriter(path, fieldnames, **kwargs)
+
+    @staticmethod
+    def convert(src_path: str, dst_path: str) -> int:
+        """
+        filemap を別の形式に変換する（.csv / .json / .db の相互変換）。変換した行数を返す
+        """
+        if os.path.abspath(src_path) == os.path.abspath(dst_path):
+            raise ValueError(f"変換元と変換先が同じファイルです: {src_path}")
+        index = FileMap.load_index(src_path, lazy=True)
+        try:
+            if dst_path.lower().endswith('.json'):
+                rows = list(index)
+                FileMap.save_json(rows, dst_path)
+                return len(rows)
+            fieldnames = list(getattr(index, 'fieldnames', None) or [])
+            if not fieldnames:
+                for row in index:
+                    fieldnames.extend(k for k in row if k not in fieldnames)
+            with FileMap.open_writer(dst_path, fieldnames or FILEMAP_FIELDS) as writer:
+                for row in index:
+                    writer.write(row)
+                return writer.count
+        finally:
+            index.close()
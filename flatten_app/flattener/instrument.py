@@ -0,0 +1,204 @@
+# 実行の計測（段階ごとの時間・ファイルごとの処理時間の分布・スループット・操作/エラー件数）
+import json
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+# 処理時間の分布のバケット: 2のべき乗マイクロ秒（1µs〜約1時間）
+_BUCKETS = 32
+
+
+class LatencyHistogram:
+    """
+    処理時間の分布（対数バケット）。件数・合計・最小・最大と、バケットからの近似パーセンタイルを持つ
+    """
+    def __init__(self):
+        self.buckets = [0] * _BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def add(self, seconds: float):
+        micros = seconds * 1e6
+        b = min(_BUCKETS - 1, max(0, math.frexp(micros)[1])) if micros >= 1 else 0
+        self.buckets[b] += 1
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if self.max is None or seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, p: float) -> Optional[float]:
+        """
+        p（0〜100）パーセンタイルの近似値（バケットの上限。秒）
+        """
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(self.count * p / 100))
+        seen = 0
+        for b, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank:
+                return min(self.max, (2 ** b) / 1e6)
+        return self.max
+
+    def to_dict(self) -> Dict:
+        return {
+            'count': self.count,
+            'total_seconds': self.total,
+            'mean_seconds': self.total / self.count if self.count else None,
+            'min_seconds': self.min,
+            'max_seconds': self.max,
+            'p50_seconds': self.percentile(50),
+            'p90_seconds': self.percentile(90),
+            'p99_seconds': self.percentile(99),
+            # バケット i は [2^(i-1), 2^i) マイクロ秒（0件のバケットは省略）
+            'buckets_us': {str(2 ** b): n for b, n in enumerate(self.buckets) if n},
+        }
+
+
+class Instrument:
+    """
+    FlattenEngine / RestoreEngine / VerifyEngine の1回の実行を計測する（スレッドセーフ）
+    - stage(name): 段階の経過時間を加算するコンテキストマネージャ（'scan', 'zip', 'copy', 'filemap' など）
+    - observe(name, seconds, nbytes): 1ファイルの処理時間とバイト数（分布とスループットに集計）
+      add_bytes(name, nbytes): バイト数だけを加算する（処理時間はワーカー、サイズは集約側で分かる場合）
+    - count(name) / error(name): 操作（stat・コピー・mkdir など）とエラーの件数
+    - callback(name, fn): ログ・進捗通知のコールバックに掛かった時間を 'callback:名前' の段階として計る
+    - profile=True ならワーカースレッドの処理（call() で実行したもの）と profile_call() を cProfile で計測する
+    report() で結果をJSONにできるdictで返し、write_report() / dump_profile() でファイルに書き出す
+    """
+    def __init__(self, profile: bool = False):
+        self.started = time.time()
+        self._t0 = time.perf_counter()
+        self._lock = threading.Lock()
+        self.stages: Dict[str, Dict] = {}
+        self.latency: Dict[str, LatencyHistogram] = {}
+        self.bytes: Dict[str, int] = {}
+        self.counters: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        self.profile = profile
+        self._profiles: List = []  # cProfile.Profile（profile=True のときだけ cProfile を読み込む）
+        self._local = threading.local()
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage(name, time.perf_counter() - start)
+
+    def add_stage(self, name: str, seconds: float):
+        with self._lock:
+            stage = self.stages.setdefault(name, {'seconds': 0.0, 'calls': 0})
+            stage['seconds'] += seconds
+            stage['calls'] += 1
+
+    def observe(self, name: str, seconds: float, nbytes: int = 0):
+        with self._lock:
+            hist = self.latency.get(name)
+            if hist is None:
+                hist = self.latency[name] = LatencyHistogram()
+            hist.add(seconds)
+            if nbytes and nbytes > 0:
+                self.bytes[name] = self.bytes.get(name, 0) + nbytes
+
+    def add_bytes(self, name: str, nbytes: int):
+        if nbytes and nbytes > 0:
+            with self._lock:
+                self.bytes[name] = self.bytes.get(name, 0) + nbytes
+
+    def count(self, name: str, n: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def error(self, name: str, n: int = 1):
+        with self._lock:
+            self.errors[name] = self.errors.get(name, 0) + n
+
+    def callback(self, name: str, fn: Callable) -> Callable:
+        stage = 'callback:' + name
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.add_stage(stage, time.perf_counter() - start)
+        return timed
+
+    def _profiler(self):
+        # スレッドごとに1つ（cProfile はスレッドをまたいで計測できない）
+        prof = getattr(self._local, 'profiler', None)
+        if prof is None:
+            import cProfile
+            prof = self._local.profiler = cProfile.Profile()
+            with self._lock:
+                self._profiles.append(prof)
+        return prof
+
+    def call(self, fn: Callable, *args):
+        """
+        fn(*args) を実行する（profile=True ならこのスレッドのプロファイラで計測。計測中のスレッドでは入れ子にしない）
+        """
+        if not self.profile or getattr(self._local, 'active', False):
+            return fn(*args)
+        self._local.active = True
+        try:
+            return self._profiler().runcall(fn, *args)
+        finally:
+            self._local.active = False
+
+    def profile_call(self, fn: Callable, *args):
+        """
+        メインスレッドの処理（エンジンの run() など）を計測する。profile=False なら fn(*args) を呼ぶだけ
+        """
+        return self.call(fn, *args)
+
+    def report(self) -> Dict:
+        wall = time.perf_counter() - self._t0
+        with self._lock:
+            stages = {k: dict(v) for k, v in self.stages.items()}
+            throughput = {}
+            for name, nbytes in self.bytes.items():
+                # スループットは同名の段階の経過時間（なければ実行全体の時間）あたりのバイト数
+                seconds = stages.get(name, {}).get('seconds') or wall
+                throughput[name] = {'bytes': nbytes, 'seconds': seconds,
+                                    'mb_per_sec': nbytes / (1024 * 1024) / seconds if seconds else None}
+            return {
+                'started': self.started,
+                'wall_seconds': wall,
+                'stages': stages,
+                'latency': {k: v.to_dict() for k, v in self.latency.items()},
+                'throughput': throughput,
+                'counters': dict(self.counters),
+                'errors': dict(self.errors),
+            }
+
+    def write_report(self, path: str, extra: Optional[Dict] = None) -> Dict:
+        report = self.report()
+        if extra:
+            report.update(extra)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        return report
+
+    def dump_profile(self, path: str) -> bool:
+        """
+        全スレッドの計測結果をまとめて pstats 形式で保存する（計測していなければ False）
+        """
+        with self._lock:
+            profiles = [p for p in self._profiles if p.getstats()]
+        if not profiles:
+            return False
+        import pstats
+        stats = pstats.Stats(profiles[0])
+        for p in profiles[1:]:
+            stats.add(p)
+        stats.dump_stats(path)
+        return True
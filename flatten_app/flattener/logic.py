@@ -5,7 +5,7 @@ def restore_flattened_filename(flatname: str, *,
                                esc_seq: str = None) -> str:
     """
     フラット化ファイル名から元の相対パスを復元
-    - flatten_filename() の逆変換
+    - flatten_filename() の逆変換（NameCodec.decode）
     """
     # デフォルト値をグローバル定数から取得
     if pathsep is None:
@@ -14,68 +14,200 @@ def restore_flattened_filename(flatname: str, *,
         pathsep_esc = FLAT_PATHSEP_ESC
     if esc_seq is None:
         esc_seq = FLAT_ESCAPE_SEQ
-    # 区切りを一時的にユニークなトークンに
-    tmp = flatname.replace(pathsep, '\0')
-    # エスケープを戻す
-    tmp = tmp.replace(esc_seq + '_ESC', esc_seq)  # エスケープ文字列自体
-    tmp = tmp.replace(esc_seq, pathsep_esc)
-    tmp = tmp.replace(pathsep_esc, pathsep)
-    # 区切りをパス区切りに戻す
-    restored = tmp.replace('\0', os.sep)
-    return restored
+    return get_codec(pathsep, pathsep_esc, esc_seq).decode(flatname)
+import fnmatch
 import os
-import urllib.parse
-from pathlib import Path
-from typing import List, Dict, Optional
+import re
+from typing import List, Dict, Iterable, Iterator, Optional
+
+from .namecodec import FLAT_ESCAPE_SEQ, FLAT_PATHSEP, FLAT_PATHSEP_ESC, get_codec
+from .pathindex import PathPrefixIndex
+from .scanresult import ScanResult
 
 EXCLUDE_PATTERNS = [
     'Thumbs.db', '.DS_Store', '.tmp', '.swp', '~$', 'desktop.ini'
 ]
+_GLOB_CHARS = set('*?[')
+
+
+def _compile_names(substrings: Iterable[str], globs: Iterable[str]):
+    """
+    部分一致パターンと glob を1つの正規表現にまとめる（該当なしなら None）
+    """
+    parts = [re.escape(p) for p in substrings if p]
+    parts += [r'\A(?i:' + fnmatch.translate(g) + ')' for g in globs if g]
+    return re.compile('|'.join(parts)) if parts else None
+
+
+class ExcludeFilter:
+    """
+    除外判定をまとめて前処理したフィルタ（1回の実行で1回だけ作り、スキャン・統計・コピーで共用する）
+    - exts: 除外拡張子（'.tmp' 形式の frozenset で判定）
+    - name_patterns: ファイル名の部分一致パターン（EXCLUDE_PATTERNS と同じ意味）
+    - name_globs: ファイル名の glob（'*.bak' など、大文字小文字を区別しない）
+    - dir_globs: フォルダ名の glob。一致したフォルダはスキャン時に中へ入らない
+    """
+    def __init__(self, exts: Iterable[str] = (),
+                 name_patterns: Iterable[str] = (),
+                 name_globs: Iterable[str] = (),
+                 dir_globs: Iterable[str] = ()):
+        self.exts = frozenset('.' + e.strip().lstrip('.').lower() for e in exts if e.strip())
+        self.name_patterns = tuple(name_patterns)
+        self.name_globs = tuple(name_globs)
+        self.dir_globs = tuple(dir_globs)
+        self._name_re = _compile_names(self.name_patterns, self.name_globs)
+        self._dir_re = _compile_names((), self.dir_globs)
+        self.key = (self.exts, self.name_patterns, self.name_globs, self.dir_globs)
+
+    @classmethod
+    def from_lines(cls, lines: Iterable[str], name_patterns: Iterable[str] = ()) -> 'ExcludeFilter':
+        """
+        GUIの除外欄・CLIの --exclude-ext の指定から作る
+        - 'node_modules/' のように / で終わる指定 → フォルダ名の glob（走査しない）
+        - '*' '?' '[' を含む指定 → ファイル名の glob
+        - それ以外 → 拡張子（'.tmp' / 'tmp'）
+        """
+        exts, globs, dirs = [], [], []
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            if line.endswith(('/', '\\')):
+                dirs.append(line.rstrip('/\\'))
+            elif _GLOB_CHARS & set(line):
+                globs.append(line)
+            else:
+                exts.append(line)
+        return cls(exts, name_patterns, globs, dirs)
+
+    def excludes_ext(self, ext: str) -> bool:
+        return bool(ext) and ext.lower() in self.exts
+
+    def excludes_name(self, name: str) -> bool:
+        return self._name_re is not None and self._name_re.search(name) is not None
+
+    def is_excluded(self, name: str) -> bool:
+        return self.excludes_name(name) or self.excludes_ext(os.path.splitext(name)[1])
+
+    def prunes_dir(self, name: str) -> bool:
+        return self._dir_re is not None and self._dir_re.search(name) is not None
+
 
 class DirectoryScanner:
     """
     ディレクトリを再帰的にスキャンし、ファイル・フォルダ構成を取得する
     除外ファイルもフィルタリング
+    - exclude_filter: 除外フィルタ（省略時は exclude_patterns の部分一致だけで除外）
+      ファイル名パターンに一致するファイルは結果に含めず、フォルダglobに一致するフォルダは走査しない
+    - prune_paths: 中を走査しないフォルダの相対パス（ZIP化・除外対象など。フォルダ自身は結果に含める）
     """
-    def __init__(self, root: Path, exclude_patterns: Optional[List[str]] = None):
-        self.root = Path(root)
+    def __init__(self, root: str, exclude_patterns: Optional[List[str]] = None,
+                 exclude_filter: Optional[ExcludeFilter] = None,
+                 prune_paths: Optional[Iterable[str]] = None):
+        self.root = os.fspath(root)  # pathlib は起動時に読み込まない（urllib.parse などを伴うため）
         self.exclude_patterns = exclude_patterns or EXCLUDE_PATTERNS
+        if exclude_filter is None:
+            exclude_filter = ExcludeFilter(name_patterns=self.exclude_patterns)
+        self.exclude_filter = exclude_filter
+        if prune_paths is not None and not isinstance(prune_paths, PathPrefixIndex):
+            prune_paths = PathPrefixIndex(prune_paths)
+        self.prune_paths = prune_paths or None
 
     def is_excluded(self, name: str) -> bool:
-        for pat in self.exclude_patterns:
-            if pat in name:
-                return True
-        return False
+        return self.exclude_filter.excludes_name(name)
 
-    def scan(self) -> List[Dict]:
+    def _iter_entries(self) -> Iterator[tuple]:
         """
-        ディレクトリ配下の全ファイル・フォルダ情報をリストで返す
-        各要素: {'relpath': str, 'is_dir': bool, 'name': str, 'ext': str, 'size': int}
+        os.scandir でディレクトリ配下を1回だけ走査し、(親フォルダの相対パス, 名前, フォルダか, サイズ, 更新時刻) を返す
+        - 並び順は os.walk（トップダウン）と同じ: フォルダ → その直下のファイル → サブフォルダ
+        - サイズ・更新時刻は DirEntry のstat情報を使う（ファイルごとの追加statなし）
         """
-        result = []
-        for dirpath, dirnames, filenames in os.walk(self.root):
-            rel_dir = os.path.relpath(dirpath, self.root)
-            # フォルダ
-            if rel_dir != '.':
-                result.append({'relpath': rel_dir, 'is_dir': True, 'name': os.path.basename(dirpath)})
-            # ファイル
-            for fname in filenames:
-                if self.is_excluded(fname):
+        stack = [('', os.fspath(self.root), '', '')]
+        while stack:
+            rel_dir, abs_dir, parent_dir, dir_name = stack.pop()
+            if rel_dir:
+                yield parent_dir, dir_name, True, 0, None
+                if self.prune_paths is not None and rel_dir in self.prune_paths:
                     continue
-                rel_file = os.path.normpath(os.path.join(rel_dir, fname)) if rel_dir != '.' else fname
-                ext = os.path.splitext(fname)[1].lower()
-                try:
-                    size = os.path.getsize(os.path.join(dirpath, fname))
-                except Exception:
-                    size = -1
-                result.append({'relpath': rel_file, 'is_dir': False, 'name': fname, 'ext': ext, 'size': size})
+            try:
+                it = os.scandir(abs_dir)
+            except OSError:
+                continue
+            subdirs = []
+            with it:
+                for entry in it:
+                    name = entry.name
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        is_dir = False
+                    if is_dir:
+                        # os.walk(followlinks=False) と同様、シンボリックリンクのフォルダは辿らない
+                        if not entry.is_symlink() and not self.exclude_filter.prunes_dir(name):
+                            subdirs.append((os.path.join(rel_dir, name) if rel_dir else name, entry.path, rel_dir, name))
+                        continue
+                    if self.exclude_filter.excludes_name(name):
+                        continue
+                    try:
+                        st = entry.stat()
+                        size, mtime = st.st_size, st.st_mtime
+                    except OSError:
+                        size, mtime = -1, None
+                    yield rel_dir, name, False, size, mtime
+            stack.extend(reversed(subdirs))
+
+    def iter_scan(self) -> Iterator[Dict]:
+        """
+        ディレクトリ配下の要素を走査順に1件ずつdictで返す（全件をメモリに持たない）
+        """
+        for rel_dir, name, is_dir, size, mtime in self._iter_entries():
+            relpath = os.path.join(rel_dir, name) if rel_dir else name
+            if is_dir:
+                yield {'relpath': relpath, 'is_dir': True, 'name': name}
+            else:
+                yield {'relpath': relpath, 'is_dir': False, 'name': name,
+                       'ext': os.path.splitext(name)[1].lower(), 'size': size, 'mtime': mtime}
+
+    def scan(self) -> ScanResult:
+        """
+        ディレクトリ配下の全ファイル・フォルダ情報を返す（列指向の ScanResult。list of dict としても使える）
+        各要素: {'relpath': str, 'is_dir': bool, 'name': str, 'ext': str, 'size': int, 'mtime': float}
+        """
+        result = ScanResult()
+        add_dir, add_file = result.add_dir, result.add_file
+        for rel_dir, name, is_dir, size, mtime in self._iter_entries():
+            if is_dir:
+                add_dir(rel_dir, name)
+            else:
+                add_file(rel_dir, name, size, mtime)
         return result
 
+    # 直近のスキャン結果（1件のみ保持）: (root, 除外パターン) -> 結果
+    _cache_key = None
+    _cache_items = None
+
+    @classmethod
+    def cached_scan(cls, root: str, exclude_patterns: Optional[List[str]] = None, refresh: bool = False,
+                    exclude_filter: Optional[ExcludeFilter] = None) -> ScanResult:
+        """
+        同じフォルダの直近のスキャン結果を再利用する（refresh=True で必ず再スキャン）
+        スキャン→統計→フラット化の一連の処理でディスク走査を1回に抑えるために使う
+        結果はフォルダの変更を追跡しないので、一連の処理が終わったら clear_cache() で消去する
+        """
+        scanner = cls(root, exclude_patterns, exclude_filter)
+        key = (os.path.abspath(os.fspath(scanner.root)), scanner.exclude_filter.key)
+        if refresh or cls._cache_key != key or cls._cache_items is None:
+            cls._cache_items = scanner.scan()
+            cls._cache_key = key
+        return cls._cache_items
+
+    @classmethod
+    def clear_cache(cls):
+        cls._cache_key = None
+        cls._cache_items = None
+
 
-# --- フラット化・復元用エスケープ設定 ---
-FLAT_ESCAPE_SEQ = '___UNDERSCORE___'  # エスケープ用文字列（デフォルト）
-FLAT_PATHSEP = '__'                   # パス区切り（デフォルト: ダブルアンダースコア）
-FLAT_PATHSEP_ESC = '___'              # 区切りのエスケープ（デフォルト: トリプルアンダースコア）
+# --- フラット化・復元用エスケープ設定（FLAT_ESCAPE_SEQ / FLAT_PATHSEP / FLAT_PATHSEP_ESC は namecodec.py） ---
 
 def flatten_filename(relpath: str, *,
                      pathsep: str = FLAT_PATHSEP,
@@ -87,9 +219,6 @@ def flatten_filename(relpath: str, *,
     - 元の pathsep は pathsep_esc（例: '___'）にエスケープ
     - 元の pathsep_esc は esc_seq（例: '___UNDERSCORE___'）に一時エスケープ
     - 日本語や記号はエンコードしない
+    変換は NameCodec.encode（1パス・設定ごとに共用のキャッシュ付き）
     """
-    relpath = relpath.replace(esc_seq, esc_seq + '_ESC')  # エスケープ文字列自体の衝突回避
-    relpath = relpath.replace(pathsep_esc, esc_seq)       # まず pathsep_esc をエスケープ
-    relpath = relpath.replace(pathsep, pathsep_esc)       # 次に pathsep をエスケープ
-    relpath = relpath.replace('\\', pathsep).replace('/', pathsep)  # パス区切りを pathsep に
-    return relpath
+    return get_codec(pathsep, pathsep_esc, esc_seq).encode(relpath)
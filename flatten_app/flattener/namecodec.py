@@ -0,0 +1,121 @@
+# フラット名の変換（相対パス ⇔ フラットなファイル名）
+import os
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, List, Tuple
+
+# --- フラット化・復元用エスケープ設定（デフォルト） ---
+FLAT_ESCAPE_SEQ = '___UNDERSCORE___'  # エスケープ用文字列
+FLAT_PATHSEP = '__'                   # パス区切り（ダブルアンダースコア）
+FLAT_PATHSEP_ESC = '___'              # 区切りのエスケープ（トリプルアンダースコア）
+ESC_SUFFIX = '_ESC'                   # エスケープ文字列自体のエスケープに付ける接尾辞
+
+DEFAULT_CACHE_SIZE = 65536
+
+
+def _token_re(tokens: Iterable[str]):
+    # 長いトークンを先に並べ、各位置で最長一致させる（split でトークンも残すようにグループで囲む）
+    return re.compile('(' + '|'.join(re.escape(t) for t in sorted(set(tokens), key=len, reverse=True)) + ')')
+
+
+def _substitute(pattern, table: Dict[str, str], text: str) -> str:
+    # split の結果は [文字列, トークン, 文字列, トークン, ...] なので奇数番目だけを置き換える
+    parts = pattern.split(text)
+    parts[1::2] = map(table.__getitem__, parts[1::2])
+    return ''.join(parts)
+
+
+class NameCodec:
+    """
+    相対パスとフラット名の相互変換。区切り・エスケープの設定ごとに1回作って使い回す
+    - encode: エスケープ文字列 → エスケープ文字列+'_ESC'、pathsep_esc → esc_seq、pathsep → pathsep_esc、
+              パス区切り（/ と \\）→ pathsep
+    - decode: encode の逆変換（パス区切りは os.sep）
+    どちらも各位置で最長一致するトークンを1回だけ置き換える1パスの変換で、置き換えた結果を
+    再び置き換えることはない。エスケープが必要なトークンを含まない名前（大半の名前）は
+    正規表現を使わず、パス区切りの str.replace だけで変換する
+    cache_size: 変換結果をキャッシュする件数の上限（0 でキャッシュしない）
+    """
+    def __init__(self, pathsep: str = FLAT_PATHSEP,
+                 pathsep_esc: str = FLAT_PATHSEP_ESC,
+                 esc_seq: str = FLAT_ESCAPE_SEQ, *,
+                 sep: str = os.sep,
+                 cache_size: int = DEFAULT_CACHE_SIZE):
+        if not pathsep or not pathsep_esc or not esc_seq:
+            raise ValueError("区切り・エスケープ文字列は空にできません")
+        self.pathsep = pathsep
+        self.pathsep_esc = pathsep_esc
+        self.esc_seq = esc_seq
+        self.sep = sep
+        escaped_esc = esc_seq + ESC_SUFFIX
+        self._encode_map: Dict[str, str] = {esc_seq: escaped_esc, pathsep_esc: esc_seq, pathsep: pathsep_esc,
+                                            '/': pathsep, '\\': pathsep}
+        self._decode_map: Dict[str, str] = {escaped_esc: esc_seq, esc_seq: pathsep_esc,
+                                            pathsep_esc: pathsep, pathsep: sep}
+        self._encode_re = _token_re(self._encode_map)
+        self._decode_re = _token_re(self._decode_map)
+        # これらを含まなければ、パス区切りの置き換えだけで済む
+        self._encode_tokens = (esc_seq, pathsep_esc, pathsep)
+        self._decode_tokens = (esc_seq, pathsep_esc)
+        if cache_size:
+            self.encode = lru_cache(maxsize=cache_size)(self._encode)
+            self.decode = lru_cache(maxsize=cache_size)(self._decode)
+        else:
+            self.encode = self._encode
+            self.decode = self._decode
+
+    def _encode(self, relpath: str) -> str:
+        for token in self._encode_tokens:
+            if token in relpath:
+                break
+        else:
+            relpath = relpath.replace('/', self.pathsep)
+            return relpath.replace('\\', self.pathsep) if '\\' in relpath else relpath
+        return _substitute(self._encode_re, self._encode_map, relpath)
+
+    def _decode(self, flatname: str) -> str:
+        for token in self._decode_tokens:
+            if token in flatname:
+                break
+        else:
+            return flatname.replace(self.pathsep, self.sep)
+        return _substitute(self._decode_re, self._decode_map, flatname)
+
+    def encode_many(self, relpaths: Iterable[str]) -> List[str]:
+        """
+        まとめて変換する（スキャン結果の相対パス列など）。結果は入力と同じ順
+        """
+        encode = self._encode
+        return [encode(p) for p in relpaths]
+
+    def decode_many(self, flatnames: Iterable[str]) -> List[str]:
+        decode = self._decode
+        return [decode(n) for n in flatnames]
+
+    def verify_roundtrip(self, relpaths: Iterable[str]) -> List[Tuple[str, str, str]]:
+        """
+        変換して戻すと元の相対パスにならないものを (相対パス, フラット名, 復元結果) のリストで返す（空なら全件一致）
+        例: 'a_/b' と 'a__b' はどちらも 'a___b' になるので、ファイル名からは区別できない
+        """
+        failures = []
+        for relpath in relpaths:
+            flat = self._encode(relpath)
+            restored = self._decode(flat)
+            if restored != relpath.replace('/', self.sep).replace('\\', self.sep):
+                failures.append((relpath, flat, restored))
+        return failures
+
+    def cache_clear(self):
+        for f in (self.encode, self.decode):
+            if hasattr(f, 'cache_clear'):
+                f.cache_clear()
+
+
+@lru_cache(maxsize=16)
+def get_codec(pathsep: str = FLAT_PATHSEP,
+              pathsep_esc: str = FLAT_PATHSEP_ESC,
+              esc_seq: str = FLAT_ESCAPE_SEQ) -> NameCodec:
+    """
+    設定ごとに共用の NameCodec を返す
+    """
+    return NameCodec(pathsep, pathsep_esc, esc_seq)
@@ -0,0 +1,64 @@
+# 相対パスの前方一致（サブツリー）判定用インデックス
+import os
+from typing import Iterable, Iterator, Optional
+
+_END = None  # 登録済みパスの終端を表すキー（フォルダ名と衝突しない）
+
+
+def split_relpath(relpath: str):
+    """
+    相対パスをフォルダ名の列に分ける（'/' と os.sep のどちらの区切りも受け付ける）
+    """
+    if os.sep != '/':
+        relpath = relpath.replace('/', os.sep)
+    return [p for p in relpath.split(os.sep) if p and p != '.']
+
+
+class PathPrefixIndex:
+    """
+    ZIP化対象・除外対象フォルダの集合を、パス要素ごとのトライ木で保持する
+    - find(relpath): relpath 自身または祖先のうち、登録済みの最も浅いパスを返す（なければ None）
+    - relpath in index: relpath が登録済みフォルダのサブツリー内か
+    判定はパスの深さに比例する時間で済む（登録数に依存しない）
+    """
+    def __init__(self, paths: Iterable[str] = ()):
+        self._root = {}
+        self._count = 0
+        for p in paths:
+            self.add(p)
+
+    def add(self, relpath: str):
+        node = self._root
+        for part in split_relpath(relpath):
+            node = node.setdefault(part, {})
+        if _END not in node:
+            node[_END] = relpath
+            self._count += 1
+
+    def find(self, relpath: str) -> Optional[str]:
+        node = self._root
+        if _END in node:
+            return node[_END]
+        for part in split_relpath(relpath):
+            node = node.get(part)
+            if node is None:
+                return None
+            if _END in node:
+                return node[_END]
+        return None
+
+    def __contains__(self, relpath: str) -> bool:
+        return self._count > 0 and self.find(relpath) is not None
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __iter__(self) -> Iterator[str]:
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            for key, child in node.items():
+                if key is _END:
+                    yield child
+                else:
+                    stack.append(child)
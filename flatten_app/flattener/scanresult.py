@@ -0,0 +1,108 @@
+# スキャン結果の列指向コンテナ（要素ごとのdictを持たずに省メモリで保持する）
+import math
+import os
+from array import array
+from typing import Dict, Iterator, List, Optional
+
+_NAN = float('nan')
+
+
+class ScanResult:
+    """
+    DirectoryScanner.scan() の結果を列ごとに保持する
+    - dirs: フォルダの相対パス表（ID 0 はルート ""。同じフォルダのパス文字列は1回だけ持つ）
+    - parent: 各要素の親フォルダID / names: 要素名 / sizes, mtimes: サイズ・更新時刻 / is_dir: フォルダなら1
+    従来どおり list of dict としても使える（items[i] や for item in items で
+    {'relpath', 'is_dir', 'name', 'ext', 'size', 'mtime'} のdictをその場で組み立てて返す。読み取り専用）
+    """
+    def __init__(self):
+        self.dirs: List[str] = [""]
+        self.dir_ids: Dict[str, int] = {"": 0}
+        self.dir_parent = array('q', [-1])  # フォルダID → 親フォルダID
+        self.parent = array('q')
+        self.names: List[str] = []
+        self.sizes = array('q')
+        self.mtimes = array('d')             # 更新時刻が取れなかった要素は NaN
+        self.is_dir = bytearray()
+        self._last = (None, 0)
+
+    @classmethod
+    def from_items(cls, items) -> 'ScanResult':
+        """
+        list of dict 形式のスキャン結果から作る（ScanResult ならそのまま返す）
+        """
+        if isinstance(items, cls):
+            return items
+        result = cls()
+        for item in items:
+            rel_dir, _, name = item['relpath'].rpartition(os.sep)
+            if item.get('is_dir'):
+                result.add_dir(rel_dir, name)
+            else:
+                result.add_file(rel_dir, name, item.get('size', -1), item.get('mtime'))
+        return result
+
+    def dir_id(self, relpath: str) -> int:
+        """
+        フォルダ表のIDを返す（未登録なら祖先から順に登録する。親のIDは必ず子より小さい）
+        """
+        d = self.dir_ids.get(relpath)
+        if d is None:
+            parent = self.dir_id(relpath.rpartition(os.sep)[0])
+            d = len(self.dirs)
+            self.dirs.append(relpath)
+            self.dir_ids[relpath] = d
+            self.dir_parent.append(parent)
+        return d
+
+    def _parent_id(self, rel_dir: str) -> int:
+        last_dir, d = self._last
+        if rel_dir != last_dir:
+            d = self.dir_id(rel_dir)
+            self._last = (rel_dir, d)
+        return d
+
+    def add_dir(self, rel_dir: str, name: str) -> int:
+        """
+        rel_dir 直下のフォルダ name を追加し、そのフォルダIDを返す
+        """
+        self.parent.append(self._parent_id(rel_dir))
+        self.names.append(name)
+        self.sizes.append(0)
+        self.mtimes.append(_NAN)
+        self.is_dir.append(1)
+        return self.dir_id(rel_dir + os.sep + name if rel_dir else name)
+
+    def add_file(self, rel_dir: str, name: str, size: int, mtime: Optional[float]):
+        self.parent.append(self._parent_id(rel_dir))
+        self.names.append(name)
+        self.sizes.append(size)
+        self.mtimes.append(_NAN if mtime is None else mtime)
+        self.is_dir.append(0)
+
+    def relpath(self, i: int) -> str:
+        d = self.dirs[self.parent[i]]
+        return d + os.sep + self.names[i] if d else self.names[i]
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __getitem__(self, i):
+        # スライスは従来の list of dict と同じく dict のリストを返す
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self.names)))]
+        if i < 0:
+            i += len(self.names)
+            if i < 0:
+                raise IndexError("ScanResult index out of range")
+        name = self.names[i]
+        if self.is_dir[i]:
+            return {'relpath': self.relpath(i), 'is_dir': True, 'name': name}
+        mtime = self.mtimes[i]
+        return {'relpath': self.relpath(i), 'is_dir': False, 'name': name,
+                'ext': os.path.splitext(name)[1].lower(), 'size': self.sizes[i],
+                'mtime': None if math.isnan(mtime) else mtime}
+
+    def __iter__(self) -> Iterator[Dict]:
+        for i in range(len(self.names)):
+            yield self[i]
@@ -0,0 +1,150 @@
+# I/Oスケジューラ（ネットワーク共有向け: メタデータ操作とデータ転送を別々の上限で並列に実行する）
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+# 並列実行の方式
+# - threads: スレッドプール1つ（jobs 並列）。操作の種類は区別しない
+# - asyncio: イベントループが操作の種類（レーン）ごとの上限を守りながらスレッドへ振り分ける
+#            SMB/NFS など1回の stat・mkdir・小さなファイルのコピーに往復の待ち時間が掛かる場合に、
+#            待ち時間の長い小さな操作を多く同時に出し、帯域を使う大きな転送は少なく抑える
+IO_MODES = ('threads', 'asyncio')
+
+# レーン: 'meta'（mkdir・stat・小さなファイル。待ち時間が支配的）/ 'data'（大きなファイル。帯域が支配的）
+LANES = ('meta', 'data')
+# メタデータ操作の同時実行数のデフォルト（待ち時間を隠すため、データ転送より多く出す）
+DEFAULT_META_JOBS = 64
+# これより小さいファイルの転送はメタデータ操作として扱う（往復の待ち時間が転送時間より長い）
+SMALL_FILE_SIZE = 256 * 1024
+# 未完了の操作数の上限（同時実行数の合計に対する倍率。超えると submit() が空きを待つ）
+PENDING_FACTOR = 4
+
+
+def lane_for_size(size) -> str:
+    """
+    転送するファイルのサイズからレーンを決める（サイズ不明なら 'data'）
+    """
+    if isinstance(size, str):
+        size = int(size) if size.isdigit() else None
+    if isinstance(size, int) and 0 <= size < SMALL_FILE_SIZE:
+        return 'meta'
+    return 'data'
+
+
+class ThreadScheduler:
+    """
+    スレッドプール1つで実行する（io_mode='threads'）。IOScheduler と同じ使い方ができる
+    """
+    def __init__(self, jobs: int):
+        self.jobs = max(1, int(jobs or 1))
+        # 投入済み・未回収の上限（呼び出し側が結果を投入順に回収するときの窓の大きさ）
+        self.window = self.jobs * PENDING_FACTOR
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def __enter__(self):
+        self._executor = ThreadPoolExecutor(max_workers=self.jobs)
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def submit(self, lane: str, fn: Callable, *args) -> Future:
+        return self._executor.submit(fn, *args)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+class IOScheduler:
+    """
+    asyncio のイベントループ（専用スレッド）で操作を振り分け、実際の I/O はスレッドプールで行う
+    - submit(lane, fn, *args): fn(*args) を lane（'meta' / 'data'）の上限内で実行し、
+      concurrent.futures.Future を返す（どのスレッドから呼んでもよい）
+    - meta_jobs / data_jobs: レーンごとの同時実行数の上限（asyncio.Semaphore）
+    - max_pending: 未完了（実行中・順番待ち）の操作数の上限。達すると submit() は空きが出るまで待つ
+      （背圧: 呼び出し側がスキャン結果などを先読みして投入し続けてもメモリが一定に保たれる）
+    - peak: レーンごとの同時実行数の最大値（計測・テスト用）
+    with 文で使う（終了時に全操作の完了を待ってループとスレッドを止める）
+    """
+    def __init__(self, meta_jobs: int = DEFAULT_META_JOBS, data_jobs: int = 8, *,
+                 max_pending: Optional[int] = None):
+        self.limits: Dict[str, int] = {'meta': max(1, int(meta_jobs or 1)), 'data': max(1, int(data_jobs or 1))}
+        self.max_pending = max_pending or sum(self.limits.values()) * PENDING_FACTOR
+        self.window = self.max_pending
+        self.peak: Dict[str, int] = dict.fromkeys(LANES, 0)
+        self._running: Dict[str, int] = dict.fromkeys(LANES, 0)
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._loop = None
+        self._thread: Optional[threading.Thread] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._semaphores = {}
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def start(self):
+        import asyncio  # 起動を速くするため、使うときに読み込む
+        self._executor = ThreadPoolExecutor(max_workers=sum(self.limits.values()), thread_name_prefix='io')
+        self._loop = asyncio.new_event_loop()
+        self._loop.set_default_executor(self._executor)
+        self._thread = threading.Thread(target=self._loop.run_forever, name='io-scheduler', daemon=True)
+        self._thread.start()
+        # Semaphore はループのスレッドで作る（Python 3.9 では作成時のループに結び付くため）
+        asyncio.run_coroutine_threadsafe(self._make_semaphores(), self._loop).result()
+
+    async def _make_semaphores(self):
+        import asyncio
+        self._semaphores = {lane: asyncio.Semaphore(n) for lane, n in self.limits.items()}
+
+    async def _run(self, lane: str, fn: Callable, args):
+        async with self._semaphores[lane]:
+            self._running[lane] += 1
+            self.peak[lane] = max(self.peak[lane], self._running[lane])
+            try:
+                return await self._loop.run_in_executor(None, fn, *args)
+            finally:
+                self._running[lane] -= 1
+
+    def submit(self, lane: str, fn: Callable, *args) -> Future:
+        import asyncio
+        if lane not in self._semaphores:
+            raise ValueError(f"未知のレーン: {lane}（{', '.join(LANES)}）")
+        self._slots.acquire()
+        try:
+            future = asyncio.run_coroutine_threadsafe(self._run(lane, fn, args), self._loop)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _f: self._slots.release())
+        return future
+
+    def close(self):
+        if self._loop is None:
+            return
+        # 投入済みの操作がすべて終わってから止める（空き枠が全部戻るのを待つ）
+        for _ in range(self.max_pending):
+            self._slots.acquire()
+        for _ in range(self.max_pending):
+            self._slots.release()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._executor.shutdown(wait=True)
+        self._loop.close()
+        self._loop = None
+
+
+def open_scheduler(io_mode: str, jobs: int, meta_jobs: int = DEFAULT_META_JOBS):
+    """
+    io_mode に応じたスケジューラを返す（with 文で使う）。jobs はデータ転送の同時実行数
+    """
+    if io_mode == 'asyncio':
+        return IOScheduler(meta_jobs, jobs)
+    if io_mode == 'threads':
+        return ThreadScheduler(jobs)
+    raise ValueError(f"未知の並列実行方式: {io_mode}（{', '.join(IO_MODES)}）")
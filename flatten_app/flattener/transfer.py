@@ -0,0 +1,248 @@
+# ファイル転送方式（コピー / ハードリンク / reflink / カーネル内コピー）
+import errno
+import hashlib
+import os
+import shutil
+import sys
+import threading
+from typing import Callable, Dict, Optional
+
+from .chunkcopy import chunked_copy, read_digest
+
+# 転送方式
+# - auto:     同一ボリュームなら reflink → カーネル内コピー → 通常コピー の順に使えるものを選ぶ
+# - copy:     shutil.copy2
+# - hardlink: ハードリンク（同一ボリュームのみ。失敗時は通常コピー）。出力と入力が同じ実体を共有する
+# - reflink:  コピーオンライトのクローン（Btrfs/XFS/APFS など。失敗時は通常コピー）
+# - kernel:   copy_file_range / sendfile によるカーネル内コピー（失敗時は通常コピー）
+# - chunked:  再利用するバッファへの readinto によるチャンクコピー（chunkcopy.py。巨大ファイルは範囲ごとに並列）
+# 通常コピー（copy、他の方式が使えない場合も）は CHUNKED_MIN_SIZE 以上のファイルをチャンクコピーにする
+TRANSFER_METHODS = ('auto', 'copy', 'hardlink', 'reflink', 'kernel', 'chunked')
+
+FICLONE = 0x40049409  # Linux ioctl: ファイル全体のreflink
+# カーネル内コピーの1回の大きさ（進捗はこの単位で通知する）
+KERNEL_COPY_CHUNK = 64 * 1024 * 1024
+CHUNKED_MIN_SIZE = 64 * 1024 * 1024
+
+# reflink/カーネル内コピーが使えない場合の errno（この場合は次の方式にフォールバックする）
+_FALLBACK_ERRNOS = {errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP, errno.ENOTTY,
+                    errno.EPERM, errno.EBADF, getattr(errno, 'ENOTSUP', errno.EOPNOTSUPP)}
+
+
+class TransferUnsupported(OSError):
+    """この入出力の組み合わせでは使えない転送方式"""
+
+
+def _reflink(src: str, dst: str, progress=None):
+    if sys.platform.startswith('linux'):
+        import fcntl
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            try:
+                fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+            except OSError as e:
+                raise TransferUnsupported(e.errno, f"reflink未対応: {e.strerror}") from e
+    elif sys.platform == 'darwin':
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        if libc.clonefile(os.fsencode(src), os.fsencode(dst), 0) != 0:
+            err = ctypes.get_errno()
+            raise TransferUnsupported(err, f"clonefile未対応: {os.strerror(err)}")
+    else:
+        raise TransferUnsupported(errno.EOPNOTSUPP, "このOSではreflink未対応")
+    shutil.copystat(src, dst)
+    if progress is not None:
+        progress(os.path.getsize(dst))
+
+
+def _kernel_copy(src: str, dst: str, progress=None):
+    copy_range = getattr(os, 'copy_file_range', None)
+    sendfile = getattr(os, 'sendfile', None)
+    if copy_range is None and (sendfile is None or sys.platform == 'win32'):
+        raise TransferUnsupported(errno.EOPNOTSUPP, "このOSではカーネル内コピー未対応")
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        infd, outfd = fsrc.fileno(), fdst.fileno()
+        size = os.fstat(infd).st_size
+        offset = 0
+        use_range = copy_range is not None
+        try:
+            while offset < size:
+                try:
+                    if use_range:
+                        n = copy_range(infd, outfd, min(KERNEL_COPY_CHUNK, size - offset), offset, offset)
+                    else:
+                        n = sendfile(outfd, infd, offset, min(KERNEL_COPY_CHUNK, size - offset))
+                except OSError as e:
+                    if e.errno not in _FALLBACK_ERRNOS:
+                        raise
+                    if use_range and offset == 0 and sendfile is not None:
+                        # copy_file_range が使えないファイルシステム: sendfile で再試行
+                        use_range = False
+                        continue
+                    raise TransferUnsupported(e.errno, f"カーネル内コピー未対応: {e.strerror}") from e
+                if n == 0:
+                    break
+                offset += n
+                if progress is not None:
+                    progress(n)
+        except BaseException:
+            # 途中で失敗したら通知済みのバイト数を取り消す（別方式で最初からコピーし直すと二重に数えるため）
+            if progress is not None and offset:
+                progress(-offset)
+            raise
+    shutil.copystat(src, dst)
+
+
+def _hardlink(src: str, dst: str, progress=None):
+    try:
+        os.link(src, dst)
+    except OSError as e:
+        if e.errno in _FALLBACK_ERRNOS or e.errno == errno.EMLINK:
+            raise TransferUnsupported(e.errno, f"ハードリンク不可: {e.strerror}") from e
+        raise
+    if progress is not None:
+        progress(os.path.getsize(dst))
+
+
+def copy_with_digest(src: str, dst: str, algorithm: str = 'sha256',
+                     progress: Optional[Callable[[int], None]] = None) -> str:
+    """
+    src を dst へコピーしながら、同じ読み込みで内容のハッシュ値を計算して返す（ソースを2回読まない）
+    """
+    h = hashlib.new(algorithm)
+    chunked_copy(src, dst, hasher=h, progress=progress)
+    return h.hexdigest()
+
+
+def _chunked(src: str, dst: str, progress=None):
+    chunked_copy(src, dst, progress=progress)
+
+
+def _remove_dst(src: str, dst: str):
+    """
+    転送前に既存の dst を削除する（前回ハードリンクで出力したファイルに上書きして入力を壊さないため）
+    dst が src そのもの（同じパス、またはリンクが1つしかない同じファイル）なら削除せず shutil.SameFileError
+    （削除すると元ファイルが失われる。前回ハードリンクで出力した別名のリンクは削除してよい）
+    """
+    if os.path.exists(dst) and os.path.samefile(src, dst):
+        same_path = os.path.normcase(os.path.realpath(src)) == os.path.normcase(os.path.realpath(dst))
+        if same_path or os.stat(dst).st_nlink < 2:
+            raise shutil.SameFileError(f"{src!r} と {dst!r} は同じファイルです")
+    try:
+        os.unlink(dst)
+    except FileNotFoundError:
+        pass
+
+
+def _copy(src: str, dst: str, progress=None) -> str:
+    # 通常コピー。大きなファイルはチャンクコピー（ファイル内の進捗・巨大ファイルの並列コピー）にする
+    size = os.path.getsize(src)
+    if size >= CHUNKED_MIN_SIZE:
+        chunked_copy(src, dst, progress=progress)
+        return 'chunked'
+    shutil.copy2(src, dst)
+    if progress is not None:
+        progress(size)
+    return 'copy'
+
+
+_STRATEGIES = {
+    'hardlink': _hardlink,
+    'reflink': _reflink,
+    'kernel': _kernel_copy,
+    'chunked': _chunked,
+}
+# auto で試す順番（hardlinkは入出力が同じ実体を共有してしまうので自動選択しない）
+_AUTO_ORDER = ('reflink', 'kernel')
+
+
+class FileTransfer:
+    """
+    指定した転送方式でファイルを転送する（スレッドセーフ）
+    - 使えなかった方式は (方式, 入力デバイス, 出力デバイス) ごとに記憶し、以降は試さない
+    - stats: 実際に使われた方式ごとの件数
+    """
+    def __init__(self, method: str = 'auto'):
+        if method not in TRANSFER_METHODS:
+            raise ValueError(f"未知の転送方式: {method}（{', '.join(TRANSFER_METHODS)}）")
+        self.method = method
+        self.stats: Dict[str, int] = {}
+        self._unsupported = set()
+        self._dev_cache = {}
+        self._lock = threading.Lock()
+
+    def _device(self, path: str) -> Optional[int]:
+        d = os.path.dirname(os.path.abspath(path))
+        dev = self._dev_cache.get(d)
+        if dev is None:
+            try:
+                dev = os.stat(d).st_dev
+            except OSError:
+                return None
+            self._dev_cache[d] = dev
+        return dev
+
+    def _candidates(self, src: str, dst: str):
+        if self.method == 'chunked':
+            return ('chunked',)
+        if self.method == 'copy':
+            return ()
+        if self.method != 'auto':
+            return (self.method,)
+        # 別ボリューム間では reflink は使えないのでカーネル内コピーから
+        if self._device(src) != self._device(dst):
+            return ('kernel',)
+        return _AUTO_ORDER
+
+    def transfer(self, src: str, dst: str, progress: Optional[Callable[[int], None]] = None) -> str:
+        """
+        src を dst へ転送し、使った方式名を返す
+        既存の dst は先に削除する（前回ハードリンクで出力したファイルに上書きして入力を壊さないため）
+        progress(n): 転送したバイト数の通知（チャンクコピー・カーネル内コピーは転送中に、他は完了時に1回）
+        （途中で失敗して別方式へ切り替えるときは、通知済みの分を負の値で取り消す）
+        """
+        _remove_dst(src, dst)
+        used = 'copy'
+        for name in self._candidates(src, dst):
+            key = (name, self._device(src), self._device(dst))
+            if key in self._unsupported:
+                continue
+            try:
+                _STRATEGIES[name](src, dst, progress)
+                used = name
+                break
+            except TransferUnsupported:
+                with self._lock:
+                    self._unsupported.add(key)
+                try:
+                    os.unlink(dst)
+                except FileNotFoundError:
+                    pass
+        else:
+            used = _copy(src, dst, progress)
+        with self._lock:
+            self.stats[used] = self.stats.get(used, 0) + 1
+        return used
+
+    def transfer_with_digest(self, src: str, dst: str, algorithm: str = 'sha256',
+                             progress: Optional[Callable[[int], None]] = None) -> str:
+        """
+        src を dst へ転送し、内容のハッシュ値を返す
+        ハッシュには内容の読み込みが必要なので、reflink/カーネル内コピーは使わず
+        読み込んだデータをそのまま書き出すコピー（hashcopy）にする。hardlink指定時はリンクしてハッシュだけ計算する
+        """
+        _remove_dst(src, dst)
+        if self.method == 'hardlink':
+            key = ('hardlink', self._device(src), self._device(dst))
+            if key not in self._unsupported:
+                try:
+                    _hardlink(src, dst)
+                    with self._lock:
+                        self.stats['hardlink'] = self.stats.get('hardlink', 0) + 1
+                    return read_digest(src, algorithm, progress=progress)
+                except TransferUnsupported:
+                    with self._lock:
+                        self._unsupported.add(key)
+        digest = copy_with_digest(src, dst, algorithm, progress)
+        with self._lock:
+            self.stats['hashcopy'] = self.stats.get('hashcopy', 0) + 1
+        return digest
@@ -0,0 +1,127 @@
+# スキャン結果のツリーモデル（GUIのツリー表示用。Tkinterに依存しない）
+import os
+from typing import Dict, Iterable, List, Set
+
+from .aggregate import DirectoryAggregate
+from .scanresult import ScanResult
+
+MARK_ON = "[✔]"
+MARK_OFF = "[ ]"
+
+
+def _parent(relpath: str) -> str:
+    return os.path.dirname(relpath)
+
+
+class ScanTreeModel:
+    """
+    スキャン結果をフォルダごとの子要素リストに整理し、ツリー表示に必要な情報をまとめて持つ
+    - ツリーウィジェットにはフォルダを開いたときに直下の子要素だけを挿入する（children()）
+    - フォルダの合計サイズ・ファイル数はスキャン結果から1回だけ集計する（DirectoryAggregate）
+    - ZIP化・除外の状態はウィジェットの値ではなくこのモデルが持つ
+      （除外したフォルダはサブツリー全体が除外扱い。exclude_targets にはそのフォルダだけを入れる）
+    """
+    def __init__(self, items: List[Dict], target_exts: Iterable[str] = ()):
+        self.items = ScanResult.from_items(items)
+        self.agg = DirectoryAggregate(self.items)
+        self._children: List[List[int]] = []  # フォルダID → 直下の要素（items のインデックス）
+        self.zip_candidates: Set[str] = set()
+        self.zip_targets: Set[str] = set()
+        self.exclude_targets: Set[str] = set()
+        self._build(target_exts)
+
+    def _build(self, target_exts: Iterable[str]):
+        targets = {'.' + e.strip().lstrip('.').lower() for e in target_exts if e.strip()}
+        items = self.items
+        # フォルダIDは ScanResult のフォルダ表と DirectoryAggregate で共通
+        children = self._children = [[] for _ in range(len(self.agg))]
+        for i, (d, is_dir) in enumerate(zip(items.parent, items.is_dir)):
+            children[d].append(i)
+            if targets and d and not is_dir and os.path.splitext(items.names[i])[1].lower() in targets:
+                self.zip_candidates.add(items.dirs[d])
+        # 対象拡張子のファイルを直下に含むフォルダは最初からZIP化ON
+        self.zip_targets = set(self.zip_candidates)
+
+    def children(self, relpath: str = "") -> List[Dict]:
+        d = self.agg.ids.get(relpath)
+        if d is None:
+            return []
+        return [self.items[i] for i in self._children[d]]
+
+    def has_children(self, relpath: str) -> bool:
+        d = self.agg.ids.get(relpath)
+        return d is not None and bool(self._children[d])
+
+    def dir_size(self, relpath: str) -> int:
+        return self.agg.size_of(relpath)
+
+    def is_excluded(self, relpath: str) -> bool:
+        p = relpath
+        while p:
+            if p in self.exclude_targets:
+                return True
+            p = _parent(p)
+        return False
+
+    def toggle_zip(self, relpath: str) -> bool:
+        """
+        フォルダのZIP化ON/OFFを切り替え、切り替え後の状態を返す
+        """
+        if relpath in self.zip_targets:
+            self.zip_targets.discard(relpath)
+            return False
+        self.zip_targets.add(relpath)
+        return True
+
+    def set_excluded(self, relpath: str, excluded: bool):
+        """
+        relpath（とそのサブツリー）の除外ON/OFFを設定する
+        祖先フォルダの除外によって除外されている要素をOFFにした場合は、
+        祖先の除外を解除し、relpath 以外の兄弟要素を個別に除外し直す
+        """
+        prefix = relpath + os.sep
+        # サブツリー内の個別指定は上位の指定にまとめる（ON）/ 一緒に解除する（OFF）
+        self.exclude_targets.difference_update([t for t in self.exclude_targets if t.startswith(prefix)])
+        if excluded:
+            if not self.is_excluded(relpath):
+                self.exclude_targets.add(relpath)
+            return
+        self.exclude_targets.discard(relpath)
+        ancestor = _parent(relpath)
+        while ancestor and ancestor not in self.exclude_targets:
+            ancestor = _parent(ancestor)
+        if not ancestor:
+            return
+        self.exclude_targets.discard(ancestor)
+        # 祖先から relpath までの経路上の各フォルダについて、経路外の子要素を除外し直す
+        path = relpath
+        while path != ancestor:
+            parent = _parent(path)
+            for item in self.children(parent):
+                if item['relpath'] != path:
+                    self.exclude_targets.add(item['relpath'])
+            path = parent
+
+    def toggle_excluded(self, relpath: str) -> bool:
+        excluded = not self.is_excluded(relpath)
+        self.set_excluded(relpath, excluded)
+        return excluded
+
+    def exclude_mark(self, relpath: str) -> str:
+        return MARK_ON if self.is_excluded(relpath) else MARK_OFF
+
+    def zip_mark(self, relpath: str) -> str:
+        return MARK_ON if relpath in self.zip_targets else MARK_OFF
+
+    def row_values(self, item: Dict) -> tuple:
+        """
+        ツリーの1行分の列値 (種別, 相対パス, 拡張子, サイズ, ZIP化, 除外)
+        """
+        relpath = item['relpath']
+        exclude = self.exclude_mark(relpath)
+        if item.get('is_dir'):
+            size = self.agg.size_of(relpath)
+            return ("DIR", relpath, "", f"{size:,}" if size > 0 else "", self.zip_mark(relpath), exclude)
+        size = item.get('size', '')
+        size_str = f"{size:,}" if isinstance(size, int) and size >= 0 else "-"
+        return ("FILE", relpath, item.get('ext', ''), size_str, "", exclude)
@@ -0,0 +1,157 @@
+# ZIP化エンジン（複数フォルダのZIPを並列に作成する）
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    import zipfile
+
+# 圧縮済みの形式は deflate しても縮まないので無圧縮（STORE）で格納する
+STORE_EXTS = frozenset([
+    '.zip', '.gz', '.tgz', '.bz2', '.xz', '.7z', '.rar', '.zst',
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', '.heic', '.tif', '.tiff',
+    '.mp4', '.mov', '.avi', '.mkv', '.mp3', '.m4a', '.aac', '.flac',
+])
+DEFAULT_COMPRESSLEVEL = 6
+ZIP_CHUNK_SIZE = 1024 * 1024
+DEFAULT_ZIP_JOBS = max(1, min(8, os.cpu_count() or 1))
+# zipfile の定数（zipfile・プロセスプールは ZIP化するときに読み込む。起動時には使わないため）
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+
+
+def _set_compresslevel(zinfo: 'zipfile.ZipInfo', level: Optional[int]):
+    # Python 3.13 で compress_level が公開属性になった（それ以前は _compresslevel）
+    if hasattr(zinfo, 'compress_level'):
+        zinfo.compress_level = level
+    else:
+        zinfo._compresslevel = level
+
+
+def compression_for(ext: str, compresslevel: int = DEFAULT_COMPRESSLEVEL,
+                    store_exts: Iterable[str] = STORE_EXTS,
+                    ext_levels: Optional[Dict[str, int]] = None) -> Tuple[int, Optional[int]]:
+    """
+    拡張子から (圧縮方式, 圧縮レベル) を決める
+    - ext_levels に指定があればそのレベル（0 は無圧縮）
+    - store_exts に含まれる拡張子は無圧縮
+    - それ以外は compresslevel で deflate
+    """
+    ext = ext.lower()
+    level = (ext_levels or {}).get(ext)
+    if level is None:
+        if ext in store_exts:
+            return ZIP_STORED, None
+        level = compresslevel
+    if level <= 0:
+        return ZIP_STORED, None
+    return ZIP_DEFLATED, min(level, 9)
+
+
+def build_zip(src_dir: str, zip_path: str, *,
+              compresslevel: int = DEFAULT_COMPRESSLEVEL,
+              store_exts: Iterable[str] = STORE_EXTS,
+              ext_levels: Optional[Dict[str, int]] = None,
+              chunk_size: int = ZIP_CHUNK_SIZE) -> Tuple[int, int]:
+    """
+    src_dir 配下を zip_path に格納する（shutil.make_archive と同じ構成: フォルダ直下からの相対パス）
+    - ファイル内容は chunk_size ごとに読み込んでZIPへ書き込む（大きなファイルも一定メモリ）
+    - 一時ファイルに書き込んでから置き換えるので、中断しても壊れたZIPが残らない
+    (格納ファイル数, 元ファイルの合計バイト数) を返す。プロセスプールから呼ばれるのでモジュール関数にしている
+    """
+    import zipfile
+    store_exts = frozenset(store_exts)
+    tmp_path = zip_path + '.part'
+    files = 0
+    total = 0
+    buf = bytearray(chunk_size)
+    view = memoryview(buf)
+    try:
+        with zipfile.ZipFile(tmp_path, 'w', compression=zipfile.ZIP_DEFLATED, allowZip64=True) as zf:
+            for dirpath, dirnames, filenames in os.walk(src_dir):
+                dirnames.sort()
+                arcdir = os.path.relpath(dirpath, src_dir)
+                for name in dirnames:
+                    arcname = os.path.normpath(os.path.join(arcdir, name))
+                    zf.write(os.path.join(dirpath, name), arcname)
+                for name in sorted(filenames):
+                    path = os.path.join(dirpath, name)
+                    if not os.path.isfile(path):
+                        continue
+                    arcname = os.path.normpath(os.path.join(arcdir, name))
+                    zinfo = zipfile.ZipInfo.from_file(path, arcname, strict_timestamps=False)
+                    compress_type, level = compression_for(os.path.splitext(name)[1], compresslevel,
+                                                           store_exts, ext_levels)
+                    zinfo.compress_type = compress_type
+                    _set_compresslevel(zinfo, level)
+                    with open(path, 'rb') as src, zf.open(zinfo, 'w', force_zip64=zinfo.file_size > zipfile.ZIP64_LIMIT) as dst:
+                        while True:
+                            n = src.readinto(buf)
+                            if not n:
+                                break
+                            dst.write(view[:n])
+                    files += 1
+                    total += zinfo.file_size
+        os.replace(tmp_path, zip_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    return files, total
+
+
+class ZipBuilder:
+    """
+    複数フォルダのZIPを並列に作成する
+    - executor='process' ならプロセスプール（圧縮のCPU処理を並列化）、'thread' ならスレッドプール
+      （プロセスプールが使えない環境では自動でスレッドプールに切り替える）
+    - 拡張子ごとの圧縮レベルは compression_for() を参照
+    """
+    def __init__(self, jobs: int = DEFAULT_ZIP_JOBS, *,
+                 executor: str = 'process',
+                 compresslevel: int = DEFAULT_COMPRESSLEVEL,
+                 store_exts: Iterable[str] = STORE_EXTS,
+                 ext_levels: Optional[Dict[str, int]] = None,
+                 log: Optional[Callable[[str], None]] = None):
+        self.jobs = max(1, int(jobs or 1))
+        self.executor = executor
+        self.options = {
+            'compresslevel': compresslevel,
+            'store_exts': frozenset(e.lower() if e.startswith('.') else '.' + e.lower() for e in store_exts),
+            'ext_levels': dict(ext_levels or {}),
+        }
+        self.log = log or (lambda msg: None)
+
+    def _make_executor(self, count: int):
+        workers = min(self.jobs, count)
+        if self.executor == 'process' and workers > 1:
+            try:
+                from concurrent.futures import ProcessPoolExecutor
+                return ProcessPoolExecutor(max_workers=workers)
+            except (OSError, NotImplementedError, ImportError) as e:
+                self.log(f"プロセスプールを使えないためスレッドで並列ZIP化します: {e}")
+        return ThreadPoolExecutor(max_workers=workers)
+
+    def build_all(self, tasks: List[Tuple[str, str]]) -> Iterator[Tuple[int, Optional[Tuple[int, int]], Optional[BaseException]]]:
+        """
+        tasks: (ZIP化するフォルダ, 出力ZIPパス) のリスト
+        各タスクの (インデックス, (ファイル数, バイト数) or None, 例外 or None) を tasks の順に返す
+        """
+        if not tasks:
+            return
+        if self.jobs == 1 or len(tasks) == 1:
+            for i, (src_dir, zip_path) in enumerate(tasks):
+                try:
+                    yield i, build_zip(src_dir, zip_path, **self.options), None
+                except Exception as e:
+                    yield i, None, e
+            return
+        with self._make_executor(len(tasks)) as executor:
+            futures = [executor.submit(build_zip, src_dir, zip_path, **self.options) for src_dir, zip_path in tasks]
+            for i, future in enumerate(futures):
+                try:
+                    yield i, future.result(), None
+                except Exception as e:
+                    yield i, None, e
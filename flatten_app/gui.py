@@ -1,66 +1,35 @@
-
-
-
-import sys
-import os
-import pathlib
-# --- import時点でファイル書き出し（importされたことを確実に検知） ---
-try:
-    # バイナリ実行時はsys._MEIPASS、通常は__file__の親
-    if hasattr(sys, '_MEIPASS'):
-        base_dir = sys._MEIPASS
-    else:
-        base_dir = os.path.dirname(os.path.abspath(__file__))
-    debug_marker_path = os.path.join(base_dir, "debug_import_marker.txt")
-    import datetime
-    os.makedirs(os.path.dirname(debug_marker_path), exist_ok=True)
-    with open(debug_marker_path, "w", encoding="utf-8") as f:
-        f.write(f"[import] __file__ = {__file__}\n")
-        f.write(f"datetime = {datetime.datetime.now()}\n")
-except Exception as e:
-    pass
-
-# --- import時に必ずファイル書き出し（import経路デバッグ） ---
-try:
-    if hasattr(sys, '_MEIPASS'):
-        base_dir = sys._MEIPASS
-    else:
-        base_dir = os.path.dirname(os.path.abspath(__file__))
-    debug_marker_path = os.path.join(base_dir, "debug_import_marker.txt")
-    import datetime
-    os.makedirs(os.path.dirname(debug_marker_path), exist_ok=True)
-    with open(debug_marker_path, "w", encoding="utf-8") as f:
-        f.write(f"imported: {__file__}\n{datetime.datetime.now()}\n")
-except Exception:
-    pass
-
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import threading
+import collections
 import os
-import shutil
+import sys
 import json
-import urllib.parse
-# Pillowで画像表示
-from PIL import Image, ImageTk
 import random
+# Pillow（装飾画像の縮小表示）は show_random_image() で必要になったときに読み込む（起動を速くするため）
 
 # --- どの実行形態でも動作するimport構文に統一 ---
-import sys
-import pathlib
-_here = pathlib.Path(__file__).resolve().parent
-_root = _here.parent
-if str(_root) not in sys.path:
-    sys.path.insert(0, str(_root))
-if str(_here) not in sys.path:
-    sys.path.insert(0, str(_here))
+_here = os.path.dirname(os.path.realpath(__file__))
+_root = os.path.dirname(_here)
+if _root not in sys.path:
+    sys.path.insert(0, _root)
+if _here not in sys.path:
+    sys.path.insert(0, _here)
 # --- import fallback: flatten_app.flattener → flattener ---
 try:
-    from flatten_app.flattener.logic import DirectoryScanner, flatten_filename
-    from flatten_app.flattener.filemap import FileMap
+    from flatten_app.flattener.logic import DirectoryScanner, ExcludeFilter, EXCLUDE_PATTERNS
+    from flatten_app.flattener.engine import FlattenEngine, RestoreEngine, count_targets, DEFAULT_JOBS
+    from flatten_app.flattener.transfer import TRANSFER_METHODS
+    from flatten_app.flattener.events import EventQueue
+    from flatten_app.flattener.treemodel import ScanTreeModel
+    from flatten_app.flattener.debuglog import debug, record_startup, APP_DIR
 except ImportError:
-    from flattener.logic import DirectoryScanner, flatten_filename
-    from flattener.filemap import FileMap
+    from flattener.logic import DirectoryScanner, ExcludeFilter, EXCLUDE_PATTERNS
+    from flattener.engine import FlattenEngine, RestoreEngine, count_targets, DEFAULT_JOBS
+    from flattener.transfer import TRANSFER_METHODS
+    from flattener.events import EventQueue
+    from flattener.treemodel import ScanTreeModel
+    from flattener.debuglog import debug, record_startup, APP_DIR
 
 class FlattenApp(tk.Tk):
     def show_help(self):
@@ -87,31 +56,6 @@ class FlattenApp(tk.Tk):
         )
         messagebox.showinfo("ヘルプ", help_text)
 
-    def __init__(self):
-        # --- 実際に使われているファイルパスをファイルに書き出す ---
-        try:
-            if hasattr(sys, '_MEIPASS'):
-                base_dir = sys._MEIPASS
-            else:
-                base_dir = os.path.dirname(os.path.abspath(__file__))
-            debug_gui_path = os.path.join(base_dir, "debug_gui_path.txt")
-            os.makedirs(os.path.dirname(debug_gui_path), exist_ok=True)
-            with open(debug_gui_path, "w", encoding="utf-8") as f:
-                f.write(f"__file__ = {__file__}\n")
-        except Exception as e:
-            pass
-        super().__init__()
-        self.title("ファイルフラット化・復元ツール")
-        self.geometry("800x600")
-        self.resizable(True, True)
-        self.create_widgets()
-        self.dir_tree_items = {}
-        self.zip_targets = set()
-        self.dir_nodes = {}  # relpath: node_id
-        self.load_settings()
-        # 初期表示で必ずフラット化ツリーが表示されるようにする
-        self.on_mode_change()
-
     def human_readable_size(self, size):
         # バイト数を見やすい単位（B, KB, MB, GB, TB）で返す
         for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
@@ -120,26 +64,37 @@ class FlattenApp(tk.Tk):
             size /= 1024.0
         return f"{size:,.0f} PB"
 
+    IMAGE_SIZE = 120  # 装飾画像の表示サイズ（縦横の最大ピクセル）
+
     def show_random_image(self):
-        import tkinter.messagebox as mb
+        """
+        装飾画像をランダムに1枚表示する（ウィンドウ表示後に after_idle から呼ぶ）
+        Pillow があれば高品質に縮小し、無ければ Tk の PhotoImage（PNG対応）を整数分の1に間引いて表示する
+        画像が無い・読めない場合はラベルに表示するだけで、ダイアログは出さない（詳細は --debug のログ）
+        """
         if not self._image_files:
             self._image_label.config(image="", text="画像なし")
-            mb.showerror("画像エラー", "画像ファイルリストが空です。imageフォルダに画像が存在するか確認してください。")
             return
         img_path = random.choice(self._image_files)
-        print(f"[DEBUG] show_random_image: 選択画像: {img_path}")
+        debug(f"show_random_image: 選択画像: {img_path}")
         try:
-            img = Image.open(img_path)
-            max_w, max_h = 120, 120
-            img.thumbnail((max_w, max_h), Image.LANCZOS)
-            self._image_tk = ImageTk.PhotoImage(img)
-            # ファイル名もtextで表示
+            try:
+                from PIL import Image, ImageTk
+            except ImportError:
+                photo = tk.PhotoImage(file=img_path)
+                factor = -(-max(photo.width(), photo.height()) // self.IMAGE_SIZE)
+                self._image_tk = photo.subsample(factor) if factor > 1 else photo
+            else:
+                img = Image.open(img_path)
+                img.thumbnail((self.IMAGE_SIZE, self.IMAGE_SIZE), Image.LANCZOS)
+                self._image_tk = ImageTk.PhotoImage(img)
             self._image_label.config(image=self._image_tk, text="")
             self._image_label.image = self._image_tk  # 明示的に参照保持
-            print(f"[DEBUG] show_random_image: 画像ラベルにセット完了")
+            debug("show_random_image: 画像ラベルにセット完了")
         except Exception as e:
             self._image_label.config(image="", text=f"画像読込失敗\n{os.path.basename(img_path)}")
-            mb.showerror("画像読込失敗", f"画像読込失敗: {img_path}\n{e}")
+            debug(f"show_random_image: 画像読込失敗: {img_path}: {e}")
+
     def show_restore_ui(self, frm):
         # メイン表示領域を復元リストに切り替え
         for widget in self.main_area.winfo_children():
@@ -187,9 +142,6 @@ class FlattenApp(tk.Tk):
         # packのみで表示制御（pack/grid混在禁止）
 
     def run_restore(self):
-        import shutil
-        import zipfile
-        from flattener.filemap import FileMap
         method = self.restore_method.get()
         src = self.src_var.get()
         dst = self.dst_var.get()
@@ -202,95 +154,59 @@ class FlattenApp(tk.Tk):
             return
         self.restore_exec_btn.config(state=tk.DISABLED)
         if hasattr(self, 'restore_progress'):
-            self.restore_progress.start(10)
-        self.log(f"復元実行: {method} (ZIP展開: {'ON' if unzip else 'OFF'})")
-        filemap_path = os.path.join(src, "filemap.csv")
-        filemap = []
-        if os.path.exists(filemap_path):
-            try:
-                filemap = FileMap.load_csv(filemap_path)
-            except Exception as e:
-                self.log(f"filemap.csv読込エラー: {e}")
-        files = []
-        for root, dirs, fs in os.walk(src):
-            for f in fs:
-                if f == "filemap.csv":
-                    continue
-                rel = os.path.relpath(os.path.join(root, f), src)
-                files.append(rel)
-        count = 0
-        for f in files:
-            src_path = os.path.join(src, f)
-            # 復元パス決定
-            if method == 'filemap' and filemap:
-                rec = next((row for row in filemap if row['flattened_name'] == f), None)
-                if rec:
-                    out_path = os.path.join(dst, rec['original_path'])
-                else:
-                    self.log(f"filemap未登録: {f}")
-                    continue
-            else:
-                try:
-                    parts = f.split('_')
-                    decoded = [urllib.parse.unquote(p) for p in parts]
-                    out_path = os.path.join(dst, *decoded)
-                except Exception as e:
-                    self.log(f"復元名変換エラー: {f}: {e}")
-                    continue
-            os.makedirs(os.path.dirname(out_path), exist_ok=True)
-            # ZIPファイルなら展開 or コピー
-            if f.lower().endswith('.zip'):
-                if unzip:
-                    # ZIP展開: ZIPファイル名(拡張子なし)のフォルダ内に展開
-                    zip_folder = os.path.splitext(os.path.basename(out_path))[0]
-                    extract_dir = os.path.join(os.path.dirname(out_path), zip_folder)
-                    os.makedirs(extract_dir, exist_ok=True)
-                    try:
-                        with zipfile.ZipFile(src_path, 'r') as zf:
-                            zf.extractall(extract_dir)
-                        self.log(f"展開: {src_path} → {extract_dir}")
-                        count += 1
-                    except Exception as e:
-                        self.log(f"ZIP展開エラー: {src_path}: {e}")
-                else:
-                    # ZIPコピー: ファイル名に.zip拡張子を必ず付与してコピー
-                    zip_copy_path = out_path
-                    if not zip_copy_path.lower().endswith('.zip'):
-                        zip_copy_path += '.zip'
-                    try:
-                        shutil.copy2(src_path, zip_copy_path)
-                        self.log(f"ZIPコピー: {src_path} → {zip_copy_path}")
-                        count += 1
-                    except Exception as e:
-                        self.log(f"ZIPコピーエラー: {src_path} → {zip_copy_path}: {e}")
-            else:
-                try:
-                    shutil.copy2(src_path, out_path)
-                    self.log(f"復元: {src_path} → {out_path}")
-                    count += 1
-                except Exception as e:
-                    self.log(f"復元エラー: {src_path} → {out_path}: {e}")
-        self.log(f"\n復元完了: {count} ファイル/ZIP")
-        self.restore_exec_btn.config(state=tk.NORMAL)
-        if hasattr(self, 'restore_progress'):
-            self.restore_progress.stop()
-    SETTINGS_PATH = os.path.join(os.path.dirname(__file__), "settings.json")
+            self.restore_progress.config(mode='determinate', value=0, maximum=1)
+        # 復元はワーカースレッドで実行し、ログ・進捗はイベントキュー経由でUIへ渡す（UIを止めない）
+        events = self.start_events('restore')
+        engine = RestoreEngine(src, dst, method=method, unzip=unzip, jobs=self.get_jobs(), transfer=self.transfer_var.get(),
+                               log=events.log, progress=events.progress)
+        threading.Thread(target=self._restore_thread, args=(engine, events), daemon=True).start()
+
+    def _restore_thread(self, engine, events):
+        try:
+            engine.run()
+        except Exception as e:
+            events.log(f"復元エラー: {e}")
+        finally:
+            events.post('restore_done')
+
+    def _update_restore_progress(self, done, total):
+        if hasattr(self, 'restore_progress') and self.restore_progress.winfo_exists():
+            self.restore_progress.config(maximum=max(total, 1), value=done)
+
+    def _restore_done(self):
+        if self.restore_exec_btn.winfo_exists():
+            self.restore_exec_btn.config(state=tk.NORMAL)
+
+    # 設定・全ログの保存先（実行ファイルの隣ではなくユーザーのホーム配下）
+    SETTINGS_PATH = os.path.join(APP_DIR, "settings.json")
+    # 以前のバージョンが gui.py の隣に保存していた設定（読み込みだけ。新しい設定が無いときに使う）
+    LEGACY_SETTINGS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "settings.json")
+    LOG_DIR = os.path.join(APP_DIR, "logs")
+    UI_FRAME_MS = 100      # ワーカーからのログ・進捗を画面へ反映する間隔
+    LOG_VIEW_LINES = 2000  # ログ表示欄に残す最大行数（古い行から削除）
+    LOG_BATCH = 500        # 1フレームで画面へ書き出す最大ログ行数
+    RESTORE_TREE_BATCH = 2000  # 1フレームで復元プレビューへ追加する最大行数
 
     def __init__(self):
         super().__init__()
         self.title("ファイルフラット化・復元ツール")
         self.geometry("800x600")
         self.resizable(True, True)
+        self.events = EventQueue()
+        self._job_kind = None
+        self._spinner_idx = 0
         self.create_widgets()
         self.dir_tree_items = {}
         self.zip_targets = set()
-        self.dir_nodes = {}  # relpath: node_id
+        self.tree_model = None  # スキャン結果のツリーモデル（scan_dirで作成）
+        self._restore_plan_id = 0  # 復元プレビューの作成ごとの番号（古い結果を捨てるため）
+        self._restore_rows = collections.deque()  # 復元プレビューに未追加の行
         self.load_settings()
         # 初期表示で必ずフラット化ツリーが表示されるようにする
         self.on_mode_change()
+        self.after(self.UI_FRAME_MS, self._pump_events)
 
     def create_widgets(self):
-        import tkinter.messagebox as mb
         style = ttk.Style()
         style.theme_use('clam')
         style.configure('TButton', font=('Meiryo UI', 10), padding=6)
@@ -307,6 +223,23 @@ class FlattenApp(tk.Tk):
         ttk.Label(mode_frame, text='動作モード:').pack(side=tk.LEFT)
         ttk.Radiobutton(mode_frame, text='フラット化', variable=self.mode_var, value='flatten', command=self.on_mode_change).pack(side=tk.LEFT, padx=5)
         ttk.Radiobutton(mode_frame, text='復元', variable=self.mode_var, value='restore', command=self.on_mode_change).pack(side=tk.LEFT, padx=5)
+        # 並列コピー数
+        self.jobs_var = tk.IntVar(value=DEFAULT_JOBS)
+        ttk.Label(mode_frame, text='並列コピー数:').pack(side=tk.LEFT, padx=(15, 0))
+        ttk.Spinbox(mode_frame, from_=1, to=64, width=4, textvariable=self.jobs_var).pack(side=tk.LEFT, padx=5)
+        # 差分フラット化（出力先のfilemap.csvと比較して変更分のみコピー）
+        self.incremental_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(mode_frame, text='差分コピー', variable=self.incremental_var).pack(side=tk.LEFT, padx=5)
+        # 重複排除（同じ内容のファイルは1つだけコピーし、残りはハードリンク）
+        self.dedup_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(mode_frame, text='重複排除', variable=self.dedup_var).pack(side=tk.LEFT, padx=5)
+        # ファイル転送方式（auto: reflink/カーネル内コピーを自動選択）
+        self.transfer_var = tk.StringVar(value='auto')
+        ttk.Label(mode_frame, text='転送方式:').pack(side=tk.LEFT, padx=(10, 0))
+        ttk.Combobox(mode_frame, textvariable=self.transfer_var, values=TRANSFER_METHODS, width=9, state='readonly').pack(side=tk.LEFT, padx=5)
+        # 全ログをファイルに保存（画面のログ欄は直近 LOG_VIEW_LINES 行のみ）
+        self.log_file_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(mode_frame, text='ログ保存', variable=self.log_file_var).pack(side=tk.LEFT, padx=5)
         # ヘルプボタンを右上に大きく強調
         help_btn = ttk.Button(topbar, text='❓ ヘルプ', command=self.show_help, style='Accent.TButton')
         help_btn.pack(side=tk.RIGHT, padx=5)
@@ -343,17 +276,13 @@ class FlattenApp(tk.Tk):
         self._image_label = tk.Label(frm, bg="white", borderwidth=0, highlightthickness=0, width=120, height=120, anchor="center", text="") 
         self._image_label.grid(row=3, column=0, rowspan=2, sticky=tk.N, padx=(0, 10), pady=5)
         self._image_tk = None  # 参照保持
-        print(f"[DEBUG] image_dir: {image_dir}")
-        print(f"[DEBUG] _image_files: {self._image_files}")
+        debug(f"image_dir: {image_dir}")
+        debug(f"_image_files: {self._image_files}")
         if not self._image_files:
             self._image_label.config(text="画像なし")
-            mb.showerror("画像エラー", f"画像ファイルが見つかりませんでした\n{image_dir}\nに nanote_01.png〜nanote_04.png を配置してください。")
         else:
-            try:
-                self.show_random_image()
-            except Exception as e:
-                self._image_label.config(text="画像表示エラー")
-                mb.showerror("画像表示エラー", f"画像表示処理で例外発生:\n{e}")
+            # 画像の読み込み・縮小はウィンドウが表示されてから行う
+            self.after_idle(self.show_random_image)
 
         # メイン表示領域（ツリー/復元リスト切替用）
         self.main_area = ttk.Frame(frm)
@@ -384,6 +313,7 @@ class FlattenApp(tk.Tk):
         self.tree.column("exclude", width=60, anchor="center")
         self.tree.tag_configure('dir_total', background='#e6f7ff', foreground='#005580', font=('Meiryo UI', 10, 'bold'))
         self.tree.bind("<Button-1>", self.on_tree_click)
+        self.tree.bind("<<TreeviewOpen>>", self.on_tree_open)
         self.restore_tree = None  # 復元リストはshow_restore_uiで生成
 
         # 統計表示＋進捗表示
@@ -438,6 +368,11 @@ class FlattenApp(tk.Tk):
             self.dst_var.set(path)
             self.save_settings()
 
+    def get_exclude_filter(self):
+        # 除外欄の指定（拡張子・glob・フォルダ/）を1回だけ前処理し、スキャン・統計・コピーで共用する
+        lines = self.exclude_ext_text.get('1.0', tk.END).splitlines()
+        return ExcludeFilter.from_lines(lines, EXCLUDE_PATTERNS)
+
     def scan_dir(self):
         self.save_settings()
         src = self.src_var.get()
@@ -445,156 +380,131 @@ class FlattenApp(tk.Tk):
             messagebox.showerror("エラー", "入力フォルダを正しく指定してください")
             return
         self.tree.delete(*self.tree.get_children())
-        self.zip_targets = set()
-        self.exclude_targets = set()
-        self.dir_nodes = {"": ""}
-        scanner = DirectoryScanner(src)
-        items = scanner.scan()
-        file_count = {}
-        dir_size = {}
-        # ZIP推奨拡張子リスト取得
+        exclude_filter = self.get_exclude_filter()
+        items = DirectoryScanner.cached_scan(src, refresh=True, exclude_filter=exclude_filter)
+        # ZIP推奨拡張子リスト取得（対象拡張子を直下に含むフォルダはZIP化ON）
         target_exts = [e.strip().lower() for e in self.target_ext_text.get('1.0', tk.END).splitlines() if e.strip()]
-        # 除外拡張子リスト取得
-        exclude_exts = [e.strip().lower() for e in self.exclude_ext_text.get('1.0', tk.END).splitlines() if e.strip()]
-        # フォルダごとに対象拡張子ファイルが含まれるかチェック
-        folder_ext_hit = {}
-        # ディレクトリ合計サイズ計算用
-        for item in items:
-            relpath = item['relpath']
-            parent = os.path.dirname(relpath) if os.path.dirname(relpath) != '.' else ""
-            if item.get('is_dir'):
-                node_id = self.tree.insert(self.dir_nodes.get(parent, ""), "end", text=item['name'],
-                                           values=("DIR", relpath, "", "", "[ ]", "[ ]"))
-                self.dir_nodes[relpath] = node_id
-                dir_size[relpath] = 0
-            else:
-                ext = item.get('ext', '').lower()
-                size = item.get('size', '')
-                size_str = f"{size:,}" if isinstance(size, int) and size >= 0 else "-"
-                node_id = self.tree.insert(self.dir_nodes.get(parent, ""), "end", text=item['name'],
-                                           values=("FILE", relpath, ext, size_str, "", "[ ]"))
-                file_count[parent] = file_count.get(parent, 0) + 1
-                # 親フォルダに対象拡張子が含まれるか記録
-                if ext in target_exts:
-                    folder_ext_hit[parent] = True
-                # ディレクトリ合計サイズ加算
-                p = parent
-                while p != "":
-                    dir_size[p] = dir_size.get(p, 0) + (size if isinstance(size, int) and size >= 0 else 0)
-                    p = os.path.dirname(p) if os.path.dirname(p) != '.' else ""
-        # ファイル数を表示＋対象拡張子が含まれるフォルダはZIP化ON
-        for rel, node_id in self.dir_nodes.items():
-            if rel in file_count and node_id:
-                if rel in folder_ext_hit:
-                    self.tree.set(node_id, column="count", value="[✔]")
-                    self.zip_targets.add(rel)
-                else:
-                    self.tree.set(node_id, column="count", value="[ ]")
-        # ディレクトリ未展開時は合計サイズを色付きで表示
-        for rel, node_id in self.dir_nodes.items():
-            if node_id and rel in dir_size and dir_size[rel] > 0:
-                self.tree.set(node_id, column="size", value=f"{dir_size[rel]:,}")
-                self.tree.item(node_id, tags=('dir_total',))
+        # スキャン結果はモデルに持ち、ツリーには開いたフォルダの直下だけを挿入する
+        self.tree_model = ScanTreeModel(items, target_exts)
+        self.zip_targets = self.tree_model.zip_targets
+        self.exclude_targets = self.tree_model.exclude_targets
+        self._insert_tree_children("")
         # 統計表示（除外ファイル以外のファイル数・合計サイズ）
-        total_count = 0
-        total_size = 0
-        for item in items:
-            if not item.get('is_dir'):
-                ext = item.get('ext', '').lower()
-                relpath = item['relpath']
-                if ext and any(ext == ('.' + e.lstrip('.').lower()) for e in exclude_exts):
-                    continue
-                total_count += 1
-                size = item.get('size', 0)
-                if isinstance(size, int) and size >= 0:
-                    total_size += size
+        total_count, total_size = count_targets(items, exclude_filter)
         self.stat_label.config(
             text=f"対象ファイル数: {total_count:,}    合計サイズ: {self.human_readable_size(total_size)}"
         )
         # 進捗ラベルも初期化
         self.progress_label.config(text="")
 
+    @staticmethod
+    def _placeholder_id(relpath):
+        # 未展開フォルダに入れておく仮の子ノードのID（相対パスは区切り文字で終わらないので実ノードと重ならない）
+        return relpath + os.sep
+
+    def _insert_tree_children(self, parent):
+        model = self.tree_model
+        for item in model.children(parent):
+            relpath = item['relpath']
+            is_dir = item.get('is_dir')
+            # 未展開時は合計サイズを色付きで表示
+            tags = ('dir_total',) if is_dir and model.dir_size(relpath) > 0 else ()
+            self.tree.insert(parent, "end", iid=relpath, text=item['name'],
+                             values=model.row_values(item), tags=tags)
+            if is_dir and model.has_children(relpath):
+                self.tree.insert(relpath, "end", iid=self._placeholder_id(relpath), text="…")
+
+    def on_tree_open(self, event=None):
+        node = self.tree.focus()
+        placeholder = self._placeholder_id(node)
+        if node and self.tree.exists(placeholder):
+            self.tree.delete(placeholder)
+            self._insert_tree_children(node)
+
+    def _refresh_exclude_marks(self, node):
+        # 祖先の除外解除で兄弟の状態も変わるので、最上位の祖先から挿入済みのノードだけを更新する
+        while self.tree.parent(node):
+            node = self.tree.parent(node)
+        stack = [node]
+        while stack:
+            node_id = stack.pop()
+            if node_id.endswith(os.sep):
+                continue
+            self.tree.set(node_id, column="exclude", value=self.tree_model.exclude_mark(node_id))
+            stack.extend(self.tree.get_children(node_id))
+
     def load_settings(self):
+        path = self.SETTINGS_PATH if os.path.isfile(self.SETTINGS_PATH) else self.LEGACY_SETTINGS_PATH
         try:
-            with open(self.SETTINGS_PATH, "r", encoding="utf-8") as f:
+            with open(path, "r", encoding="utf-8") as f:
                 data = json.load(f)
             if os.path.isdir(data.get("last_src", "")):
                 self.src_var.set(data["last_src"])
             if os.path.isdir(data.get("last_dst", "")):
                 self.dst_var.set(data["last_dst"])
+            if isinstance(data.get("jobs"), int) and data["jobs"] > 0:
+                self.jobs_var.set(data["jobs"])
+            self.incremental_var.set(bool(data.get("incremental", False)))
+            self.dedup_var.set(bool(data.get("dedup", False)))
+            if data.get("transfer") in TRANSFER_METHODS:
+                self.transfer_var.set(data["transfer"])
+            self.log_file_var.set(bool(data.get("log_file", False)))
         except Exception:
             pass
 
     def save_settings(self):
         data = {
             "last_src": self.src_var.get(),
-            "last_dst": self.dst_var.get()
+            "last_dst": self.dst_var.get(),
+            "jobs": self.get_jobs(),
+            "incremental": bool(self.incremental_var.get()),
+            "dedup": bool(self.dedup_var.get()),
+            "transfer": self.transfer_var.get(),
+            "log_file": bool(self.log_file_var.get())
         }
         try:
+            os.makedirs(os.path.dirname(self.SETTINGS_PATH), exist_ok=True)
             with open(self.SETTINGS_PATH, "w", encoding="utf-8") as f:
                 json.dump(data, f, ensure_ascii=False, indent=2)
         except Exception:
             pass
 
+    def get_jobs(self):
+        try:
+            return max(1, int(self.jobs_var.get()))
+        except (tk.TclError, ValueError):
+            return DEFAULT_JOBS
+
     def on_tree_click(self, event):
         region = self.tree.identify("region", event.x, event.y)
         col = self.tree.identify_column(event.x)
         row = self.tree.identify_row(event.y)
-        print(f"[DEBUG] region={region}, col={col}, row={row}, x={event.x}, y={event.y}")
-        if region != "cell" or not row:
-            print("[DEBUG] セル以外または空白クリック。処理しません。")
+        debug(f"region={region}, col={col}, row={row}, x={event.x}, y={event.y}")
+        if region != "cell" or not row or row.endswith(os.sep) or self.tree_model is None:
+            debug("セル以外または空白クリック。処理しません。")
             return
         values = self.tree.item(row, "values")
-        print(f"[DEBUG] values={values}")
+        debug(f"values={values}")
         relpath = values[1] if values else None
         if col == "#5":  # ZIP化列
             if not values or values[0] != "DIR":
-                print("[DEBUG] DIR行以外。処理しません。")
+                debug("DIR行以外。処理しません。")
                 return
-            # チェック状態トグル
-            if relpath in self.zip_targets:
-                self.zip_targets.remove(relpath)
-                self.tree.set(row, column="count", value="[ ]")
-                print(f"[DEBUG] ZIP化OFF: {relpath}")
-                self.log(f"ZIP化対象OFF: {relpath}")
-            else:
-                self.zip_targets.add(relpath)
-                self.tree.set(row, column="count", value="[✔]")
-                print(f"[DEBUG] ZIP化ON: {relpath}")
-                self.log(f"ZIP化対象ON: {relpath}")
+            # チェック状態トグル（状態はモデルが持ち、ウィジェットは表示だけ）
+            on = self.tree_model.toggle_zip(relpath)
+            self.tree.set(row, column="count", value=self.tree_model.zip_mark(relpath))
+            debug(f"ZIP化{'ON' if on else 'OFF'}: {relpath}")
+            self.log(f"ZIP化対象{'ON' if on else 'OFF'}: {relpath}")
             self.log(f"ZIP化対象リスト: {sorted(self.zip_targets)}")
         elif col == "#6":  # 除外列
-            # ファイル・ディレクトリ両方OK
-            if not hasattr(self, 'exclude_targets'):
-                self.exclude_targets = set()
-
-            def set_exclude_recursive(node_id, check):
-                values = self.tree.item(node_id, "values")
-                relpath = values[1] if values else None
-                if relpath:
-                    if check:
-                        self.exclude_targets.add(relpath)
-                        self.tree.set(node_id, column="exclude", value="[✔]")
-                    else:
-                        self.exclude_targets.discard(relpath)
-                        self.tree.set(node_id, column="exclude", value="[ ]")
-                # 子ノードも再帰的に処理
-                for child in self.tree.get_children(node_id):
-                    set_exclude_recursive(child, check)
-
-            if relpath in self.exclude_targets:
-                # OFF: 自分と子孫すべて除外OFF
-                set_exclude_recursive(row, False)
-                print(f"[DEBUG] 除外OFF: {relpath}（子孫もOFF）")
-                self.log(f"除外OFF: {relpath}（子孫もOFF）")
-            else:
-                # ON: 自分と子孫すべて除外ON
-                set_exclude_recursive(row, True)
-                print(f"[DEBUG] 除外ON: {relpath}（子孫もON）")
-                self.log(f"除外ON: {relpath}（子孫もON）")
+            # ファイル・ディレクトリ両方OK。フォルダを除外するとサブツリー全体が除外される
+            on = self.tree_model.toggle_excluded(relpath)
+            self._refresh_exclude_marks(row)
+            debug(f"除外{'ON' if on else 'OFF'}: {relpath}（子孫も{'ON' if on else 'OFF'}）")
+            self.log(f"除外{'ON' if on else 'OFF'}: {relpath}（子孫も{'ON' if on else 'OFF'}）")
             self.log(f"除外リスト: {sorted(self.exclude_targets)}")
         else:
-            print("[DEBUG] ZIP化/除外列以外。処理しません。")
+            debug("ZIP化/除外列以外。処理しません。")
             return
 
     def run_flatten(self):
@@ -606,38 +516,22 @@ class FlattenApp(tk.Tk):
         if not os.path.isdir(dst):
             messagebox.showerror("エラー", "出力フォルダを正しく指定してください")
             return
+        self.save_settings()
         self.run_btn.config(state=tk.DISABLED)
+        self.start_events('flatten')
         self.log("フラット化処理を開始します...")
         zip_targets = set(self.zip_targets)
         exclude_targets = set(getattr(self, 'exclude_targets', set()))
-        # 除外拡張子・ファイル名を複数行テキストから取得
-        exclude_exts = [e.strip() for e in self.exclude_ext_text.get('1.0', tk.END).splitlines() if e.strip()]
-        # 統計情報取得
-        scanner = DirectoryScanner(src)
-        items = scanner.scan()
-        total_count = 0
-        total_size = 0
-        for item in items:
-            if not item.get('is_dir'):
-                ext = item.get('ext', '').lower()
-                relpath = item['relpath']
-                if ext and any(ext == ('.' + e.lstrip('.').lower()) for e in exclude_exts):
-                    continue
-                total_count += 1
-                size = item.get('size', 0)
-                if isinstance(size, int) and size >= 0:
-                    total_size += size
-        self._flatten_progress = {
-            'total_count': total_count,
-            'total_size': total_size,
-            'done_count': 0,
-            'done_size': 0
-        }
+        # 除外拡張子・ファイル名・フォルダを複数行テキストから取得
+        exclude_filter = self.get_exclude_filter()
+        # 統計情報取得（スキャン済みなら同じ結果を再利用し、ディスク走査を繰り返さない）
+        items = DirectoryScanner.cached_scan(src, exclude_filter=exclude_filter)
+        total_count, total_size = count_targets(items, exclude_filter)
         # 進捗表示用ラベル（stat_labelの右側に表示するため、ここでは値のみ更新）
         self.progress_label.config(
             text=f" | 残り{total_count:,}件, 処理済0件, 残り{self.human_readable_size(total_size)}"
         )
-        threading.Thread(target=self._flatten_thread, args=(src, dst, zip_targets, exclude_targets, exclude_exts), daemon=True).start()
+        threading.Thread(target=self._flatten_thread, args=(src, dst, zip_targets, exclude_targets, exclude_filter, items, self.get_jobs(), self.incremental_var.get(), self.transfer_var.get(), 'link' if self.dedup_var.get() else 'off'), daemon=True).start()
 
     def on_mode_change(self):
         mode = self.mode_var.get()
@@ -657,176 +551,157 @@ class FlattenApp(tk.Tk):
         # 入力フォルダ内のファイルをスキャンし、filemap/推測復元パスを本ロジックで表示
         if not hasattr(self, 'restore_tree'):
             return
+        # filemap の読み込み・照合はワーカースレッドで行い、結果は _pump_events で少しずつ追加する
+        # （大きなfilemapでもUIが固まらない）
         self.restore_tree.delete(*self.restore_tree.get_children())
+        self._restore_plan_id += 1
+        self._restore_rows.clear()
         src = self.src_var.get()
         if not os.path.isdir(src):
             return
-        filemap_path = os.path.join(src, "filemap.csv")
-        filemap = []
-        if os.path.exists(filemap_path):
-            try:
-                filemap = FileMap.load_csv(filemap_path)
-            except Exception:
-                pass
-        files = []
-        for root, dirs, fs in os.walk(src):
-            for f in fs:
-                if f == "filemap.csv":
-                    continue
-                rel = os.path.relpath(os.path.join(root, f), src)
-                files.append(rel)
-        for f in files:
-            # filemap方式
-            filemap_path_val = ""
-            if filemap:
-                rec = next((row for row in filemap if row['flattened_name'] == f), None)
-                if rec:
-                    filemap_path_val = rec['original_path']
-            # ファイル名推測方式
-            try:
-                parts = f.split('_')
-                decoded = [urllib.parse.unquote(p) for p in parts]
-                guess_path_val = os.path.join(*decoded)
-            except Exception:
-                guess_path_val = ""
+        threading.Thread(target=self._restore_plan_thread, args=(src, self._restore_plan_id), daemon=True).start()
+
+    def _restore_plan_thread(self, src, plan_id):
+        # ワーカースレッド: Tkウィジェットには触れず、結果はイベントキューへ送る
+        try:
+            rows = RestoreEngine(src, src).plan()
+        except Exception as e:
+            self.events.log(f"復元プレビュー作成エラー: {e}")
+            rows = []
+        # 作成中に処理が始まってキューが差し替わっても、その時点のキューへ送る
+        self.events.post('restore_plan', (plan_id, rows))
+
+    def _insert_restore_rows(self):
+        # 復元プレビューへ1フレーム分の行を追加する
+        rows = self._restore_rows
+        for _ in range(min(len(rows), self.RESTORE_TREE_BATCH)):
+            f, filemap_path_val, guess_path_val = rows.popleft()
             self.restore_tree.insert('', 'end', text=f, values=(f, filemap_path_val, guess_path_val))
 
-    def _flatten_thread(self, src, dst, zip_targets, exclude_targets, exclude_exts):
+    def _flatten_thread(self, src, dst, zip_targets, exclude_targets, exclude_filter, items=None, jobs=DEFAULT_JOBS, incremental=False, transfer='auto', dedup='off'):
+        # ワーカースレッド: Tkウィジェットには触れず、ログ・進捗・完了はイベントキューへ送る
+        events = self.events
         try:
-            scanner = DirectoryScanner(src)
-            items = scanner.scan()
-            count = 0
-            filemap = []
-            # --- ZIP化対象のディレクトリを先にZIP化 ---
-            zip_count = 0
-            zip_total = len(zip_targets)
-            zip_spinner_seq = ['|', '/', '-', '\\']
-            zip_spinner_idx = 0
-            def spin_update(zc, zt, idx):
-                spin = zip_spinner_seq[idx % len(zip_spinner_seq)]
-                remain_count = self._flatten_progress['total_count'] - self._flatten_progress['done_count']
-                remain_size = self._flatten_progress['total_size'] - self._flatten_progress['done_size']
-                self.progress_label.config(
-                    text=f" | 残り{remain_count:,}件, 処理済{self._flatten_progress['done_count']:,}件, 残り{self.human_readable_size(remain_size)} / {self.human_readable_size(self._flatten_progress['total_size'])}  (ZIP圧縮中 {zc}/{zt} {spin})"
-                )
-            for relpath in sorted(zip_targets):
-                if relpath in exclude_targets:
-                    self.log(f"スキップ（除外指定）: {relpath}")
-                    continue
-                abs_dir = os.path.join(src, relpath)
-                zip_name = flatten_filename(relpath) + ".zip"
-                zip_path = os.path.join(dst, zip_name)
-                zip_count += 1
-                # スピナーを一定時間ごとに回す
-                spinning = True
-                def spinner_loop(zc=zip_count, zt=zip_total):
-                    nonlocal zip_spinner_idx, spinning
-                    if not spinning:
-                        return
-                    zip_spinner_idx = (zip_spinner_idx + 1) % len(zip_spinner_seq)
-                    spin_update(zc, zt, zip_spinner_idx)
-                    self.progress_label.after(120, spinner_loop, zc, zt)
-                spinning = True
-                self.progress_label.after(0, spinner_loop, zip_count, zip_total)
-                try:
-                    shutil.make_archive(zip_path[:-4], 'zip', abs_dir)
-                    if not zip_path.endswith('.zip'):
-                        zip_path += '.zip'
-                    self.log(f"ZIP化: {abs_dir} → {zip_path}")
-                    filemap.append({
-                        "original_path": relpath,
-                        "flattened_name": os.path.basename(zip_path)
-                    })
-                except Exception as e:
-                    self.log(f"ZIP化エラー: {abs_dir} : {e}")
-                spinning = False
-                # 最終状態を明示的に表示
-                spin_update(zip_count, zip_total, zip_spinner_idx)
-            # --- 通常ファイルのフラット化 ---
-            for item in items:
-                if not item['is_dir']:
-                    skip = False
-                    for z in zip_targets:
-                        if item['relpath'].startswith(z + os.sep) or item['relpath'] == z:
-                            skip = True
-                            break
-                    if skip:
-                        continue
-                    if item['relpath'] in exclude_targets:
-                        self.log(f"スキップ（除外指定）: {item['relpath']}")
-                        continue
-                    ext = os.path.splitext(item['name'])[1].lower()
-                    if ext and any(ext == ('.' + e.lstrip('.').lower()) for e in exclude_exts):
-                        self.log(f"スキップ（除外拡張子）: {item['relpath']}")
-                        continue
-                    src_path = os.path.join(src, item['relpath'])
-                    # flatten_filename高速化: 既存のままでは遅い場合はキャッシュ利用
-                    if not hasattr(self, '_flatten_name_cache'):
-                        self._flatten_name_cache = {}
-                    relpath_key = item['relpath']
-                    if relpath_key in self._flatten_name_cache:
-                        flat_name = self._flatten_name_cache[relpath_key]
-                    else:
-                        flat_name = flatten_filename(relpath_key)
-                        self._flatten_name_cache[relpath_key] = flat_name
-                    dst_path = os.path.join(dst, flat_name)
-                    try:
-                        os.makedirs(os.path.dirname(dst_path), exist_ok=True)
-                        shutil.copy2(src_path, dst_path)
-                        count += 1
-                        filemap.append({
-                            "original_path": item['relpath'],
-                            "flattened_name": flat_name
-                        })
-                        self.log(f"コピー: {src_path} → {dst_path}")
-                        # 進捗更新
-                        self._flatten_progress['done_count'] += 1
-                        size = item.get('size', 0)
-                        if isinstance(size, int) and size >= 0:
-                            self._flatten_progress['done_size'] += size
-                        remain_count = self._flatten_progress['total_count'] - self._flatten_progress['done_count']
-                        remain_size = self._flatten_progress['total_size'] - self._flatten_progress['done_size']
-                        total = self._flatten_progress['total_count']
-                        done = self._flatten_progress['done_count']
-                        total_size = self._flatten_progress['total_size']
-                        done_size = self._flatten_progress['done_size']
-                        self.progress_label.after(0, lambda c=done, rc=remain_count, ds=done_size, rs=remain_size, t=total, ts=total_size: self.progress_label.config(
-                            text=f" | 残り{rc:,}件, 処理済{c:,}件, 残り{self.human_readable_size(rs)} / {self.human_readable_size(ts)}"
-                        ))
-                    except Exception as e:
-                        self.log(f"エラー: {src_path} → {dst_path} : {e}")
-            out_csv = os.path.join(dst, "filemap.csv")
-            FileMap.save_csv(filemap, out_csv)
-            self.log(f"filemap.csv を出力: {out_csv}")
-            self.log(f"\n完了: {count} ファイルをフラット化・{len(zip_targets)}フォルダをZIP化しました")
+            engine = FlattenEngine(src, dst, zip_targets=zip_targets, exclude_targets=exclude_targets,
+                                   exclude_exts=exclude_filter, jobs=jobs, incremental=incremental,
+                                   transfer=transfer, dedup=dedup, log=events.log, progress=events.progress)
+            engine.run(items)
+        except Exception as e:
+            events.log(f"フラット化エラー: {e}")
         finally:
-            self.run_btn.config(state=tk.NORMAL)
-            if hasattr(self, 'progress_label'):
-                self.progress_label.after(0, lambda: self.progress_label.config(text=""))
-            # 完了ポップアップ＋エクスプローラーで出力先を開く
+            events.post('flatten_done', dst)
+
+    def _flatten_done(self, dst):
+        # スキャン結果の再利用はスキャン→フラット化の1回分だけ（次のフラット化では追加・変更されたファイルを拾い直す）
+        DirectoryScanner.clear_cache()
+        self.run_btn.config(state=tk.NORMAL)
+        self.progress_label.config(text="")
+        # 完了ポップアップ＋エクスプローラーで出力先を開く
+        try:
+            import subprocess
+            messagebox.showinfo(
+                "完了",
+                "フラット化・ZIP化が完了しました！\n\n出力フォルダを開きます。\n\n※エクスプローラーでファイルが表示されない場合は、右クリック→最新の情報に更新 でリフレッシュしてください。"
+            )
+            if os.name == 'nt':
+                # Windows
+                os.startfile(dst)
+            else:
+                # Mac/Linux
+                subprocess.Popen(['open' if sys.platform == 'darwin' else 'xdg-open', dst])
+        except Exception as e:
+            self.log(f"エクスプローラー起動エラー: {e}")
+
+    def start_events(self, kind):
+        """
+        処理ごとに新しいイベントキューを用意する（ログ保存ONなら全ログをファイルにも書き出す）
+        """
+        self.events.close()
+        log_path = None
+        if self.log_file_var.get():
             try:
-                import subprocess
-                messagebox.showinfo(
-                    "完了",
-                    "フラット化・ZIP化が完了しました！\n\n出力フォルダを開きます。\n\n※エクスプローラーでファイルが表示されない場合は、右クリック→最新の情報に更新 でリフレッシュしてください。"
-                )
-                if os.name == 'nt':
-                    # Windows
-                    os.startfile(dst)
-                else:
-                    # Mac/Linux
-                    subprocess.Popen(['open' if sys.platform == 'darwin' else 'xdg-open', dst])
-            except Exception as e:
-                self.log(f"エクスプローラー起動エラー: {e}")
+                import datetime
+                os.makedirs(self.LOG_DIR, exist_ok=True)
+                log_path = os.path.join(self.LOG_DIR, f"{kind}_{datetime.datetime.now():%Y%m%d_%H%M%S}.log")
+            except OSError as e:
+                self.log(f"ログファイル作成エラー: {e}")
+        self.events = EventQueue(log_path)
+        self._job_kind = kind
+        if log_path:
+            self.log(f"全ログをファイルに保存: {log_path}")
+        return self.events
+
+    def _progress_text(self, p, note):
+        remain_count = p['total_count'] - p['done_count']
+        # コピー途中の大きなファイルのコピー済みバイト数も進んだ分として表示する
+        remain_size = max(0, p['total_size'] - p['done_size'] - p.get('copying_size', 0))
+        text = f" | 残り{remain_count:,}件, 処理済{p['done_count']:,}件, 残り{self.human_readable_size(remain_size)} / {self.human_readable_size(p['total_size'])}"
+        if note:
+            # ZIP圧縮中はフレームごとにスピナーを回す
+            spin = ['|', '/', '-', '\\'][self._spinner_idx % 4]
+            text += f"  ({note} {spin})"
+        return text
+
+    def _pump_events(self):
+        """
+        UIスレッドで一定間隔に呼ばれ、ワーカーからのログ・進捗・完了通知をまとめて反映する
+        """
+        try:
+            logs, dropped, progress, events = self.events.drain(self.LOG_BATCH)
+            if dropped:
+                logs.insert(0, f"…（表示しきれないログ {dropped:,} 行を省略）")
+            if logs:
+                self._append_log(logs)
+            if progress is not None:
+                self._last_progress = progress
+            last = getattr(self, '_last_progress', None)
+            if last is not None:
+                p, note = last
+                if self._job_kind == 'flatten' and 'total_size' in p:
+                    self._spinner_idx += 1
+                    self.progress_label.config(text=self._progress_text(p, note))
+                elif self._job_kind == 'restore':
+                    self._update_restore_progress(p['done_count'], p['total_count'])
+                if not note:
+                    self._last_progress = None
+            for kind, payload in events:
+                if kind == 'restore_plan':
+                    plan_id, rows = payload
+                    if plan_id == self._restore_plan_id:
+                        self._restore_rows.extend(rows)
+                    continue
+                self._last_progress = None
+                self.events.close()
+                if kind == 'flatten_done':
+                    self._flatten_done(payload)
+                elif kind == 'restore_done':
+                    self._restore_done()
+            if self._restore_rows:
+                self._insert_restore_rows()
+        finally:
+            self.after(self.UI_FRAME_MS, self._pump_events)
 
-    def log(self, msg):
+    def _append_log(self, lines):
         self.log_text.config(state=tk.NORMAL)
-        self.log_text.insert(tk.END, msg + '\n')
+        self.log_text.insert(tk.END, '\n'.join(lines) + '\n')
+        # リングバッファ: 最大行数を超えたら古い行から削除
+        line_count = int(self.log_text.index('end-1c').split('.')[0])
+        if line_count > self.LOG_VIEW_LINES:
+            self.log_text.delete('1.0', f"{line_count - self.LOG_VIEW_LINES + 1}.0")
         self.log_text.see(tk.END)
         self.log_text.config(state=tk.DISABLED)
 
-def main():
+    def log(self, msg):
+        # UIスレッドからの直接ログ（ワーカースレッドからは self.events.log を使う）
+        self._append_log([msg])
+
+def main(started=None):
+    """
+    started: 起動時刻（time.perf_counter() の値）。指定するとウィンドウ表示までの時間をデバッグログに記録する
+    """
     app = FlattenApp()
+    if started is not None:
+        app.after_idle(lambda: record_startup(started, "ウィンドウ表示"))
     app.mainloop()
 
 # 直接実行時は警告のみ（正しい起動経路は main.py 経由）
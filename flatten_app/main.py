@@ -1,40 +1,26 @@
-
+import time
+_STARTED = time.perf_counter()  # 起動時間の計測用（--debug 時にデバッグログへ記録）
 import sys
 import os
 # flatten_appディレクトリの親をsys.pathに追加（どこから実行してもOKにする）
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 if __name__ == "__main__":
-    # --- デバッグ: どのFlattenApp/どのgui.pyが使われているかを記録 ---
-    import os
-    import sys
-    import datetime
-    try:
-        from flatten_app import gui as gui_mod
-        # バイナリ実行時はデバッグファイルを出力しない
-        if hasattr(sys, '_MEIPASS'):
-            pass
-        else:
-            debug_dir = os.path.dirname(os.path.abspath(__file__))
-            debug_main_entry_path = os.path.join(debug_dir, "debug_main_entry.txt")
-            with open(debug_main_entry_path, "w", encoding="utf-8") as f:
-                f.write(f"main.py __file__ = {__file__}\n")
-                f.write(f"gui_mod.__file__ = {getattr(gui_mod, '__file__', 'N/A')}\n")
-                f.write(f"FlattenApp = {getattr(gui_mod, 'FlattenApp', 'N/A')}\n")
-                f.write(f"datetime = {datetime.datetime.now()}\n")
-    except Exception as e:
-        try:
-            if hasattr(sys, '_MEIPASS'):
-                pass
-            else:
-                debug_dir = os.path.dirname(os.path.abspath(__file__))
-                debug_main_entry_path = os.path.join(debug_dir, "debug_main_entry.txt")
-                with open(debug_main_entry_path, "a", encoding="utf-8") as f:
-                    f.write(f"[ERROR] {e}\n")
-        except Exception:
-            pass
-    if '--cli' in sys.argv:
-        print("CLIモード（未実装）")
-    else:
-        from flatten_app.gui import main as gui_main
-        gui_main()
+    # PyInstallerバイナリでプロセスプール（並列ZIP化）を使うために必要
+    import multiprocessing
+    multiprocessing.freeze_support()
+    # --- デバッグ出力: --debug か環境変数 BJB_PATHFLATTENER_DEBUG を指定したときだけ ---
+    # 書き出し先は ~/.bjb_pathflattener/logs/debug.log（実行ファイルの隣には書かない）
+    from flatten_app.flattener import debuglog
+    argv = sys.argv[1:]
+    if '--debug' in argv or debuglog.env_enabled():
+        argv = [a for a in argv if a != '--debug']
+        debuglog.enable()
+        debuglog.debug(f"main: __file__={__file__} frozen={hasattr(sys, '_MEIPASS')} argv={argv}")
+    # --- CLIモード: GUI（Tkinter/Pillow）を一切importしない ---
+    if '--cli' in argv:
+        from flatten_app.cli import main as cli_main
+        sys.exit(cli_main([a for a in argv if a != '--cli']))
+    from flatten_app.gui import main as gui_main
+    debuglog.record_startup(_STARTED, "GUIモジュール読み込み")
+    gui_main(started=_STARTED)
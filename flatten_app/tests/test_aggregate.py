@@ -0,0 +1,26 @@
+import os
+import pytest
+from flattener.aggregate import DirectoryAggregate
+
+
+def test_aggregate_sums_subtrees_bottom_up():
+    j = os.path.join
+    items = [
+        {'relpath': 'a', 'is_dir': True, 'name': 'a'},
+        {'relpath': j('a', 'f.txt'), 'is_dir': False, 'size': 3, 'mtime': 10.0},
+        {'relpath': j('a', 'b'), 'is_dir': True, 'name': 'b'},
+        {'relpath': j('a', 'b', 'g.txt'), 'is_dir': False, 'size': 5, 'mtime': 30.0},
+        {'relpath': j('a', 'b', 'bad'), 'is_dir': False, 'size': -1, 'mtime': None},
+        # 親フォルダの行がなくても祖先から順にIDを振る
+        {'relpath': j('x', 'y', 'z.txt'), 'is_dir': False, 'size': 7, 'mtime': 20.0},
+        {'relpath': 'top.txt', 'is_dir': False, 'size': 1, 'mtime': 5.0},
+    ]
+    agg = DirectoryAggregate(items)
+    assert all(agg.parent[i] < i for i in range(1, len(agg)))
+    assert agg.size_of('a') == 8 and agg.size_of(j('a', 'b')) == 5 and agg.size_of('x') == 7
+    assert agg.size_of('') == 16 and agg.count_of('') == 5
+    assert agg.count_of('a') == 3 and agg.files_in('a') == 1
+    assert agg.mtime_of('a') == 30.0 and agg.mtime_of('x') == 20.0
+    assert agg.mtime_of('missing') is None and agg.size_of('missing') == 0
+    with pytest.raises(RuntimeError):
+        agg.add({'relpath': 'late.txt', 'is_dir': False, 'size': 1})
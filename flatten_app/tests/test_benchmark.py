@@ -0,0 +1,32 @@
+import json
+import os
+from benchmark import STAGES, compare, main, make_tree, run_benchmark
+
+
+def test_make_tree_is_deterministic(tmp_path):
+    a = make_tree(str(tmp_path / 'a'), depth=2, fanout=2, files=3, seed=1)
+    b = make_tree(str(tmp_path / 'b'), depth=2, fanout=2, files=3, seed=1)
+    assert a == b and a['files'] == 3 * (1 + 2 + 4) and a['dirs'] == 6
+    names = sorted(os.path.relpath(os.path.join(d, f), tmp_path / 'a')
+                   for d, _dirs, files in os.walk(tmp_path / 'a') for f in files)
+    assert names == sorted(os.path.relpath(os.path.join(d, f), tmp_path / 'b')
+                           for d, _dirs, files in os.walk(tmp_path / 'b') for f in files)
+
+
+def test_run_benchmark_times_every_stage(tmp_path):
+    result = run_benchmark(str(tmp_path), jobs=2, depth=1, fanout=2, files=4, size_dist='tiny')
+    assert set(result['stages']) == set(STAGES)
+    assert result['tree']['files'] == 12
+    assert result['stages']['scan']['items'] == 14
+    assert result['stages']['restore']['items'] == 12
+    assert all(stage['seconds'] >= 0 for stage in result['stages'].values())
+    json.dumps(result)
+    assert compare(result, result)[0].endswith('（×1.00）')
+
+
+def test_main_writes_json(tmp_path):
+    out = tmp_path / 'bench.json'
+    assert main(['--depth', '0', '--files', '3', '--size-dist', 'tiny', '--stages', 'scan,restore',
+                 '--output', str(out)]) == 0
+    data = json.loads(out.read_text(encoding='utf-8'))
+    assert set(data['stages']) == {'scan', 'restore'}
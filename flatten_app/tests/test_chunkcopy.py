@@ -0,0 +1,80 @@
+import hashlib
+import os
+from flattener import engine as engine_mod
+from flattener.chunkcopy import (AdaptiveChunk, chunked_copy, get_buffer, read_digest,
+                                 INITIAL_CHUNK_SIZE, MAX_CHUNK_SIZE)
+from flattener.engine import FlattenEngine
+
+
+def _make_file(path, size):
+    data = os.urandom(size)
+    path.write_bytes(data)
+    os.utime(path, (1600000000, 1600000000))
+    return data
+
+
+def test_chunked_copy_sequential_and_parallel_ranges(tmp_path):
+    src = tmp_path / 'src.bin'
+    data = _make_file(src, 3 * 1024 * 1024 + 123)
+    for name, kwargs in (('seq.bin', {}), ('par.bin', {'parallel_min_size': 1, 'range_jobs': 3})):
+        dst = tmp_path / name
+        dst.write_text('old')
+        seen = []
+        assert chunked_copy(str(src), str(dst), progress=seen.append, **kwargs) == len(data)
+        assert dst.read_bytes() == data
+        assert sum(seen) == len(data) and len(seen) > 1
+        assert int(os.path.getmtime(dst)) == 1600000000
+
+
+def test_chunked_copy_hashes_on_the_same_read(tmp_path):
+    src = tmp_path / 'src.bin'
+    data = _make_file(src, 2 * 1024 * 1024 + 5)
+    h = hashlib.sha256()
+    chunked_copy(str(src), str(tmp_path / 'dst.bin'), hasher=h, parallel_min_size=1)
+    assert h.hexdigest() == hashlib.sha256(data).hexdigest()
+    assert read_digest(str(src)) == h.hexdigest()
+    assert read_digest(str(src), 'sha256', limit=1000) == hashlib.sha256(data[:1000]).hexdigest()
+
+
+def test_adaptive_chunk_and_buffer_reuse():
+    chunk = AdaptiveChunk(initial=1024 * 1024, minimum=256 * 1024, maximum=4 * 1024 * 1024, target=0.05)
+    chunk.update(chunk.size, 0.001)
+    assert chunk.size == 2 * 1024 * 1024
+    chunk.update(100, 10.0)  # 末尾の短い読み込みでは変えない
+    assert chunk.size == 2 * 1024 * 1024
+    chunk.update(chunk.size, 1.0)
+    chunk.update(chunk.size, 1.0)
+    chunk.update(chunk.size, 1.0)
+    assert chunk.size == 256 * 1024
+    view = get_buffer(1024)
+    assert get_buffer(512) is view
+    assert len(get_buffer(len(view) + 1)) > len(view)
+
+
+def test_large_buffer_is_released_after_each_file(tmp_path):
+    src = tmp_path / 'src.bin'
+    _make_file(src, 1000)
+    assert len(get_buffer(MAX_CHUNK_SIZE)) == MAX_CHUNK_SIZE
+    read_digest(str(src))
+    # 大きなファイルで広げたバッファは次のファイルまで持ち越さない（初期サイズ以下で作り直す）
+    assert len(get_buffer(1024)) <= INITIAL_CHUNK_SIZE
+    get_buffer(MAX_CHUNK_SIZE)
+    chunked_copy(str(src), str(tmp_path / 'dst.bin'))
+    assert len(get_buffer(1024)) <= INITIAL_CHUNK_SIZE
+
+
+def test_flatten_reports_progress_within_large_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(engine_mod, 'BYTE_PROGRESS_MIN_SIZE', 1024 * 1024)
+    monkeypatch.setattr(engine_mod, 'BYTE_PROGRESS_INTERVAL', 0)
+    src = tmp_path / 'src'
+    (src / 'd').mkdir(parents=True)
+    data = _make_file(src / 'd' / 'big.bin', 2 * 1024 * 1024)
+    (src / 'small.txt').write_text('s')
+    updates = []
+    engine = FlattenEngine(str(src), str(tmp_path / 'flat'), transfer='chunked', jobs=2,
+                           progress=lambda p, note: updates.append((dict(p), note)))
+    engine.run()
+    copying = [p['copying_size'] for p, note in updates if note.startswith('コピー中 d__big.bin')]
+    assert copying and copying == sorted(copying) and copying[-1] == len(data)
+    assert updates[-1][0]['copying_size'] == 0 and updates[-1][0]['done_size'] == len(data) + 1
+    assert (tmp_path / 'flat' / 'd__big.bin').read_bytes() == data
@@ -0,0 +1,66 @@
+import os
+import subprocess
+import sys
+import time
+from flattener import debuglog
+
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _listing(folder):
+    return sorted(n for n in os.listdir(folder) if n != '__pycache__')
+
+
+def test_debug_only_when_enabled(tmp_path):
+    path = tmp_path / 'logs' / 'debug.log'
+    debuglog.debug('無効なので書かない')
+    assert not path.exists()
+    try:
+        assert debuglog.enable(str(path)) == str(path)
+        debuglog.debug('1行目')
+        elapsed = debuglog.record_startup(time.perf_counter() - 2, 'テスト', budget_ms=1000)
+    finally:
+        debuglog.disable()
+    debuglog.debug('無効に戻したので書かない')
+    lines = path.read_text(encoding='utf-8').splitlines()
+    assert len(lines) == 2 and lines[0].endswith('1行目')
+    assert elapsed >= 2000 and '[警告] テスト' in lines[1]
+
+
+def test_gui_import_is_lazy_and_writes_nothing(tmp_path):
+    # GUIモジュールの読み込みで Pillow・ZIP・SQLite・プロファイラを読み込まず、ファイルも書かない
+    env = dict(os.environ, HOME=str(tmp_path), USERPROFILE=str(tmp_path))
+    env.pop(debuglog.DEBUG_ENV, None)
+    code = (
+        "import sys, time; t = time.perf_counter()\n"
+        "import flatten_app.gui\n"
+        "print((time.perf_counter() - t) * 1000)\n"
+        "lazy = ('PIL', 'zipfile', 'sqlite3', 'cProfile', 'pstats', 'subprocess', 'asyncio', "
+        "'concurrent.futures.process')\n"
+        "print(','.join(m for m in lazy if m in sys.modules))\n"
+    )
+    before = _listing(APP_ROOT)
+    proc = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                          cwd=os.path.dirname(APP_ROOT), env=env)
+    assert proc.returncode == 0, proc.stderr
+    elapsed_ms, loaded = proc.stdout.splitlines()
+    assert loaded == ''
+    assert float(elapsed_ms) < debuglog.STARTUP_BUDGET_MS
+    assert _listing(APP_ROOT) == before
+    assert os.listdir(tmp_path) == []
+
+
+def test_main_debug_flag_writes_to_user_dir(tmp_path):
+    src, dst = tmp_path / 'src', tmp_path / 'dst'
+    (src / 'a').mkdir(parents=True)
+    (src / 'a' / 'f.txt').write_text('x')
+    env = dict(os.environ, HOME=str(tmp_path), USERPROFILE=str(tmp_path))
+    env.pop(debuglog.DEBUG_ENV, None)
+    before = _listing(APP_ROOT)
+    proc = subprocess.run([sys.executable, os.path.join(APP_ROOT, 'main.py'), '--debug', '--cli',
+                           'flatten', str(src), str(dst), '-q'], capture_output=True, text=True, env=env)
+    assert proc.returncode == 0, proc.stderr
+    assert (dst / 'a__f.txt').read_text() == 'x'
+    log = (tmp_path / '.bjb_pathflattener' / 'logs' / 'debug.log').read_text(encoding='utf-8')
+    assert 'main: ' in log and "'--debug'" not in log
+    assert _listing(APP_ROOT) == before
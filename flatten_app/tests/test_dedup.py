@@ -0,0 +1,22 @@
+from flattener.dedup import file_digest, find_duplicates, PARTIAL_HASH_SIZE
+
+
+def test_find_duplicates_groups_by_size_then_hash(tmp_path):
+    big = b'a' * (PARTIAL_HASH_SIZE + 10)
+    contents = {
+        'a1': big, 'a2': big,
+        'b': big[:-1] + b'b',        # 先頭は同じで末尾だけ違う
+        's1': b'small', 's2': b'small', 's3': b'SMALL',
+        'empty1': b'', 'empty2': b'',
+    }
+    files = []
+    for i, (name, data) in enumerate(contents.items()):
+        path = tmp_path / name
+        path.write_bytes(data)
+        files.append((i, str(path), len(data)))
+    files.append((99, str(tmp_path / 'missing'), len(big)))
+    logs = []
+    assert find_duplicates(files, jobs=4, log=logs.append) == {1: 0, 4: 3}
+    assert len(logs) == 1 and 'missing' in logs[0]
+    assert file_digest(str(tmp_path / 'a1'), limit=PARTIAL_HASH_SIZE) == file_digest(str(tmp_path / 'b'), limit=PARTIAL_HASH_SIZE)
+    assert file_digest(str(tmp_path / 'a1')) != file_digest(str(tmp_path / 'b'))
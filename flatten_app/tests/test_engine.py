@@ -0,0 +1,328 @@
+import os
+import sys
+import zipfile
+from flattener.engine import FlattenEngine, RestoreEngine, VerifyEngine, count_targets, auto_zip_targets, file_digest
+from flattener.filemap import FileMap
+from flattener.instrument import Instrument
+
+
+def _make_tree(root):
+    (root / 'a' / 'b').mkdir(parents=True)
+    (root / 'eds').mkdir()
+    (root / 'a' / 'b' / 'file1.txt').write_text('one')
+    (root / 'a' / 'file2.txt').write_text('two')
+    (root / 'a' / 'skip.tmp').write_text('tmp')
+    (root / 'eds' / 'spec.pdf').write_text('pdf')
+    (root / 'top.txt').write_text('top')
+
+
+def test_flatten_and_restore_roundtrip(tmp_path):
+    src, flat, out = tmp_path / 'src', tmp_path / 'flat', tmp_path / 'out'
+    src.mkdir(); flat.mkdir(); out.mkdir()
+    _make_tree(src)
+    logs = []
+    engine = FlattenEngine(str(src), str(flat), zip_targets={'eds'}, exclude_exts=['.tmp'], log=logs.append)
+    items = engine.scan()
+    assert count_targets(items, ['.tmp']) == (4, 12)
+    assert auto_zip_targets(items, ['pdf']) == {'eds'}
+    result = engine.run(items)
+    assert result['count'] == 3
+    assert result['zip_count'] == 1
+    names = sorted(os.listdir(flat))
+    assert names == ['a__b__file1.txt', 'a__file2.txt', 'eds.zip', 'filemap.csv', 'top.txt']
+    rows = FileMap.load_csv(str(flat / 'filemap.csv'))
+    assert {r['flattened_name'] for r in rows} == {'eds.zip', 'a__b__file1.txt', 'a__file2.txt', 'top.txt'}
+
+    count = RestoreEngine(str(flat), str(out), method='filemap', unzip=True).run()
+    assert count == 4
+    assert (out / 'a' / 'b' / 'file1.txt').read_text() == 'one'
+    assert (out / 'eds' / 'spec.pdf').read_text() == 'pdf'
+    assert not (out / 'a' / 'skip.tmp').exists()
+
+
+def test_restore_by_filename_without_unzip(tmp_path):
+    flat, out = tmp_path / 'flat', tmp_path / 'out'
+    flat.mkdir(); out.mkdir()
+    (flat / 'x__y__z.txt').write_text('z')
+    with zipfile.ZipFile(flat / 'x__arc.zip', 'w') as zf:
+        zf.writestr('inner.txt', 'inner')
+    engine = RestoreEngine(str(flat), str(out), method='filename', unzip=False)
+    assert sorted(engine.plan()) == [('x__arc.zip', '', os.path.join('x', 'arc.zip')),
+                                     ('x__y__z.txt', '', os.path.join('x', 'y', 'z.txt'))]
+    assert engine.run() == 2
+    assert (out / 'x' / 'y' / 'z.txt').read_text() == 'z'
+    assert zipfile.is_zipfile(out / 'x' / 'arc.zip')
+
+
+def test_cli_does_not_import_tk(tmp_path):
+    import subprocess
+    src, dst = tmp_path / 'src', tmp_path / 'dst'
+    src.mkdir()
+    _make_tree(src)
+    main_py = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'main.py')
+    code = (
+        "import runpy, sys; sys.argv = [%r, '--cli', 'flatten', %r, %r, '-q'];\n"
+        "try:\n    runpy.run_path(%r, run_name='__main__')\n"
+        "except SystemExit as e:\n    assert not e.code, e.code\n"
+        "assert 'tkinter' not in sys.modules and 'PIL' not in sys.modules\n"
+    ) % (main_py, str(src), str(dst), main_py)
+    proc = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True)
+    assert proc.returncode == 0, proc.stderr
+    assert (dst / 'filemap.csv').exists()
+    assert (dst / 'a__b__file1.txt').read_text() == 'one'
+
+
+def test_destination_inside_source_is_refused(tmp_path):
+    import subprocess
+    import pytest
+    src = tmp_path / 'same'
+    src.mkdir()
+    _make_tree(src)
+    for dst in (src, src / 'out'):
+        with pytest.raises(ValueError):
+            FlattenEngine(str(src), str(dst)).run()
+        with pytest.raises(ValueError):
+            RestoreEngine(str(src), str(dst)).run()
+    main_py = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'main.py')
+    proc = subprocess.run([sys.executable, main_py, '--cli', 'flatten', str(src), str(src), '-j', '1', '-q'],
+                          capture_output=True, text=True)
+    assert proc.returncode == 2
+    assert (src / 'top.txt').read_text() == 'top'
+    assert not (src / 'out').exists() and not (src / 'filemap.csv').exists()
+
+
+def test_incremental_zip_detects_renames(tmp_path):
+    src, dst = tmp_path / 'src', tmp_path / 'dst'
+    src.mkdir()
+    _make_tree(src)
+    assert FlattenEngine(str(src), str(dst), zip_targets={'eds'}, incremental=True).run()['zip_count'] == 1
+    rows = {r['flattened_name']: r for r in FileMap.load_csv(str(dst / 'filemap.csv'))}
+    assert rows['eds.zip']['file_count'] == '1' and rows['eds.zip']['paths_hash']
+    # 合計サイズ・更新時刻が変わらない名前の変更もZIPを作り直す
+    os.rename(src / 'eds' / 'spec.pdf', src / 'eds' / 'renamed.pdf')
+    result = FlattenEngine(str(src), str(dst), zip_targets={'eds'}, incremental=True).run()
+    assert result['zip_count'] == 1
+    with zipfile.ZipFile(dst / 'eds.zip') as zf:
+        assert [os.path.basename(n) for n in zf.namelist()] == ['renamed.pdf']
+    assert FlattenEngine(str(src), str(dst), zip_targets={'eds'}, incremental=True).run()['zip_count'] == 0
+
+
+def test_incremental_after_full_flatten_keeps_zip(tmp_path):
+    src, dst = tmp_path / 'src', tmp_path / 'dst'
+    src.mkdir()
+    _make_tree(src)
+    (src / 'eds' / 'sub').mkdir()
+    (src / 'eds' / 'sub' / 'inner.txt').write_text('inner')
+    # 通常のフラット化はZIP化対象フォルダの中を走査しないが、差分判定用の列は中身から記録する
+    assert FlattenEngine(str(src), str(dst), zip_targets={'eds'}).run()['zip_count'] == 1
+    rows = {r['flattened_name']: r for r in FileMap.load_csv(str(dst / 'filemap.csv'))}
+    assert rows['eds.zip']['file_count'] == '2' and rows['eds.zip']['size'] == '8'
+    again = FlattenEngine(str(src), str(dst), zip_targets={'eds'}, incremental=True).run()
+    assert again['zip_count'] == 0 and again['unchanged'] == 4
+
+
+def test_restore_does_not_count_filemap_rows_per_file(tmp_path, monkeypatch):
+    import pytest
+    from flattener.filemap import LazyCSVFileMapIndex, SQLiteFileMapIndex
+    src = tmp_path / 'src'
+    src.mkdir()
+    _make_tree(src)
+    for fmt in ('csv', 'sqlite'):
+        flat, out = tmp_path / f'flat_{fmt}', tmp_path / f'out_{fmt}'
+        FlattenEngine(str(src), str(flat), filemap_format=fmt).run()
+        with monkeypatch.context() as m:
+            # 件数の取得（SQLite の COUNT(*)・CSV索引の完成待ち）はファイルごとに呼ばれてはいけない
+            for cls in (LazyCSVFileMapIndex, SQLiteFileMapIndex):
+                m.setattr(cls, '__len__', lambda self: pytest.fail('__len__ が呼ばれた'))
+            assert RestoreEngine(str(flat), str(out), method='filemap').run() == 4
+        assert (out / 'a' / 'b' / 'file1.txt').read_text() == 'one'
+
+
+def test_parallel_copy_keeps_scan_order(tmp_path):
+    src = tmp_path / 'src'
+    for d in range(5):
+        (src / f'd{d}').mkdir(parents=True)
+        for i in range(20):
+            (src / f'd{d}' / f'f{i:02}.txt').write_text(f'{d}-{i}' * (i + 1))
+    orders = []
+    for jobs in (1, 8):
+        dst = tmp_path / f'dst{jobs}'
+        engine = FlattenEngine(str(src), str(dst), jobs=jobs)
+        result = engine.run()
+        assert result['count'] == 100
+        assert engine.progress['done_count'] == 100
+        rows = FileMap.load_csv(str(dst / 'filemap.csv'))
+        orders.append([r['original_path'] for r in rows])
+        assert (dst / 'd3__f07.txt').read_text() == '3-7' * 8
+    assert orders[0] == orders[1]
+    assert orders[0] == [r['relpath'] for r in FlattenEngine(str(src), str(tmp_path)).scan() if not r['is_dir']]
+
+
+def test_asyncio_io_mode_matches_threads(tmp_path):
+    src = tmp_path / 'src'
+    for d in ('x/y', 'z'):
+        (src / d).mkdir(parents=True)
+        for i in range(15):
+            (src / d / f'{i:02}.txt').write_text(d + str(i))
+    (src / 'big.bin').write_bytes(b'b' * (300 * 1024))  # 大きなファイルは 'data' レーン
+    threads = FlattenEngine(str(src), str(tmp_path / 'flat_t'), jobs=4).run()
+    inst = Instrument()
+    engine = FlattenEngine(str(src), str(tmp_path / 'flat_a'), jobs=2, io_mode='asyncio', meta_jobs=8,
+                           instrument=inst)
+    assert engine.run()['count'] == threads['count'] == 31
+    rows_t = FileMap.load_csv(str(tmp_path / 'flat_t' / 'filemap.csv'))
+    rows_a = FileMap.load_csv(str(tmp_path / 'flat_a' / 'filemap.csv'))
+    assert [r['original_path'] for r in rows_a] == [r['original_path'] for r in rows_t]
+    assert 1 <= inst.counters['inflight_peak:meta'] <= 8 and inst.counters['inflight_peak:data'] == 1
+    out = tmp_path / 'out'
+    assert RestoreEngine(str(tmp_path / 'flat_a'), str(out), jobs=2, io_mode='asyncio', meta_jobs=8).run() == 31
+    assert (out / 'x' / 'y' / '07.txt').read_text() == 'x/y7'
+    assert (out / 'big.bin').stat().st_size == 300 * 1024
+
+
+def test_incremental_flatten_copies_only_changes(tmp_path):
+    src, dst = tmp_path / 'src', tmp_path / 'dst'
+    src.mkdir()
+    _make_tree(src)
+    first = FlattenEngine(str(src), str(dst), zip_targets={'eds'}, incremental=True).run()
+    assert first['count'] == 3 and first['zip_count'] == 1 and first['unchanged'] == 0
+
+    again = FlattenEngine(str(src), str(dst), zip_targets={'eds'}, incremental=True).run()
+    assert again['count'] == 0 and again['zip_count'] == 0 and again['unchanged'] == 4
+
+    (src / 'a' / 'file2.txt').write_text('changed')
+    (src / 'top.txt').unlink()
+    (src / 'new.txt').write_text('new')
+    logs = []
+    third = FlattenEngine(str(src), str(dst), zip_targets={'eds'}, incremental=True, prune=True,
+                          jobs=1, log=logs.append).run()
+    assert third['count'] == 2 and third['unchanged'] == 2 and third['stale'] == 1
+    assert (dst / 'a__file2.txt').read_text() == 'changed'
+    assert not (dst / 'top.txt').exists()
+    rows = FileMap.load_csv(str(dst / 'filemap.csv'))
+    assert 'top.txt' not in {r['original_path'] for r in rows}
+    assert all(r['size'] and r['mtime'] for r in rows)
+
+    # サイズ・更新時刻が同じでも内容が異なれば checksum で検出する
+    st = os.stat(src / 'new.txt')
+    (dst / 'new.txt').write_text('NEW')
+    os.utime(dst / 'new.txt', ns=(st.st_atime_ns, st.st_mtime_ns))
+    assert FlattenEngine(str(src), str(dst), zip_targets={'eds'}, incremental=True).run()['count'] == 0
+    assert FlattenEngine(str(src), str(dst), zip_targets={'eds'}, incremental=True, checksum=True).run()['count'] == 1
+    assert (dst / 'new.txt').read_text() == 'new'
+
+
+
+def test_sqlite_filemap_incremental_restore_and_verify(tmp_path):
+    src, dst, out = tmp_path / 'src', tmp_path / 'dst', tmp_path / 'out'
+    src.mkdir()
+    _make_tree(src)
+    FlattenEngine(str(src), str(dst), zip_targets={'eds'}, incremental=True).run()
+    assert (dst / 'filemap.csv').exists()
+    # 形式を変えても前回の filemap.csv で差分判定し、filemap.db に置き換える
+    result = FlattenEngine(str(src), str(dst), zip_targets={'eds'}, incremental=True, verify=True,
+                           filemap_format='sqlite').run()
+    assert result['filemap_path'] == str(dst / 'filemap.db') and not (dst / 'filemap.csv').exists()
+    assert result['unchanged'] == 4
+    (src / 'a' / 'file2.txt').write_text('changed')
+    again = FlattenEngine(str(src), str(dst), zip_targets={'eds'}, incremental=True, verify=True,
+                          filemap_format='sqlite').run()
+    assert again['count'] == 1 and again['unchanged'] == 3
+    assert sorted(os.listdir(dst)) == ['a__b__file1.txt', 'a__file2.txt', 'eds.zip', 'filemap.db', 'top.txt']
+
+    assert RestoreEngine(str(dst), str(out)).run() == 4
+    assert (out / 'a' / 'file2.txt').read_text() == 'changed'
+    result = VerifyEngine(str(dst)).run()
+    assert result['checked'] == 4 and result['ok'] == 3 and not result['problems']
+
+
+def test_parallel_restore_creates_each_dir_once(tmp_path):
+    src, flat, out = tmp_path / 'src', tmp_path / 'flat', tmp_path / 'out'
+    for d in ('p/q/r', 'p/s', 't'):
+        (src / d).mkdir(parents=True)
+        for i in range(10):
+            (src / d / f'{i}.txt').write_text(d + str(i))
+    FlattenEngine(str(src), str(flat), zip_targets={'t'}).run()
+    assert RestoreEngine.leaf_dirs(['a/b/c', 'a/b', 'a', 'x', 'a/d']) == ['a/b/c', 'a/d', 'x']
+    made = []
+    real_makedirs = os.makedirs
+    def spy(path, *args, **kwargs):
+        made.append(path)
+        return real_makedirs(path, *args, **kwargs)
+    engine = RestoreEngine(str(flat), str(out), jobs=4)
+    try:
+        os.makedirs = spy
+        assert engine.run() == 21
+    finally:
+        os.makedirs = real_makedirs
+    # os.makedirs の内部での親フォルダ作成も含め、同じフォルダを2回作ろうとしない
+    assert len(made) == len(set(made))
+    assert {str(out / d) for d in ('p/q/r', 'p/s', 't')} <= set(made)
+    assert engine.progress == {'total_count': 21, 'done_count': 21}
+    assert (out / 'p' / 'q' / 'r' / '7.txt').read_text() == 'p/q/r7'
+    assert (out / 't' / '3.txt').read_text() == 't3'
+
+
+def test_excluded_folder_skips_whole_subtree(tmp_path):
+    src, dst = tmp_path / 'src', tmp_path / 'dst'
+    src.mkdir()
+    _make_tree(src)
+    engine = FlattenEngine(str(src), str(dst), zip_targets={'eds'}, exclude_targets={'a'})
+    # 除外・ZIP化対象フォルダの中は走査しない
+    assert sorted(r['relpath'] for r in engine.scan(prune=True)) == ['a', 'eds', 'top.txt']
+    result = engine.run()
+    assert result['count'] == 1 and result['zip_count'] == 1
+    assert sorted(os.listdir(dst)) == ['eds.zip', 'filemap.csv', 'top.txt']
+    with zipfile.ZipFile(dst / 'eds.zip') as zf:
+        assert zf.namelist() == ['spec.pdf']
+
+
+def test_dedup_link_and_record_restore_every_path(tmp_path):
+    src = tmp_path / 'src'
+    calib = b'calibration' * 10000
+    for d in ('run1', 'run2', 'run3/sub'):
+        (src / d).mkdir(parents=True)
+        (src / d / 'calib.bin').write_bytes(calib)
+    (src / 'run1' / 'same_size.bin').write_bytes(b'x' * len(calib))
+    (src / 'run2' / 'data.txt').write_text('unique')
+    for mode in ('link', 'record'):
+        flat, out = tmp_path / f'flat_{mode}', tmp_path / f'out_{mode}'
+        result = FlattenEngine(str(src), str(flat), dedup=mode, jobs=4).run()
+        assert result['count'] == 3 and result['deduped'] == 2
+        rows = {r['original_path']: r for r in FileMap.load_csv(str(flat / 'filemap.csv'))}
+        shared = [r['content_of'] for r in rows.values() if r['content_of']]
+        assert shared == ['run1__calib.bin'] * 2
+        assert rows[os.path.join('run1', 'same_size.bin')]['content_of'] == ''
+        if mode == 'link':
+            assert os.path.samefile(flat / 'run1__calib.bin', flat / 'run3__sub__calib.bin')
+        else:
+            assert not (flat / 'run2__calib.bin').exists()
+        assert RestoreEngine(str(flat), str(out)).run() == 5
+        for d in ('run1', 'run2', 'run3/sub'):
+            assert (out / d / 'calib.bin').read_bytes() == calib
+        assert (out / 'run2' / 'data.txt').read_text() == 'unique'
+
+
+def test_verify_records_hashes_and_detects_changes(tmp_path):
+    src, flat, out = tmp_path / 'src', tmp_path / 'flat', tmp_path / 'out'
+    src.mkdir()
+    _make_tree(src)
+    FlattenEngine(str(src), str(flat), zip_targets={'eds'}, verify=True, jobs=4).run()
+    rows = {r['flattened_name']: r for r in FileMap.load_csv(str(flat / 'filemap.csv'))}
+    assert rows['a__file2.txt']['sha256'] == file_digest(str(src / 'a' / 'file2.txt'))
+    assert rows['eds.zip']['sha256'] == ''
+    result = VerifyEngine(str(flat)).run()
+    assert (result['ok'], result['unverified'], result['problems']) == (3, 1, [])
+
+    # 差分フラット化で変更なしのファイルは前回のハッシュを引き継ぐ
+    FlattenEngine(str(src), str(flat), zip_targets={'eds'}, verify=True, incremental=True).run()
+    assert FileMap.load_csv(str(flat / 'filemap.csv'))[1]['sha256']
+
+    RestoreEngine(str(flat), str(out)).run()
+    restored = VerifyEngine(str(out), str(flat / 'filemap.csv'), target='restored', jobs=1).run()
+    assert restored['ok'] == 3 and restored['unverified'] == 1 and not restored['problems']
+
+    (flat / 'top.txt').write_text('TOP')
+    (flat / 'a__file2.txt').unlink()
+    result = VerifyEngine(str(flat)).run()
+    assert sorted(status for status, _ in result['problems']) == ['mismatch', 'missing']
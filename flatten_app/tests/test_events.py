@@ -0,0 +1,28 @@
+import threading
+from flattener.events import EventQueue
+
+
+def test_event_queue_batches_logs_and_keeps_latest_progress(tmp_path):
+    log_path = tmp_path / 'run.log'
+    q = EventQueue(str(log_path), max_pending=100)
+
+    def worker(n):
+        for i in range(200):
+            q.log(f"{n}-{i}")
+            q.progress({'done_count': i}, "")
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    q.post('done', 'payload')
+
+    logs, dropped, progress, events = q.drain(max_logs=30)
+    assert len(logs) == 30 and dropped == 700
+    assert progress == ({'done_count': 199}, "")
+    assert events == [('done', 'payload')]
+    logs, dropped, progress, events = q.drain()
+    assert len(logs) == 70 and dropped == 0 and progress is None and events == []
+    q.close()
+    # 画面表示は上限で間引かれても、ファイルには全行が残る
+    assert len(log_path.read_text(encoding='utf-8').splitlines()) == 800
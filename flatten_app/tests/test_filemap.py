@@ -1,6 +1,6 @@
 import os
 import tempfile
-from flattener.filemap import FileMap
+from flattener.filemap import FileMap, FileMapIndex, FileMapWriter, LazyCSVFileMapIndex, SQLiteFileMapWriter
 
 def test_filemap_csv_json():
     filemap = [
@@ -16,3 +16,144 @@ def test_filemap_csv_json():
         loaded_json = FileMap.load_json(json_path)
         assert loaded_csv == filemap
         assert loaded_json == filemap
+
+def test_filemap_index_lookup(tmp_path):
+    rows = [{"original_path": f"d{i}/f.txt", "flattened_name": f"d{i}__f.txt"} for i in range(1000)]
+    rows.append({"original_path": "dup/f.txt", "flattened_name": "d5__f.txt"})
+    csv_path = str(tmp_path / "filemap.csv")
+    FileMap.save_csv(rows, csv_path)
+    index = FileMap.load_index(csv_path)
+    assert len(index) == 1001
+    assert index.get_original("d999__f.txt") == "d999/f.txt"
+    assert index.get_original("d5__f.txt") == "d5/f.txt"  # 先頭の行を優先
+    assert index.get_flattened("dup/f.txt") == "d5__f.txt"
+    assert index.get_original("missing") is None
+    assert "d1__f.txt" in index
+    assert not FileMapIndex([])
+
+def test_filemap_writer_streaming_and_partial_tail(tmp_path):
+    path = str(tmp_path / "filemap.csv")
+    writer = FileMapWriter(path, flush_rows=2, flush_interval=3600)
+    writer.write({"original_path": "a/1.txt", "flattened_name": "a__1.txt"})
+    assert FileMap.load_csv(path) == []  # まだバッファ内
+    writer.write({"original_path": "a/2.txt", "flattened_name": "a__2.txt"})
+    assert len(FileMap.load_csv(path)) == 2  # flush_rows 行ごとに書き出し
+    writer.close()
+    # 書き込み途中で中断された末尾行は読み込み時に無視され、追記時に切り詰められる
+    with open(path, "a", encoding="utf-8", newline="") as f:
+        f.write("a/3.txt,a__")
+    assert [r["flattened_name"] for r in FileMap.load_csv(path)] == ["a__1.txt", "a__2.txt"]
+    with FileMapWriter(path, append=True) as writer:
+        writer.write({"original_path": "a/3.txt", "flattened_name": "a__3.txt"})
+    assert [r["flattened_name"] for r in FileMap.load_csv(path)] == ["a__1.txt", "a__2.txt", "a__3.txt"]
+
+def test_sqlite_filemap_lookup_prefix_and_convert(tmp_path):
+    db_path = str(tmp_path / "filemap.db")
+    with FileMap.open_writer(db_path, ["original_path", "flattened_name", "size"], flush_rows=100) as writer:
+        assert isinstance(writer, SQLiteFileMapWriter)
+        for i in range(1000):
+            writer.write({"original_path": os.path.join(f"d{i % 10}", f"f{i}.txt"),
+                          "flattened_name": f"d{i % 10}__f{i}.txt", "size": str(i)})
+        writer.write({"original_path": "dup.txt", "flattened_name": "d5__f5.txt"})
+        assert not os.path.exists(db_path)  # 閉じるまでは一時ファイルに書き込む
+    index = FileMap.load_index(db_path)
+    assert len(index) == 1001
+    assert index.get_original("d9__f999.txt") == os.path.join("d9", "f999.txt")
+    assert index.get_original("d5__f5.txt") == os.path.join("d5", "f5.txt")  # 先頭の行を優先
+    assert index.get_flattened("dup.txt") == "d5__f5.txt"
+    assert index.find_flat("d1__f1.txt")["size"] == "1"
+    assert index.get_original("missing") is None
+    assert "d1__f1.txt" in index and "missing" not in index
+    assert [r["flattened_name"] for r in index][:2] == ["d0__f0.txt", "d1__f1.txt"]  # 挿入順
+    in_d3 = list(index.iter_prefix("d3"))
+    assert len(in_d3) == 100 and all(r["flattened_name"].startswith("d3__") for r in in_d3)
+    assert list(index.iter_prefix("d")) == []  # d3 などの兄弟は範囲に含めない
+    index.close()
+
+    csv_path = str(tmp_path / "filemap.csv")
+    assert FileMap.convert(db_path, csv_path) == 1001
+    rows = FileMap.load_csv(csv_path)
+    assert rows[0] == {"original_path": os.path.join("d0", "f0.txt"), "flattened_name": "d0__f0.txt", "size": "0"}
+    csv_d3 = FileMap.load_index(csv_path).iter_prefix("d3")
+    assert sorted(r["flattened_name"] for r in csv_d3) == sorted(r["flattened_name"] for r in in_d3)
+    back = str(tmp_path / "back.sqlite")
+    assert FileMap.convert(csv_path, back) == 1001
+    assert FileMap.load_index(back).get_original("d9__f999.txt") == os.path.join("d9", "f999.txt")
+
+
+def test_sqlite_filemap_in_folder_with_uri_characters(tmp_path):
+    # '#'・'%' を含むフォルダでも同じファイルを開く（URI のフラグメント・エスケープとして解釈しない）
+    for name in ("o#1", "o%41"):
+        folder = tmp_path / name
+        folder.mkdir()
+        db_path = str(folder / "filemap.db")
+        with FileMap.open_writer(db_path, ["original_path", "flattened_name"]) as writer:
+            writer.write({"original_path": os.path.join("a", "b.txt"), "flattened_name": "a__b.txt"})
+        index = FileMap.load_index(db_path)
+        assert index.get_original("a__b.txt") == os.path.join("a", "b.txt")
+        index.close()
+        assert sorted(os.listdir(folder)) == ["filemap.db"]
+    assert sorted(os.listdir(tmp_path)) == ["o#1", "o%41"]
+
+
+def test_sqlite_writer_keeps_previous_map_on_error(tmp_path):
+    db_path = str(tmp_path / "filemap.db")
+    with FileMap.open_writer(db_path, ["original_path", "flattened_name"]) as writer:
+        writer.write({"original_path": "old.txt", "flattened_name": "old.txt"})
+    try:
+        with FileMap.open_writer(db_path, ["original_path", "flattened_name"]) as writer:
+            writer.write({"original_path": "new.txt", "flattened_name": "new.txt"})
+            raise RuntimeError("中断")
+    except RuntimeError:
+        pass
+    assert sorted(os.listdir(tmp_path)) == ["filemap.db"]
+    index = FileMap.load_index(db_path)
+    assert len(index) == 1 and "old.txt" in index
+    index.close()
+
+
+def test_index_truthiness_is_cheap(tmp_path):
+    for name in ("filemap.csv", "filemap.db"):
+        path = str(tmp_path / name)
+        with FileMap.open_writer(path, ["original_path", "flattened_name"]) as writer:
+            writer.write({"original_path": "a.txt", "flattened_name": "a.txt"})
+        index = FileMap.load_index(path, lazy=True)
+        assert index
+        index.close()
+        empty = str(tmp_path / ("empty_" + name))
+        with FileMap.open_writer(empty, ["original_path", "flattened_name"]):
+            pass
+        index = FileMap.load_index(empty, lazy=True)
+        assert not index
+        index.close()
+    assert not FileMapIndex([]) and FileMapIndex([{"flattened_name": "a"}])
+
+
+def test_lazy_csv_index_matches_load_csv(tmp_path, monkeypatch):
+    path = str(tmp_path / "filemap.csv")
+    with FileMapWriter(path, ["original_path", "flattened_name", "size"]) as writer:
+        for i in range(500):
+            writer.write({"original_path": f"日本語/f{i}.txt", "flattened_name": f"日本語__f{i}.txt", "size": str(i)})
+        writer.write({"original_path": "a,b/改行\nあり.txt", "flattened_name": 'a,b__"改行"\nあり.txt', "size": "1"})
+        writer.write({"original_path": "last.txt", "flattened_name": "last.txt"})
+    with open(path, "a", encoding="utf-8", newline="") as f:
+        f.write("\r\npartial/tail.txt,partial__")  # 空行と、書き込み途中で中断された末尾行
+    expected = FileMap.load_csv(path)
+    # チャンク境界が行・引用符の途中に来ても同じ結果になる
+    monkeypatch.setattr(LazyCSVFileMapIndex, "CHUNK_SIZE", 64)
+    for background in (True, False):
+        index = LazyCSVFileMapIndex(path, background=background)
+        assert list(index) == expected
+        assert len(index) == 502 and index.ready
+        assert index.get_original('a,b__"改行"\nあり.txt') == "a,b/改行\nあり.txt"
+        assert index.find_flat("日本語__f7.txt") == {"original_path": "日本語/f7.txt", "flattened_name": "日本語__f7.txt", "size": "7"}
+        assert index.get_flattened("last.txt") == "last.txt"
+        assert "partial__" not in index and index.get_original("missing") is None
+        index.close()
+    lazy = FileMap.load_index(path, lazy=True)
+    assert isinstance(lazy, LazyCSVFileMapIndex)
+    assert len(list(lazy.iter_prefix("日本語"))) == 500
+    lazy.close()
+    empty = str(tmp_path / "empty.csv")
+    open(empty, "w").close()
+    assert len(LazyCSVFileMapIndex(empty)) == 0
@@ -0,0 +1,55 @@
+import json
+import threading
+from flattener.instrument import Instrument, LatencyHistogram
+from flattener.engine import FlattenEngine, RestoreEngine
+
+
+def test_latency_histogram_percentiles():
+    hist = LatencyHistogram()
+    for _ in range(90):
+        hist.add(0.000010)   # 10µs → [8, 16) のバケット
+    for _ in range(10):
+        hist.add(0.005)      # 5ms
+    d = hist.to_dict()
+    assert d['count'] == 100 and d['min_seconds'] == 0.00001 and d['max_seconds'] == 0.005
+    assert d['p50_seconds'] == 16e-6 and d['p90_seconds'] == 16e-6 and d['p99_seconds'] == 0.005
+    assert d['buckets_us'] == {'16': 90, '8192': 10}
+
+
+def test_instrument_threads_and_profile(tmp_path):
+    inst = Instrument(profile=True)
+    def work(n):
+        with inst.stage('work'):
+            inst.observe('item', 0.001, 10)
+            inst.count('op')
+        return n * 2
+    threads = [threading.Thread(target=inst.call, args=(work, i)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    inst.error('copy')
+    report = inst.write_report(str(tmp_path / 'r.json'), {'command': 'test'})
+    assert json.loads((tmp_path / 'r.json').read_text(encoding='utf-8')) == report
+    assert report['stages']['work']['calls'] == 4 and report['counters'] == {'op': 4}
+    assert report['throughput']['item']['bytes'] == 40 and report['errors'] == {'copy': 1}
+    assert inst.profile_call(work, 3) == 6
+    assert inst.dump_profile(str(tmp_path / 'p.prof'))
+    assert not Instrument().dump_profile(str(tmp_path / 'none.prof'))
+
+
+def test_engines_report_stages(tmp_path):
+    src, dst, out = tmp_path / 'src', tmp_path / 'dst', tmp_path / 'out'
+    (src / 'a').mkdir(parents=True)
+    for i in range(5):
+        (src / 'a' / f'{i}.txt').write_text('x' * 100)
+    inst = Instrument()
+    FlattenEngine(str(src), str(dst), jobs=2, instrument=inst).run()
+    report = inst.report()
+    assert {'scan', 'copy', 'filemap', 'callback:log'} <= set(report['stages'])
+    assert report['latency']['copy']['count'] == 5 and report['throughput']['copy']['bytes'] == 500
+    assert report['counters']['stat'] == 5
+    engine = RestoreEngine(str(dst), str(out), jobs=1)
+    engine.run()
+    report = engine.instrument.report()
+    assert report['latency']['restore']['count'] == 5 and report['counters']['mkdir'] == 1
@@ -1,11 +1,13 @@
 import os
 from pathlib import Path
-from flattener.logic import DirectoryScanner, flatten_filename
+from flattener.logic import DirectoryScanner, ExcludeFilter, EXCLUDE_PATTERNS, flatten_filename
 
 def test_flatten_filename():
-    assert flatten_filename('dir1/dir2/ファイル 1.txt') == 'dir1_dir2_%E3%83%95%E3%82%A1%E3%82%A4%E3%83%AB%201.txt'
-    assert flatten_filename('a b/c d.txt') == 'a%20b_c%20d.txt'
-    assert flatten_filename('日本語/テスト.txt') == '%E6%97%A5%E6%9C%AC%E8%AA%9E_%E3%83%86%E3%82%B9%E3%83%88.txt'
+    # 日本語・空白はエンコードせず、パス区切りだけを '__' にする
+    assert flatten_filename('dir1/dir2/ファイル 1.txt') == 'dir1__dir2__ファイル 1.txt'
+    assert flatten_filename('a b/c d.txt') == 'a b__c d.txt'
+    assert flatten_filename('日本語/テスト.txt') == '日本語__テスト.txt'
+    assert flatten_filename('a__b/c.txt') == 'a___b__c.txt'
 
 def test_directory_scanner(tmp_path):
     # ディレクトリ構成作成
@@ -20,3 +22,51 @@ def test_directory_scanner(tmp_path):
     assert 'a/b/file1.txt'.replace('/', os.sep) in relpaths
     assert 'a/file2.txt'.replace('/', os.sep) in relpaths
     assert not any('Thumbs.db' in r['relpath'] for r in result)
+
+def test_iter_scan_matches_walk_order(tmp_path):
+    for d in ('x', 'x/y', 'z'):
+        (tmp_path / d).mkdir()
+    for f in ('top.txt', 'x/a.txt', 'x/y/b.dat', 'z/c.txt', 'z/.DS_Store'):
+        (tmp_path / f).write_text(f)
+    scanner = DirectoryScanner(tmp_path)
+    expected = []
+    for dirpath, dirnames, filenames in os.walk(tmp_path):
+        rel_dir = os.path.relpath(dirpath, tmp_path)
+        if rel_dir != '.':
+            expected.append(rel_dir)
+        expected.extend(os.path.join(rel_dir, f) if rel_dir != '.' else f
+                        for f in filenames if not scanner.is_excluded(f))
+    items = list(scanner.iter_scan())
+    assert [r['relpath'] for r in items] == expected
+    b = next(r for r in items if r['name'] == 'b.dat')
+    assert b['size'] == len('x/y/b.dat') and b['ext'] == '.dat'
+    assert b['mtime'] == os.path.getmtime(tmp_path / 'x' / 'y' / 'b.dat')
+
+def test_cached_scan_reuses_result(tmp_path):
+    (tmp_path / 'a.txt').write_text('a')
+    first = DirectoryScanner.cached_scan(tmp_path, refresh=True)
+    (tmp_path / 'b.txt').write_text('b')
+    assert DirectoryScanner.cached_scan(tmp_path) is first
+    refreshed = DirectoryScanner.cached_scan(tmp_path, refresh=True)
+    assert sorted(r['relpath'] for r in refreshed) == ['a.txt', 'b.txt']
+    # フラット化の後は消去する（次の cached_scan は追加されたファイルを含めて走査し直す）
+    DirectoryScanner.clear_cache()
+    (tmp_path / 'c.txt').write_text('c')
+    assert len(DirectoryScanner.cached_scan(tmp_path)) == 3
+    DirectoryScanner.clear_cache()
+
+
+def test_exclude_filter_lines_and_dir_pruning(tmp_path):
+    f = ExcludeFilter.from_lines(['.TMP', 'log', '*.bak', 'node_modules/', ''], EXCLUDE_PATTERNS)
+    assert f.exts == {'.tmp', '.log'}
+    assert f.excludes_ext('.Log') and not f.excludes_ext('')
+    assert f.is_excluded('old.BAK') and f.is_excluded('x.tmp') and f.is_excluded('Thumbs.db')
+    assert not f.is_excluded('keep.txt') and not f.excludes_name('bak.txt')
+    assert f.prunes_dir('node_modules') and not f.prunes_dir('src')
+    for d in ('src', 'node_modules/pkg'):
+        (tmp_path / d).mkdir(parents=True)
+    for name in ('src/a.txt', 'src/a.bak', 'node_modules/pkg/index.js', '~$doc.docx'):
+        (tmp_path / name).write_text('x')
+    relpaths = [r['relpath'] for r in DirectoryScanner(tmp_path, exclude_filter=f).scan()]
+    # フォルダglobに一致したフォルダは中を走査しない・ファイル名globは結果に含めない
+    assert relpaths == ['src', os.path.join('src', 'a.txt')]
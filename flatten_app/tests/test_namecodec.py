@@ -0,0 +1,30 @@
+import os
+from flattener.namecodec import NameCodec, FLAT_ESCAPE_SEQ
+from flattener.logic import flatten_filename, restore_flattened_filename
+
+
+def test_encode_decode_single_pass():
+    codec = NameCodec()
+    assert codec.encode('dir1/dir2/ファイル 1.txt') == 'dir1__dir2__ファイル 1.txt'
+    assert codec.encode('a\\b_c.txt') == 'a__b_c.txt'
+    assert codec.encode('x__y/z___w') == 'x___y__z' + FLAT_ESCAPE_SEQ + 'w'
+    assert codec.encode('q/x' + FLAT_ESCAPE_SEQ) == 'q__x' + FLAT_ESCAPE_SEQ + '_ESC'
+    for relpath in ('dir1/dir2/ファイル 1.txt', 'x__y/z___w', 'q/x' + FLAT_ESCAPE_SEQ, 'a_b/c', 'plain.txt'):
+        expected = relpath.replace('/', os.sep)
+        assert codec.decode(codec.encode(relpath)) == expected
+        assert restore_flattened_filename(flatten_filename(relpath)) == expected
+    assert codec.decode_many(codec.encode_many(['a/b', 'c__d'])) == [os.path.join('a', 'b'), 'c__d']
+
+
+def test_verify_roundtrip_reports_ambiguous_names_and_cache_is_bounded():
+    codec = NameCodec(cache_size=2)
+    # 'a_/b' は 'a__b' と同じフラット名になり、ファイル名からは復元できない
+    assert codec.verify_roundtrip(['a__b', 'a_/b', 'ok/名前.txt']) == [('a_/b', 'a___b', 'a__b')]
+    for name in ('a', 'b', 'c', 'a'):
+        codec.encode(name)
+    assert codec.encode.cache_info().currsize == 2
+    codec.cache_clear()
+    assert codec.encode.cache_info().currsize == 0
+    custom = NameCodec('--', '---', '-ESC-', cache_size=0)
+    assert custom.encode('a-b/c--d') == 'a-b--c---d'
+    assert custom.decode('a-b--c---d') == os.path.join('a-b', 'c--d')
@@ -0,0 +1,25 @@
+import os
+from flattener.pathindex import PathPrefixIndex
+from flattener.logic import DirectoryScanner
+
+
+def test_prefix_index_matches_subtrees():
+    index = PathPrefixIndex(['a/b', os.path.join('x', 'y', 'z'), 'a/b'])
+    assert len(index) == 2
+    assert index.find(os.path.join('a', 'b', 'c.txt')) == 'a/b'
+    assert os.path.join('a', 'b') in index
+    assert 'a' not in index
+    # 名前の前方一致ではなくフォルダ単位で判定する
+    assert os.path.join('a', 'bc', 'd.txt') not in index
+    assert os.path.join('x', 'y', 'z', 'deep', 'f') in index
+    assert sorted(index) == sorted(['a/b', os.path.join('x', 'y', 'z')])
+    assert 'anything' not in PathPrefixIndex()
+
+
+def test_scanner_prunes_listed_folders(tmp_path):
+    for d in ('keep', 'zipme/inner'):
+        (tmp_path / d).mkdir(parents=True)
+    (tmp_path / 'keep' / 'a.txt').write_text('a')
+    (tmp_path / 'zipme' / 'inner' / 'b.txt').write_text('b')
+    items = DirectoryScanner(tmp_path, prune_paths=['zipme']).scan()
+    assert sorted(r['relpath'] for r in items) == ['keep', os.path.join('keep', 'a.txt'), 'zipme']
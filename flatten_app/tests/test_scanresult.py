@@ -0,0 +1,32 @@
+import os
+import pytest
+from flattener.logic import DirectoryScanner
+from flattener.scanresult import ScanResult
+from flattener.aggregate import DirectoryAggregate
+
+
+def test_scan_result_matches_dict_scan(tmp_path):
+    for d in ('a/b', 'c'):
+        (tmp_path / d).mkdir(parents=True)
+    for f in ('top.TXT', 'a/x.dat', 'a/b/y.txt', 'c/z'):
+        (tmp_path / f).write_text(f)
+    scanner = DirectoryScanner(tmp_path)
+    result = scanner.scan()
+    assert isinstance(result, ScanResult)
+    assert list(result) == list(scanner.iter_scan())
+    assert len(result) == 7 and result[-1] == list(result)[-1]
+    assert result.dirs[result.parent[len(result) - 1]] in ('a', os.path.join('a', 'b'), 'c', '')
+    # スライスは list of dict と同じ結果（範囲外のインデックスは IndexError）
+    as_list = list(result)
+    assert result[1:4] == as_list[1:4] and result[::-2] == as_list[::-2] and result[5:100] == as_list[5:]
+    with pytest.raises(IndexError):
+        result[-len(result) - 1]
+    # list of dict からも同じ結果を作れる（更新時刻なしは None のまま）
+    items = list(result) + [{'relpath': os.path.join('new', 'n.txt'), 'is_dir': False, 'size': 3, 'mtime': None}]
+    again = ScanResult.from_items(items)
+    assert list(again)[:-1] == list(result)
+    assert again[-1] == {'relpath': os.path.join('new', 'n.txt'), 'is_dir': False, 'name': 'n.txt',
+                         'ext': '.txt', 'size': 3, 'mtime': None}
+    # 列から直接集計しても dict から集計しても同じ
+    assert DirectoryAggregate(again).size_of('') == DirectoryAggregate(items).size_of('') == sum(
+        len(f) for f in ('top.TXT', 'a/x.dat', 'a/b/y.txt', 'c/z')) + 3
@@ -0,0 +1,52 @@
+import threading
+import time
+import pytest
+from flattener.scheduler import IOScheduler, ThreadScheduler, lane_for_size, open_scheduler, SMALL_FILE_SIZE
+
+
+def test_lane_for_size():
+    assert lane_for_size(0) == 'meta'
+    assert lane_for_size(str(SMALL_FILE_SIZE - 1)) == 'meta'
+    assert lane_for_size(SMALL_FILE_SIZE) == 'data'
+    assert lane_for_size(None) == 'data' and lane_for_size('') == 'data'
+
+
+def test_lanes_have_separate_limits():
+    def work(n):
+        time.sleep(0.01)
+        return n * 2
+    with IOScheduler(meta_jobs=6, data_jobs=2) as sched:
+        futures = [sched.submit('meta' if i % 2 else 'data', work, i) for i in range(40)]
+        assert [f.result() for f in futures] == [i * 2 for i in range(40)]
+    assert sched.peak == {'meta': 6, 'data': 2}
+
+
+def test_submit_applies_backpressure_and_propagates_errors():
+    gate = threading.Event()
+    submitted = []
+    def fail():
+        raise OSError('boom')
+    with IOScheduler(meta_jobs=2, data_jobs=1, max_pending=3) as sched:
+        def producer():
+            for i in range(5):
+                submitted.append(sched.submit('meta', gate.wait))
+        t = threading.Thread(target=producer)
+        t.start()
+        time.sleep(0.1)
+        assert len(submitted) == 3  # 未完了が上限に達したので、4件目の submit() は空きを待つ
+        gate.set()
+        t.join()
+        assert len(submitted) == 5
+        with pytest.raises(OSError):
+            sched.submit('data', fail).result()
+        with pytest.raises(ValueError):
+            sched.submit('disk', fail)
+
+
+def test_open_scheduler_modes():
+    assert isinstance(open_scheduler('threads', 4), ThreadScheduler)
+    assert isinstance(open_scheduler('asyncio', 4), IOScheduler)
+    with pytest.raises(ValueError):
+        open_scheduler('fibers', 4)
+    with open_scheduler('threads', 2) as sched:
+        assert sched.submit('data', sum, [1, 2]).result() == 3 and sched.window == 8
@@ -0,0 +1,90 @@
+import os
+import pytest
+from flattener.transfer import FileTransfer, TRANSFER_METHODS
+
+
+@pytest.mark.parametrize('method', TRANSFER_METHODS)
+def test_transfer_methods_copy_content_and_mtime(tmp_path, method):
+    src = tmp_path / 'src.bin'
+    src.write_bytes(os.urandom(300000))
+    os.utime(src, (1600000000, 1600000000))
+    dst = tmp_path / 'dst.bin'
+    dst.write_text('old')  # 既存ファイルは置き換えられる
+    ft = FileTransfer(method)
+    used = ft.transfer(str(src), str(dst))
+    assert used in TRANSFER_METHODS
+    assert ft.stats == {used: 1}
+    assert dst.read_bytes() == src.read_bytes()
+    assert int(os.path.getmtime(dst)) == 1600000000
+
+
+def test_hardlink_output_is_replaced_not_overwritten(tmp_path):
+    src = tmp_path / 'src.txt'
+    src.write_text('original')
+    dst = tmp_path / 'dst.txt'
+    FileTransfer('hardlink').transfer(str(src), str(dst))
+    if os.stat(src).st_ino == os.stat(dst).st_ino:
+        # 前回ハードリンクで出力したファイルへ通常コピーしても入力は書き換わらない
+        other = tmp_path / 'other.txt'
+        other.write_text('other')
+        FileTransfer('copy').transfer(str(other), str(dst))
+        assert src.read_text() == 'original'
+        assert dst.read_text() == 'other'
+
+
+@pytest.mark.parametrize('method', TRANSFER_METHODS)
+def test_same_file_is_refused_not_deleted(tmp_path, method):
+    import shutil
+    src = tmp_path / 'top.txt'
+    src.write_text('original')
+    ft = FileTransfer(method)
+    with pytest.raises(shutil.SameFileError):
+        ft.transfer(str(src), str(src))
+    with pytest.raises(shutil.SameFileError):
+        ft.transfer_with_digest(str(src), str(tmp_path / '.' / 'top.txt'))
+    assert src.read_text() == 'original'
+
+
+def test_kernel_fallback_does_not_count_bytes_twice(tmp_path, monkeypatch):
+    import errno
+    from flattener import transfer
+    src = tmp_path / 'src.bin'
+    src.write_bytes(os.urandom(3 * 1024))
+    if not hasattr(os, 'copy_file_range'):
+        pytest.skip('copy_file_range がないOS')
+    real_copy_range = os.copy_file_range
+    calls = []
+
+    def flaky_copy_range(infd, outfd, count, offset_src, offset_dst):
+        # 1回目は途中まで成功し、2回目で未対応エラー（カーネル内コピーを諦めて通常コピーへ）
+        calls.append(offset_src)
+        if len(calls) > 1:
+            raise OSError(errno.EXDEV, 'cross-device')
+        return real_copy_range(infd, outfd, count, offset_src, offset_dst)
+
+    monkeypatch.setattr(os, 'copy_file_range', flaky_copy_range)
+    monkeypatch.setattr(transfer, 'KERNEL_COPY_CHUNK', 1024)
+    reported = []
+    dst = tmp_path / 'dst.bin'
+    used = FileTransfer('kernel').transfer(str(src), str(dst), reported.append)
+    assert used == 'copy'
+    assert sum(reported) == 3 * 1024
+    assert dst.read_bytes() == src.read_bytes()
+
+
+def test_unknown_transfer_method():
+    with pytest.raises(ValueError):
+        FileTransfer('teleport')
+
+
+@pytest.mark.parametrize('method', ['auto', 'hardlink'])
+def test_transfer_with_digest_hashes_on_the_copy_read(tmp_path, method):
+    import hashlib
+    src = tmp_path / 'src.bin'
+    data = os.urandom(2 * 1024 * 1024 + 7)
+    src.write_bytes(data)
+    dst = tmp_path / 'dst.bin'
+    ft = FileTransfer(method)
+    assert ft.transfer_with_digest(str(src), str(dst)) == hashlib.sha256(data).hexdigest()
+    assert dst.read_bytes() == data
+    assert ft.stats == {'hardlink' if method == 'hardlink' else 'hashcopy': 1}
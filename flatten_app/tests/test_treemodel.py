@@ -0,0 +1,45 @@
+import os
+from flattener.logic import DirectoryScanner
+from flattener.treemodel import ScanTreeModel, MARK_ON, MARK_OFF
+
+
+def _model(tmp_path):
+    for d in ('a/b', 'c'):
+        (tmp_path / d).mkdir(parents=True)
+    (tmp_path / 'a' / 'b' / 'doc.pdf').write_text('12345')
+    (tmp_path / 'a' / 'b' / 'n.txt').write_text('12')
+    (tmp_path / 'a' / 'x.txt').write_text('123')
+    (tmp_path / 'c' / 'y.txt').write_text('1')
+    return ScanTreeModel(DirectoryScanner(tmp_path).scan(), ['pdf'])
+
+
+def test_tree_model_children_and_sizes(tmp_path):
+    model = _model(tmp_path)
+    ab = os.path.join('a', 'b')
+    assert sorted(i['relpath'] for i in model.children()) == ['a', 'c']
+    assert sorted(i['name'] for i in model.children('a')) == ['b', 'x.txt']
+    assert [model.dir_size(d) for d in ('a', ab, 'c', '')] == [10, 7, 1, 11]
+    assert [model.agg.files_in(d) for d in ('a', ab, 'c')] == [1, 2, 1]
+    assert model.agg.count_of('a') == 3
+    assert model.zip_targets == {ab}
+    assert model.has_children('a') and not model.has_children(os.path.join('a', 'x.txt'))
+    b = next(i for i in model.children('a') if i['is_dir'])
+    assert model.row_values(b) == ('DIR', ab, '', '7', MARK_ON, MARK_OFF)
+    assert model.toggle_zip(ab) is False and model.zip_mark(ab) == MARK_OFF
+
+
+def test_tree_model_exclude_covers_subtree(tmp_path):
+    model = _model(tmp_path)
+    ab, x = os.path.join('a', 'b'), os.path.join('a', 'x.txt')
+    assert model.toggle_excluded('a') is True
+    assert model.exclude_targets == {'a'}
+    assert model.is_excluded(os.path.join(ab, 'n.txt'))
+    # 祖先の除外で除外されている要素をOFFにすると、それ以外の兄弟だけが除外のまま残る
+    assert model.toggle_excluded(os.path.join(ab, 'n.txt')) is False
+    assert model.exclude_targets == {x, os.path.join(ab, 'doc.pdf')}
+    assert not model.is_excluded('a') and model.is_excluded(x)
+    # 上位をONにすると個別指定はまとめられる
+    model.set_excluded('a', True)
+    assert model.exclude_targets == {'a'}
+    model.set_excluded('a', False)
+    assert model.exclude_targets == set()
@@ -0,0 +1,42 @@
+import os
+import zipfile
+from flattener.zipper import ZipBuilder, build_zip, compression_for
+
+
+def _make_dirs(root):
+    for name in ('d1', 'd2'):
+        (root / name / 'sub').mkdir(parents=True)
+        (root / name / 'data.txt').write_text('x' * 10000)
+        (root / name / 'sub' / 'img.jpg').write_bytes(os.urandom(2000))
+
+
+def test_compression_for():
+    assert compression_for('.JPG') == (zipfile.ZIP_STORED, None)
+    assert compression_for('.txt') == (zipfile.ZIP_DEFLATED, 6)
+    assert compression_for('.txt', ext_levels={'.txt': 9}) == (zipfile.ZIP_DEFLATED, 9)
+    assert compression_for('.dat', ext_levels={'.dat': 0}) == (zipfile.ZIP_STORED, None)
+
+
+def test_build_zip_matches_make_archive_layout(tmp_path):
+    _make_dirs(tmp_path)
+    out = str(tmp_path / 'd1.zip')
+    assert build_zip(str(tmp_path / 'd1'), out, chunk_size=1024) == (2, 12000)
+    assert not os.path.exists(out + '.part')
+    with zipfile.ZipFile(out) as zf:
+        infos = {i.filename: i for i in zf.infolist()}
+        assert set(infos) == {'sub/', 'data.txt', 'sub/img.jpg'}
+        assert infos['data.txt'].compress_type == zipfile.ZIP_DEFLATED
+        assert infos['sub/img.jpg'].compress_type == zipfile.ZIP_STORED
+        assert zf.read('data.txt') == b'x' * 10000
+        assert zf.testzip() is None
+
+
+def test_zip_builder_parallel_keeps_order(tmp_path):
+    _make_dirs(tmp_path)
+    tasks = [(str(tmp_path / d), str(tmp_path / (d + '.zip'))) for d in ('d1', 'd2')]
+    tasks.append((str(tmp_path / 'missing'), str(tmp_path / 'missing.zip')))
+    for executor in ('thread', 'process'):
+        results = list(ZipBuilder(2, executor=executor).build_all(tasks))
+        assert [r[0] for r in results] == [0, 1, 2]
+        assert results[0][1] == (2, 12000) and results[0][2] is None
+        assert zipfile.is_zipfile(tasks[1][1])